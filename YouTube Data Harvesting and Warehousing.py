@@ -1,26 +1,422 @@
-import psycopg2
-import pandas as pd
-import streamlit as st
-from googleapiclient.discovery import build
-import isodate
-from datetime import datetime
 import time
+STARTUP_STARTED = time.perf_counter()
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from psycopg2 import sql
+from googleapiclient.errors import HttpError
+from datetime import datetime, timedelta
+import importlib
+import json
+import sys
+import argparse
+import logging
+import functools
+import sqlite3
+import gzip
+import os
+import uuid
+import hashlib
+import subprocess
+import random
+import socket
+import multiprocessing
+import threading
+import queue
+import heapq
+import itertools
+import bisect
+import contextlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Headless stand-in for the few Streamlit calls the harvest code makes, so the
+# CLI and workers never import Streamlit
+class HeadlessStreamlit:
+    def __init__(self):
+        self.logger = logging.getLogger('youtube_harvester')
+
+    def error(self, message):
+        self.logger.error(message)
+
+    def warning(self, message):
+        self.logger.warning(message)
+
+    def info(self, message):
+        self.logger.info(message)
+
+    def success(self, message):
+        self.logger.info(message)
+
+    def cache_resource(self, func):
+        return functools.lru_cache(maxsize=None)(func)
+
+# `streamlit run` has already imported Streamlit before executing this script
+if 'streamlit' in sys.modules:
+    import streamlit as st
+else:
+    st = HeadlessStreamlit()
+
+# Heavy libraries load on first use, so the CLI, the workers and dashboard
+# reruns only pay for the ones they actually touch
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = LazyModule('pandas')
+httplib2 = LazyModule('httplib2')
 
 # YouTube API setup
 API_KEY = 'API'  # Replace with your API key
-youtube = build('youtube', 'v3', developerKey=API_KEY)
+
+# Harvests rotate across every key here; each key has its own daily quota
+API_KEYS = [API_KEY]
+
+# Clients are built from the discovery document bundled with
+# google-api-python-client, or from a saved copy at this path, never fetched
+API_DISCOVERY_PATH = None
+
+# Backoff for a key that answered 429/rateLimitExceeded, doubled per repeat
+API_KEY_BACKOFF_SECONDS = 30
+API_KEY_MAX_BACKOFF_SECONDS = 15 * 60
+API_KEY_THROTTLE_RETRIES = 5
+
+# Transient API failures (5xx, timeouts, dropped connections) are retried with
+# jittered exponential backoff. Retries across a harvest are capped at a share
+# of its requests, and a run of consecutive failures opens a circuit breaker
+# that pauses every request until the API answers again.
+API_TIMEOUT_SECONDS = 30
+API_RETRY_ATTEMPTS = 5
+API_RETRY_BASE_SECONDS = 1
+API_RETRY_MAX_SECONDS = 60
+API_RETRY_BUDGET_RATIO = 0.2
+API_RETRY_BUDGET_MIN = 20
+API_BREAKER_THRESHOLD = 5
+API_BREAKER_RESET_SECONDS = 30
+
+# Harvest engine settings
+HARVEST_WORKERS = 8
+BULK_FLUSH_ROWS = 5000
+BULK_FLUSH_SECONDS = 5
+API_REQUESTS_PER_SECOND = 10
+API_DAILY_QUOTA = 10000
+# Each key's daily quota is counted in Postgres so every process and machine
+# using the key shares it; units are reserved from the database in blocks
+API_SHARED_QUOTA = True
+API_QUOTA_RESERVE_UNITS = 100
+
+# Comment harvest limits (None means no limit)
+MAX_COMMENTS_PER_VIDEO = 1000
+INCLUDE_COMMENT_REPLIES = False
+
+# Incremental sync: statistics of already stored videos refresh on this cadence
+STATS_REFRESH_SECONDS = 7 * 24 * 3600
+# Statistics history keeps every changed snapshot for a month, then the last
+# snapshot per day for a year, then the last per week
+HISTORY_DOWNSAMPLE_TIERS = ((30 * 86400, 'day'), (365 * 86400, 'week'))
+HISTORY_DOWNSAMPLE_INTERVAL_SECONDS = 24 * 3600
+
+# Background refresh scheduler: spends at most REFRESH_DAILY_QUOTA units a day
+# keeping stored channels and videos fresh, leaving the rest for manual harvests
+REFRESH_SCHEDULER_ENABLED = False
+# None means half of API_DAILY_QUOTA
+REFRESH_DAILY_QUOTA = None
+REFRESH_INTERVAL_SECONDS = 15 * 60
+# Nothing refreshed more recently than this is considered again
+REFRESH_MIN_AGE_SECONDS = 3600
+# Staleness counts up to this age; anything older is simply "very stale"
+REFRESH_MAX_AGE_HOURS = 30 * 24
+# Upload frequency is measured over this window, view velocity over the shorter one
+REFRESH_UPLOAD_WINDOW_DAYS = 90
+REFRESH_VELOCITY_WINDOW_DAYS = 7
+# An upload the warehouse has not seen yet is worth this many missed views
+REFRESH_UPLOAD_VALUE = 1000
+# Hottest stale videos considered per tick
+REFRESH_MAX_VIDEOS = 5000
+
+# API response cache: entries are served without revalidation while younger than
+# their resource's TTL, then revalidated with If-None-Match
+API_CACHE_PATH = 'youtube_api_cache.sqlite'
+API_CACHE_MAX_BYTES = 512 * 1024 * 1024
+API_CACHE_TTL_SECONDS = {
+    'channels': 3600,
+    'playlistItems': 600,
+    'videos': 3600,
+    'commentThreads': 600,
+    'comments': 600
+}
+
+# Quota units charged per API method
+API_QUOTA_COSTS = {
+    'channels.list': 1,
+    'playlistItems.list': 1,
+    'videos.list': 1,
+    'commentThreads.list': 1,
+    'comments.list': 1
+}
+
+# Database settings
+DB_CONFIG = {
+    'host': "localhost",
+    'user': "postgres",
+    'password': "2345",
+    'database': "data",
+    'port': "5432"
+}
+# 'postgres' is the shared multi-user warehouse; 'duckdb' keeps everything in
+# one local file for single-analyst use and CI, without a database server
+STORAGE_BACKEND = 'postgres'
+DUCKDB_PATH = 'youtube_warehouse.duckdb'
+STORE_SYNC_CHUNK_ROWS = 50000
+
+DB_POOL_MIN = 1
+DB_POOL_MAX = 20
+DB_POOL_TIMEOUT = 30
+DB_HEALTH_CHECK = True
+# Connections a checkout may discard for failing the health check before it
+# gives up (None: one per pool slot plus a fresh one, enough to flush out
+# every connection a database restart left dead)
+DB_HEALTH_CHECK_ATTEMPTS = None
+
+# Harvest pipeline queue sizes between stages, and how often it reports progress
+PIPELINE_QUEUE_SIZES = {'playlist': 64, 'videos': 16, 'comments': 256, 'writer': 64}
+PIPELINE_REPORT_SECONDS = 0.5
+
+# Harvest jobs
+HARVEST_JOB_POLL_SECONDS = 5
+# A running job whose heartbeat is older than this is taken over and resumed
+HARVEST_JOB_STALE_SECONDS = 300
+# A job taken over this many times is failed instead of being claimed again
+HARVEST_JOB_MAX_ATTEMPTS = 5
+# Suggested video batch size for sharded harvests of large channels
+SHARD_VIDEOS_PER_UNIT = 500
+# Job worker threads in each dashboard server, so the units of one sharded
+# submission harvest side by side even without separate worker processes
+DASHBOARD_JOB_WORKERS = 4
+
+# Analytics and statistics history
+ANALYTICS_TOP_N = 10
+# Months of history partitions created ahead of the one being written
+HISTORY_PARTITIONS_AHEAD = 2
+# How long partition DDL may wait for writers in other processes
+HISTORY_PARTITION_LOCK_TIMEOUT = '5s'
+
+# Dashboard table browser and search
+BROWSER_PAGE_SIZE = 100
+BROWSER_TEXT_PREVIEW = 120
+SEARCH_PAGE_SIZE = 20
+# Very common terms rank only this many of their newest matches, which keeps
+# them as fast as rare ones
+SEARCH_MAX_CANDIDATES = 10000
+
+# Streaming exports; larger files stay on disk instead of being offered
+# through the browser
+EXPORT_DIR = 'exports'
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_WORKERS = 2
+EXPORT_DOWNLOAD_MAX_BYTES = 200 * 1024 * 1024
+
+# Channels harvested per engine run by the CLI
+CLI_CHANNEL_CHUNK = 50
+
+# Offline benchmarks; a relative change beyond BENCHMARK_TOLERANCE against the
+# previous comparable run counts as a regression
+BENCHMARK_DATABASE = 'youtube_bench'
+BENCHMARK_DUCKDB_PATH = 'youtube_bench.duckdb'
+BENCHMARK_RESULTS_PATH = os.path.join('benchmarks', 'results.jsonl')
+BENCHMARK_TOLERANCE = 0.2
+
+# Every setting above can be overridden without editing the script: first from
+# a JSON file (HARVESTER_CONFIG, by default harvester_config.json next to the
+# script), then from HARVESTER_<SETTING> environment variables. Environment
+# values are read by the type of the setting: numbers may have a fraction,
+# lists are comma-separated or a JSON array, and dicts are JSON merged into the
+# default (HARVESTER_DB_CONFIG='{"host": "db"}'). Unknown names and values that
+# do not parse stop the script with the name of the offending setting.
+CONFIG_ENV_PREFIX = 'HARVESTER_'
+CONFIG_PATH = os.environ.get(
+    'HARVESTER_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'harvester_config.json')
+)
+
+CONFIG_SETTINGS = {
+    name: value for name, value in globals().items()
+    if name.isupper() and name != 'STARTUP_STARTED'
+}
+
+def parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def parse_setting(value, default):
+    if isinstance(default, bool):
+        flag = value.strip().lower()
+        if flag not in ('1', 'true', 'yes', 'on', '0', 'false', 'no', 'off'):
+            raise ValueError("expected true or false")
+        return flag in ('1', 'true', 'yes', 'on')
+    if isinstance(default, (int, float)):
+        return parse_number(value)
+    if isinstance(default, (list, tuple)):
+        if value.lstrip().startswith('['):
+            return json.loads(value)
+        return [item.strip() for item in value.split(',') if item.strip()]
+    if isinstance(default, dict):
+        return {**default, **json.loads(value)}
+    if default is None:
+        # Optional settings take a number or JSON value, or else the plain text
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def load_config(settings, path=CONFIG_PATH, environ=os.environ):
+    overrides = {}
+    if path and os.path.exists(path):
+        with open(path) as config_file:
+            for name, value in json.load(config_file).items():
+                if name not in settings:
+                    raise ValueError(f"Unknown setting {name} in {path}")
+                default = settings[name]
+                overrides[name] = {**default, **value} if isinstance(default, dict) else value
+    for key, value in environ.items():
+        name = key[len(CONFIG_ENV_PREFIX):]
+        if not key.startswith(CONFIG_ENV_PREFIX) or key == 'HARVESTER_CONFIG':
+            continue
+        if name not in settings:
+            raise ValueError(f"Unknown setting in environment variable {key}")
+        try:
+            overrides[name] = parse_setting(value, overrides.get(name, settings[name]))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid value {value!r} for {key}: {e}") from None
+    # A single configured key stands in for the key list unless that is set too
+    if 'API_KEY' in overrides and 'API_KEYS' not in overrides:
+        overrides['API_KEYS'] = [overrides['API_KEY']]
+    return overrides
+
+globals().update(load_config(CONFIG_SETTINGS))
+
+# Settings derived from others follow their overrides
+if REFRESH_DAILY_QUOTA is None:
+    REFRESH_DAILY_QUOTA = API_DAILY_QUOTA // 2
+
+# Connection pool that blocks when exhausted and counts connection reuse
+class MonitoredConnectionPool(ThreadedConnectionPool):
+    def __init__(self, minconn, maxconn, health_check=DB_HEALTH_CHECK, timeout=DB_POOL_TIMEOUT,
+                 health_check_attempts=DB_HEALTH_CHECK_ATTEMPTS, **kwargs):
+        self.metrics = {
+            'checkouts': 0,
+            'reused': 0,
+            'connections_created': 0,
+            'health_check_failures': 0
+        }
+        self.metrics_lock = threading.Lock()
+        self.local = threading.local()
+        self.health_check = health_check
+        self.health_check_attempts = health_check_attempts or maxconn + 1
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self.local.created = True
+        with self.metrics_lock:
+            self.metrics['connections_created'] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        if not self.health_check:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def checkout(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolError("Timed out waiting for a database connection")
+        try:
+            self.local.created = False
+            for _ in range(self.health_check_attempts):
+                conn = self.getconn()
+                if self._is_healthy(conn):
+                    break
+                with self.metrics_lock:
+                    self.metrics['health_check_failures'] += 1
+                self.putconn(conn, close=True)
+            else:
+                raise PoolError(
+                    f"No healthy database connection after {self.health_check_attempts} attempts"
+                )
+        except Exception:
+            self.slots.release()
+            raise
+
+        with self.metrics_lock:
+            self.metrics['checkouts'] += 1
+            if not self.local.created:
+                self.metrics['reused'] += 1
+        return conn
+
+    def checkin(self, conn):
+        try:
+            self.putconn(conn, close=bool(conn.closed))
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        with self.metrics_lock:
+            stats = dict(self.metrics)
+        stats['idle'] = len(self._pool)
+        stats['in_use'] = len(self._used)
+        stats['max'] = self.maxconn
+        return stats
+
+# Hands a pooled connection back to the pool on close()
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.checkin(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Shared by every Streamlit session and harvest thread in the process
+@st.cache_resource
+def get_db_pool():
+    return MonitoredConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
 
 # Database connection function
 def get_db_connection():
     try:
-        conn = psycopg2.connect(
-            host="localhost",
-            user="postgres",
-            password="2345",
-            database="data",
-            port="5432"
-        )
-        return conn
+        pool = get_db_pool()
+        return PooledConnection(pool, pool.checkout())
     except psycopg2.Error as err:
         st.error(f"Error connecting to PostgreSQL: {err}")
         return None
@@ -32,7 +428,14 @@ def delete_table_data(table_name):
     
     try:
         cursor = conn.cursor()
+        if table_name == 'channels':
+            cursor.execute("DELETE FROM channel_sync_state")
+        if table_name in HISTORY_TABLES:
+            cursor.execute(f"DELETE FROM {HISTORY_TABLES[table_name][0]}")
         cursor.execute(f"DELETE FROM {table_name}")
+        # Comments do not feed any summary
+        if table_name != 'comments':
+            refresh_summarized_channels(cursor)
         conn.commit()
         return True
     except Exception as e:
@@ -51,7 +454,12 @@ def delete_all_data():
         # Delete in correct order due to foreign key constraints
         cursor.execute("DELETE FROM comments")
         cursor.execute("DELETE FROM videos")
+        cursor.execute("DELETE FROM channel_sync_state")
         cursor.execute("DELETE FROM channels")
+        cursor.execute("DELETE FROM video_stats_history")
+        cursor.execute("DELETE FROM channel_stats_history")
+        cursor.execute("DELETE FROM refresh_state")
+        refresh_summarized_channels(cursor)
         conn.commit()
         return True
     except Exception as e:
@@ -60,6 +468,237 @@ def delete_all_data():
     finally:
         conn.close()
 
+# Harvest Metrics
+# Upper bounds in seconds, shared by every latency histogram
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # Upper bound of the bucket holding the q-th observation
+    def quantile(self, q):
+        if not self.count:
+            return None
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+# Counters, latency histograms and progress of the running harvest, shared by
+# the engine, the API client wrappers and the bulk writer
+class HarvestMetrics:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.started_at = None
+        self.videos_done = 0
+        self.videos_total = 0
+        self.counters_at_start = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - started, **labels)
+
+    # A counter's values since the current harvest started, keyed by one label
+    def _since_start(self, name, label):
+        return {
+            dict(labels)[label]: value - self.counters_at_start.get((counter, labels), 0)
+            for (counter, labels), value in self.counters.items()
+            if counter == name
+        }
+
+    def start_harvest(self):
+        with self.lock:
+            self.started_at = self.clock()
+            self.videos_done = 0
+            self.videos_total = 0
+            self.counters_at_start = dict(self.counters)
+
+    def set_progress(self, videos_done, videos_total):
+        with self.lock:
+            self.videos_done = videos_done
+            self.videos_total = videos_total
+
+    def progress(self):
+        with self.lock:
+            if self.started_at is None:
+                return {}
+            elapsed = self.clock() - self.started_at
+            rate = self.videos_done / elapsed if elapsed else 0.0
+            remaining = self.videos_total - self.videos_done
+            rows = self._since_start('harvest_rows_written_total', 'table')
+            return {
+                'elapsed_seconds': round(elapsed, 1),
+                'videos_done': self.videos_done,
+                'videos_total': self.videos_total,
+                'videos_per_second': round(rate, 2),
+                'eta_seconds': round(remaining / rate, 1) if rate else None,
+                'rows_per_second': {
+                    table: round(count / elapsed, 1) if elapsed else 0.0
+                    for table, count in rows.items()
+                }
+            }
+
+    # Per pipeline stage: items handled, time spent working and time spent
+    # waiting for room in the next stage's queue
+    def stages(self):
+        with self.lock:
+            if self.started_at is None:
+                return {}
+            elapsed = self.clock() - self.started_at
+            items = self._since_start('harvest_stage_items_total', 'stage')
+            busy = self._since_start('harvest_stage_busy_seconds_total', 'stage')
+            blocked = self._since_start('harvest_stage_blocked_seconds_total', 'stage')
+            depth = {
+                dict(labels)['stage']: value
+                for (name, labels), value in self.gauges.items()
+                if name == 'harvest_stage_queue_depth'
+            }
+            return {
+                stage: {
+                    'items': count,
+                    'items_per_second': round(count / elapsed, 2) if elapsed else 0.0,
+                    'active_seconds': round(busy.get(stage, 0) - blocked.get(stage, 0), 2),
+                    'blocked_seconds': round(blocked.get(stage, 0), 2),
+                    'queue_depth': depth.get(stage, 0)
+                }
+                for stage, count in items.items()
+            }
+
+    def snapshot(self):
+        with self.lock:
+            counters = {}
+            for (name, labels), value in self.counters.items():
+                counters.setdefault(name, {})[metric_label_text(labels)] = value
+            latency = {}
+            for (name, labels), histogram in self.histograms.items():
+                latency.setdefault(name, {})[metric_label_text(labels)] = {
+                    'count': histogram.count,
+                    'mean': round(histogram.sum / histogram.count, 4),
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95)
+                }
+        return {'progress': self.progress(), 'stages': self.stages(), 'counters': counters, 'latency': latency}
+
+    # Prometheus text exposition format
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{metric_label_text(labels, braces=True)} {value}")
+        for (name, labels), value in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{metric_label_text(labels, braces=True)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                bucket_labels = labels + (('le', str(bound)),)
+                lines.append(f"{name}_bucket{metric_label_text(bucket_labels, braces=True)} {cumulative}")
+            lines.append(f"{name}_sum{metric_label_text(labels, braces=True)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{metric_label_text(labels, braces=True)} {histogram.count}")
+        progress = self.progress()
+        for field in ('videos_done', 'videos_total', 'eta_seconds'):
+            if progress.get(field) is not None:
+                lines.append(f"# TYPE harvest_{field} gauge")
+                lines.append(f"harvest_{field} {progress[field]}")
+        return '\n'.join(lines) + '\n'
+
+def metric_label_text(labels, braces=False):
+    if not braces:
+        return ','.join(f'{key}={value}' for key, value in labels) or 'all'
+    text = ','.join(f'{key}="{value}"' for key, value in labels)
+    return '{' + text + '}' if text else ''
+
+@st.cache_resource
+def get_harvest_metrics():
+    return HarvestMetrics()
+
+def timed(name, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_harvest_metrics().timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.metrics.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body = json.dumps(self.metrics.snapshot(), default=str).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# Serves /metrics (Prometheus) and /metrics.json from a daemon thread
+def serve_metrics(port, metrics=None):
+    handler = type('Handler', (MetricsRequestHandler,), {'metrics': metrics or get_harvest_metrics()})
+    server = ThreadingHTTPServer(('', port), handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
+
 # YouTube Data Collection Functions
 def get_channel_stats(youtube, channel_id):
     try:
@@ -72,340 +711,4157 @@ def get_channel_stats(youtube, channel_id):
         if not response.get('items'):
             return None
 
-        channel_data = response['items'][0]
-        data = {
-            'channelName': channel_data['snippet']['title'],
-            'channelid': channel_data['id'],
-            'subscribers': int(channel_data['statistics']['subscriberCount']),
-            'views': int(channel_data['statistics']['viewCount']),
-            'totalVideos': int(channel_data['statistics']['videoCount']),
-            'playlistId': channel_data['contentDetails']['relatedPlaylists']['uploads'],
-            'channel_description': channel_data['snippet']['description']
-        }
-        return data
-    except Exception as e:
-        st.error(f"Error fetching channel data: {str(e)}")
+        return parse_channel(response['items'][0])
+    except HttpError as e:
+        # Anything but a missing channel is left to the caller after retries
+        if classify_api_error(e) != 'not_found':
+            raise
         return None
 
-def get_video_ids(youtube, playlist_id):
-    try:
-        video_ids = []
+def parse_channel(channel_data):
+    return {
+        'channelName': channel_data['snippet']['title'],
+        'channelid': channel_data['id'],
+        'subscribers': int(channel_data['statistics']['subscriberCount']),
+        'views': int(channel_data['statistics']['viewCount']),
+        'totalVideos': int(channel_data['statistics']['videoCount']),
+        'playlistId': channel_data['contentDetails']['relatedPlaylists']['uploads'],
+        'channel_description': channel_data['snippet']['description']
+    }
+
+# One channels.list call per 50 channels; channels that no longer exist are skipped
+def get_channel_stats_bulk(youtube, channel_ids):
+    channels = []
+    for batch in chunk_list(channel_ids, VIDEO_BATCH_SIZE):
+        response = youtube.channels().list(
+            part="snippet,contentDetails,statistics",
+            id=','.join(batch),
+            maxResults=len(batch)
+        ).execute()
+        channels.extend(parse_channel(item) for item in response.get('items', []))
+    return channels
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+
+def get_video_ids(youtube, playlist_id, since=None, page_token=None, on_page=None):
+    # Uploads playlists list newest first, so paging can stop at the first
+    # video published at or before the `since` watermark. A page that still
+    # fails after retries raises, so a partial listing is never taken as complete.
+    video_ids = []
+    next_page_token = page_token
+    while True:
         request = youtube.playlistItems().list(
-            part="contentDetails",
+            part='contentDetails',
             playlistId=playlist_id,
-            maxResults=50
+            maxResults=50,
+            pageToken=next_page_token
         )
-        response = request.execute()
+        try:
+            response = request.execute()
+        except HttpError as e:
+            if classify_api_error(e) != 'not_found':
+                raise
+            st.warning(f"Playlist {playlist_id} was not found")
+            return video_ids
 
+        reached_known = False
+        page_ids = []
         for item in response['items']:
+            published = item['contentDetails'].get('videoPublishedAt')
+            if since and published and parse_timestamp(published) <= since:
+                reached_known = True
+                continue
             video_ids.append(item['contentDetails']['videoId'])
+            page_ids.append(item['contentDetails']['videoId'])
 
         next_page_token = response.get('nextPageToken')
-        while next_page_token:
-            request = youtube.playlistItems().list(
-                part='contentDetails',
-                playlistId=playlist_id,
-                maxResults=50,
-                pageToken=next_page_token
-            )
-            response = request.execute()
-            for item in response['items']:
-                video_ids.append(item['contentDetails']['videoId'])
-            next_page_token = response.get('nextPageToken')
+        if reached_known:
+            next_page_token = None
+        if on_page:
+            on_page(page_ids, next_page_token)
+        if not next_page_token:
+            break
 
-        return video_ids
-    except Exception as e:
-        st.error(f"Error fetching video IDs: {str(e)}")
-        return []
+    return video_ids
 
-def format_duration(duration):
-    try:
-        duration_obj = isodate.parse_duration(duration)
-        hours = duration_obj.total_seconds() // 3600
-        minutes = (duration_obj.total_seconds() % 3600) // 60
-        seconds = duration_obj.total_seconds() % 60
-        return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
-    except:
-        return "00:00:00"
+# videos().list accepts at most 50 comma-separated IDs per call
+VIDEO_BATCH_SIZE = 50
 
-def get_video_details(youtube, video_id):
-    try:
+def chunk_list(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# Columnar Parsing
+# Whole API pages become DataFrames whose columns match the table layout, so
+# coercion runs per column and the bulk writer can take the frames as they are
+VIDEO_COLUMNS = [
+    'video_id', 'channel_id', 'title', 'description', 'tags',
+    'published_at', 'view_count', 'like_count',
+    'favorite_count', 'comment_count', 'duration', 'definition', 'caption'
+]
+VIDEO_STATS_COLUMNS = ['video_id', 'view_count', 'like_count', 'favorite_count', 'comment_count']
+COMMENT_COLUMNS = ['comment_id', 'video_id', 'parent_id', 'comment_text', 'author_name', 'published_at']
+
+ISO_DURATION_PATTERN = r'^P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d+)?)S)?)?$'
+ISO_DURATION_UNITS = [7 * 86400, 86400, 3600, 60, 1]
+
+def durations_to_seconds(durations):
+    parts = durations.astype(object).fillna('').astype(str).str.extract(ISO_DURATION_PATTERN)
+    seconds = sum(
+        pd.to_numeric(parts[i]).fillna(0) * unit
+        for i, unit in enumerate(ISO_DURATION_UNITS)
+    )
+    return pd.Series(seconds, index=durations.index).astype('int64')
+
+def int_column(frame, name):
+    if name not in frame:
+        return pd.Series(0, index=frame.index, dtype='int64')
+    return pd.to_numeric(frame[name], errors='coerce').fillna(0).astype('int64')
+
+def text_column(frame, name, default=None):
+    if name not in frame:
+        return pd.Series([default] * len(frame), index=frame.index, dtype=object)
+    column = frame[name].astype(object)
+    return column.where(column.notna(), default)
+
+# psycopg2 needs Python scalars and None, not numpy values and NaN
+def finish_frame(columns, data):
+    frame = pd.DataFrame(data, columns=columns).astype(object)
+    return frame.where(frame.notna(), None)
+
+@timed('harvest_parse_seconds', kind='videos')
+def parse_video_page(items):
+    frame = pd.json_normalize(items)
+    if frame.empty:
+        return pd.DataFrame(columns=VIDEO_COLUMNS)
+    return finish_frame(VIDEO_COLUMNS, {
+        'video_id': text_column(frame, 'id'),
+        'channel_id': text_column(frame, 'snippet.channelId'),
+        'title': text_column(frame, 'snippet.title'),
+        'description': text_column(frame, 'snippet.description'),
+        'tags': text_column(frame, 'snippet.tags'),
+        'published_at': text_column(frame, 'snippet.publishedAt'),
+        'view_count': int_column(frame, 'statistics.viewCount'),
+        'like_count': int_column(frame, 'statistics.likeCount'),
+        'favorite_count': int_column(frame, 'statistics.favoriteCount'),
+        'comment_count': int_column(frame, 'statistics.commentCount'),
+        'duration': durations_to_seconds(text_column(frame, 'contentDetails.duration')),
+        'definition': text_column(frame, 'contentDetails.definition'),
+        'caption': text_column(frame, 'contentDetails.caption', 'false')
+    })
+
+@timed('harvest_parse_seconds', kind='video_stats')
+def parse_video_stats_page(items):
+    frame = pd.json_normalize(items)
+    if frame.empty:
+        return pd.DataFrame(columns=VIDEO_STATS_COLUMNS)
+    return finish_frame(VIDEO_STATS_COLUMNS, {
+        'video_id': text_column(frame, 'id'),
+        'view_count': int_column(frame, 'statistics.viewCount'),
+        'like_count': int_column(frame, 'statistics.likeCount'),
+        'favorite_count': int_column(frame, 'statistics.favoriteCount'),
+        'comment_count': int_column(frame, 'statistics.commentCount')
+    })
+
+@timed('harvest_parse_seconds', kind='comments')
+def parse_comment_threads(items, video_id):
+    frame = pd.json_normalize(items)
+    if frame.empty:
+        return pd.DataFrame(columns=COMMENT_COLUMNS)
+    prefix = 'snippet.topLevelComment.snippet.'
+    return finish_frame(COMMENT_COLUMNS, {
+        'comment_id': text_column(frame, 'id'),
+        'video_id': video_id,
+        'parent_id': None,
+        'comment_text': text_column(frame, prefix + 'textDisplay'),
+        'author_name': text_column(frame, prefix + 'authorDisplayName'),
+        'published_at': text_column(frame, prefix + 'publishedAt')
+    })
+
+@timed('harvest_parse_seconds', kind='comment_replies')
+def parse_comment_replies(items, video_id, parent_ids):
+    frame = pd.json_normalize(items)
+    if frame.empty:
+        return pd.DataFrame(columns=COMMENT_COLUMNS)
+    return finish_frame(COMMENT_COLUMNS, {
+        'comment_id': text_column(frame, 'id'),
+        'video_id': video_id,
+        'parent_id': list(parent_ids),
+        'comment_text': text_column(frame, 'snippet.textDisplay'),
+        'author_name': text_column(frame, 'snippet.authorDisplayName'),
+        'published_at': text_column(frame, 'snippet.publishedAt')
+    })
+
+def get_video_frame(youtube, video_ids):
+    frames = []
+    for batch in chunk_list(video_ids, VIDEO_BATCH_SIZE):
         request = youtube.videos().list(
             part="snippet,contentDetails,statistics",
-            id=video_id
+            id=','.join(batch)
         )
         response = request.execute()
+        frames.append(parse_video_page(response.get('items', [])))
 
-        if not response['items']:
-            return None
+    if not frames:
+        return pd.DataFrame(columns=VIDEO_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
 
-        video = response['items'][0]
-        
-        return {
-            'video_id': video['id'],
-            'channelid': video['snippet']['channelId'],
-            'title': video['snippet']['title'],
-            'description': video['snippet']['description'],
-            'tags': video['snippet'].get('tags', []),
-            'publishedAt': video['snippet']['publishedAt'],
-            'viewCount': int(video['statistics'].get('viewCount', 0)),
-            'likeCount': int(video['statistics'].get('likeCount', 0)),
-
-            'favoriteCount': int(video['statistics'].get('favoriteCount', 0)),
-            'commentCount': int(video['statistics'].get('commentCount', 0)),
-            'duration': format_duration(video['contentDetails']['duration']),
-            'definition': video['contentDetails']['definition'],
-            'caption': video['contentDetails'].get('caption', 'false')
-        }
-    except Exception as e:
-        st.error(f"Error fetching video details: {str(e)}")
-        return None
+def get_video_statistics_bulk(youtube, video_ids):
+    frames = []
+    for batch in chunk_list(video_ids, VIDEO_BATCH_SIZE):
+        request = youtube.videos().list(
+            part="statistics",
+            id=','.join(batch)
+        )
+        response = request.execute()
+        frames.append(parse_video_stats_page(response.get('items', [])))
+
+    if not frames:
+        return pd.DataFrame(columns=VIDEO_STATS_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
 
-def get_video_comments(youtube, video_id, max_comments=100):
+def http_error_reason(error):
     try:
-        comments = []
-        request = youtube.commentThreads().list(
+        return json.loads(error.content)['error']['errors'][0].get('reason')
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+QUOTA_ERROR_REASONS = {'quotaExceeded', 'dailyLimitExceeded'}
+RATE_LIMIT_ERROR_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+NOT_FOUND_ERROR_REASONS = {
+    'channelNotFound', 'playlistNotFound', 'videoNotFound', 'commentThreadNotFound'
+}
+
+# Sorts an API failure into quota, not_found, comments_disabled, transient or fatal
+def classify_api_error(error):
+    if isinstance(error, QuotaExceededError):
+        return 'quota'
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        reason = http_error_reason(error)
+        if reason in QUOTA_ERROR_REASONS:
+            return 'quota'
+        if reason == 'commentsDisabled':
+            return 'comments_disabled'
+        if status == 404 or reason in NOT_FOUND_ERROR_REASONS:
+            return 'not_found'
+        if status == 429 or status >= 500 or reason in RATE_LIMIT_ERROR_REASONS:
+            return 'transient'
+        return 'fatal'
+    # Timeouts, resets and DNS failures from the transport
+    if isinstance(error, (OSError, httplib2.HttpLib2Error)):
+        return 'transient'
+    return 'fatal'
+
+# Caps the number of comments taken across every video in a harvest
+class CommentBudget:
+    def __init__(self, limit):
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    # Grants up to `count` comments and returns how many were granted
+    def take(self, count=1):
+        with self.lock:
+            granted = max(0, min(count, self.remaining))
+            self.remaining -= granted
+            return granted
+
+def iter_reply_pages(youtube, parent_id):
+    next_page_token = None
+    while True:
+        request = youtube.comments().list(
             part="snippet",
-            videoId=video_id,
-            maxResults=min(max_comments, 100)
+            parentId=parent_id,
+            maxResults=100,
+            pageToken=next_page_token
         )
         response = request.execute()
+        yield response['items']
 
-        for item in response['items']:
-            comment = item['snippet']['topLevelComment']['snippet']
-            comments.append({
-                'comment_id': item['id'],
-                'video_id': video_id,
-                'comment_text': comment['textDisplay'],
-                'author_name': comment['authorDisplayName'],
-                'published_at': comment['publishedAt']
-            })
+        next_page_token = response.get('nextPageToken')
+        if not next_page_token:
+            return
 
-        return comments
-    except:
-        return []
+def iter_reply_frames(youtube, video_id, threads):
+    inline_replies = []
+    inline_parents = []
+    for thread in threads:
+        total = thread['snippet'].get('totalReplyCount', 0)
+        if not total:
+            continue
+        # Threads carry at most 5 replies inline; page the rest separately
+        replies = thread.get('replies', {}).get('comments', [])
+        if len(replies) >= total:
+            inline_replies.extend(replies)
+            inline_parents.extend([thread['id']] * len(replies))
+        else:
+            for page in iter_reply_pages(youtube, thread['id']):
+                yield parse_comment_replies(page, video_id, [thread['id']] * len(page))
+    if inline_replies:
+        yield parse_comment_replies(inline_replies, video_id, inline_parents)
+
+def iter_comment_batches(youtube, video_id, max_comments=MAX_COMMENTS_PER_VIDEO,
+                         include_replies=INCLUDE_COMMENT_REPLIES, budget=None,
+                         page_token=None, on_page=None):
+    # Yields one DataFrame per page so huge comment sections never sit in memory
+    taken = 0
+
+    def limit(frame):
+        nonlocal taken
+        allowed = len(frame)
+        if max_comments is not None:
+            allowed = min(allowed, max_comments - taken)
+        if budget is not None:
+            allowed = budget.take(allowed)
+        taken += allowed
+        return frame.iloc[:allowed], allowed < len(frame)
 
-# Database Operations
-def create_tables():
-    conn = get_db_connection()
-    if not conn:
-        return False
-    
     try:
-        cursor = conn.cursor()
-        
-        # Channels table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS channels (
-            channel_id VARCHAR(255) PRIMARY KEY,
-            channel_name VARCHAR(255),
-            subscriber_count BIGINT,
-            view_count BIGINT,
-            video_count INTEGER,
-            playlist_id VARCHAR(255),
-            description TEXT
-        )
+        next_page_token = page_token
+        while max_comments is None or taken < max_comments:
+            page_size = 100 if max_comments is None else min(max_comments - taken, 100)
+            request = youtube.commentThreads().list(
+                part="snippet,replies" if include_replies else "snippet",
+                videoId=video_id,
+                maxResults=page_size,
+                pageToken=next_page_token
+            )
+            response = request.execute()
+
+            frames = [parse_comment_threads(response['items'], video_id)]
+            if include_replies:
+                frames = itertools.chain(frames, iter_reply_frames(youtube, video_id, response['items']))
+            for frame in frames:
+                frame, truncated = limit(frame)
+                if not frame.empty:
+                    yield frame
+                if truncated:
+                    return
+
+            next_page_token = response.get('nextPageToken')
+            # Called once the page's rows have been consumed, so a saved
+            # cursor never skips comments that were not written yet
+            if on_page:
+                on_page(next_page_token)
+            if not next_page_token:
+                return
+    except HttpError as e:
+        # Comments turned off or a video deleted mid-harvest are normal outcomes.
+        # Other rejections only cost this video's comments; quota and exhausted
+        # retries propagate and fail the channel.
+        kind = classify_api_error(e)
+        if kind == 'fatal':
+            st.error(f"Error fetching comments for video {video_id}: {str(e)}")
+        elif kind not in ('comments_disabled', 'not_found'):
+            raise
+
+# API Response Cache
+class ResponseCache:
+    def __init__(self, path=API_CACHE_PATH, max_bytes=API_CACHE_MAX_BYTES,
+                 ttls=API_CACHE_TTL_SECONDS, clock=time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.clock = clock
+        self.local = threading.local()
+        self.counters = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0}
+        self.counters_lock = threading.Lock()
+        self._connection().execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                etag TEXT,
+                content_type TEXT,
+                content BLOB,
+                size INTEGER,
+                stored_at REAL,
+                last_access REAL
+            )
         ''')
-        
-        # Videos table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS videos (
-            video_id VARCHAR(255) PRIMARY KEY,
-            channel_id VARCHAR(255) REFERENCES channels(channel_id),
-            title VARCHAR(255),
-            description TEXT,
-            tags TEXT,
-            published_at TIMESTAMP,
-            view_count BIGINT,
-            like_count BIGINT,
-            favorite_count INTEGER,
-            comment_count INTEGER,
-            duration VARCHAR(50),
-            definition VARCHAR(50),
-            caption VARCHAR(50)
+
+    # SQLite connections cannot be shared between threads
+    def _connection(self):
+        if not hasattr(self.local, 'conn'):
+            self.local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.conn.execute("PRAGMA journal_mode=WAL")
+        return self.local.conn
+
+    def record(self, counter, amount=1):
+        with self.counters_lock:
+            self.counters[counter] += amount
+
+    def stats(self):
+        with self.counters_lock:
+            stats = dict(self.counters)
+        lookups = stats['hits'] + stats['revalidated'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['revalidated']) / lookups, 3) if lookups else 0.0
+        row = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        stats['entries'], stats['bytes'] = row
+        return stats
+
+    def ttl_for(self, uri):
+        resource = urlsplit(uri).path.rstrip('/').split('/')[-1]
+        return self.ttls.get(resource, 0)
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT etag, content_type, content, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (self.clock(), key))
+        return row
+
+    # The entry if it was stored less than ttl seconds ago; counts as a hit
+    def fresh(self, key, ttl):
+        now = self.clock()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT etag, content_type, content FROM responses WHERE key = ? AND stored_at > ?",
+            (key, now - ttl)
+        ).fetchone()
+        if row:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.record('hits')
+        return row
+
+    def put(self, key, etag, content_type, content):
+        now = self.clock()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, etag, content_type, content, len(content), now, now)
         )
-        ''')
+        self._evict(conn)
+
+    def touch(self, key):
+        now = self.clock()
+        self._connection().execute(
+            "UPDATE responses SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key)
+        )
+
+    # Drops least recently used entries until the cache fits in max_bytes
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.record('evictions', len(victims))
+
+def cache_key(uri):
+    # The API key is left out so every key in a pool shares cached responses
+    parts = urlsplit(uri)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query) if k != 'key')
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+# httplib2-compatible transport that answers GETs from the ResponseCache
+class CachingHttp:
+    def __init__(self, cache, http=None):
+        self.cache = cache
+        self.http = http or httplib2.Http()
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if method != 'GET':
+            return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        key = cache_key(uri)
+        cached = self.cache.get(key)
+        if cached:
+            etag, content_type, content, stored_at = cached
+            if self.cache.clock() - stored_at < self.cache.ttl_for(uri):
+                self.cache.record('hits')
+                return self._cached_response(etag, content_type, content), content
+            if etag:
+                headers = dict(headers or {})
+                headers['if-none-match'] = etag
+
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        if cached and response.status == 304:
+            self.cache.touch(key)
+            self.cache.record('revalidated')
+            etag, content_type, content, stored_at = cached
+            return self._cached_response(etag, content_type, content), content
+
+        self.cache.record('misses')
+        if response.status == 200:
+            self.cache.put(key, response.get('etag'), response.get('content-type'), content)
+        return response, content
+
+    # Answers a GET from a fresh entry without going to the network
+    def fresh(self, uri):
+        cached = self.cache.fresh(cache_key(uri), self.cache.ttl_for(uri))
+        if not cached:
+            return None
+        etag, content_type, content = cached
+        return self._cached_response(etag, content_type, content), content
+
+    def _cached_response(self, etag, content_type, content):
+        response = httplib2.Response({
+            'status': '200',
+            'content-type': content_type or 'application/json',
+            'content-length': str(len(content))
+        })
+        if etag:
+            response['etag'] = etag
+        response.fromcache = True
+        return response
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache()
+
+# The parsed response when a fresh cache entry can answer the request, else
+# None. Every wrapper asks this before its limiter, so a cached response costs
+# no quota and never waits for a token. Wrappers answer through from_cache();
+# a discovery request is looked up by its URI.
+def response_from_cache(request):
+    from_cache = getattr(request, 'from_cache', None)
+    if from_cache is not None:
+        return from_cache()
+    http = getattr(request, 'http', None)
+    if not isinstance(http, CachingHttp) or request.method != 'GET':
+        return None
+    cached = http.fresh(request.uri)
+    if cached is None:
+        return None
+    return request.postproc(*cached)
+
+# API Rate Limiting
+class QuotaExceededError(Exception):
+    pass
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            self.sleep(wait_time)
+
+class QuotaRateLimiter:
+    def __init__(self, requests_per_second=API_REQUESTS_PER_SECOND, daily_quota=API_DAILY_QUOTA,
+                 clock=time.time, sleep=time.sleep, ledger=None):
+        self.bucket = TokenBucket(requests_per_second, clock=clock, sleep=sleep)
+        self.daily_quota = daily_quota
+        self.clock = clock
+        self.day = int(clock() // 86400)
+        self.used = 0
+        self.calls = {}
+        # Units reserved from the shared ledger and not spent yet
+        self.ledger = ledger
+        self.reserved = 0
+        self.lock = threading.Lock()
+
+    def remaining(self):
+        with self.lock:
+            self._roll_day()
+            return self.daily_quota - self.used
+
+    def _roll_day(self):
+        day = int(self.clock() // 86400)
+        if day != self.day:
+            self.day = day
+            self.used = 0
+            self.reserved = 0
+
+    # Marks today's quota as spent, e.g. after the API reported quotaExceeded
+    def exhaust(self):
+        with self.lock:
+            self._roll_day()
+            self.used = max(self.used, self.daily_quota)
+            self.reserved = 0
+            if self.ledger:
+                self.ledger.exhaust(self.day, self.daily_quota)
+
+    def acquire(self, cost=1, api_method=None):
+        with self.lock:
+            self._roll_day()
+            if self.used + cost > self.daily_quota:
+                raise QuotaExceededError(
+                    f"Daily quota of {self.daily_quota} units exhausted"
+                )
+            if self.ledger and self.reserved < cost:
+                self.reserved += self.ledger.reserve(
+                    self.day, max(cost - self.reserved, API_QUOTA_RESERVE_UNITS), self.daily_quota
+                )
+                if self.reserved < cost:
+                    # Other processes spent the rest of today's quota
+                    self.used = max(self.used, self.daily_quota)
+                    raise QuotaExceededError(
+                        f"Daily quota of {self.daily_quota} units exhausted"
+                    )
+            if self.ledger:
+                self.reserved -= cost
+            self.used += cost
+            if api_method:
+                self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        self.bucket.acquire()
+
+# One key's daily quota usage in Postgres, shared by every process using the
+# key. Without a reachable database the limiter falls back to counting alone.
+class QuotaLedger:
+    def __init__(self, scope):
+        self.scope = scope
+        self.enabled = True
+
+    def _execute(self, day, statement, params):
+        if not self.enabled:
+            return None
+        conn = None
+        try:
+            pool = get_db_pool()
+            conn = PooledConnection(pool, pool.checkout())
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO api_quota_usage (day, scope, units) VALUES (%s, %s, 0)
+                ON CONFLICT (day, scope) DO NOTHING
+            ''', (quota_day(day), self.scope))
+            cursor.execute(statement, dict(params, day=quota_day(day), scope=self.scope))
+            row = cursor.fetchone()
+            conn.commit()
+            return row
+        except psycopg2.Error as e:
+            self.enabled = False
+            logging.getLogger('youtube_harvester').warning(
+                "Counting API quota in this process only: %s", e
+            )
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    # Returns how many of the requested units were granted, 0 once the day's
+    # quota is spent
+    def reserve(self, day, units, daily_quota):
+        row = self._execute(day, '''
+            UPDATE api_quota_usage AS usage SET units = LEAST(before.units + %(units)s, %(quota)s)
+            FROM (
+                SELECT units FROM api_quota_usage
+                WHERE day = %(day)s AND scope = %(scope)s
+                FOR UPDATE
+            ) AS before
+            WHERE usage.day = %(day)s AND usage.scope = %(scope)s
+            RETURNING usage.units - before.units
+        ''', {'units': units, 'quota': daily_quota})
+        return units if row is None else row[0]
+
+    def exhaust(self, day, daily_quota):
+        self._execute(day, '''
+            UPDATE api_quota_usage SET units = GREATEST(units, %(quota)s)
+            WHERE day = %(day)s AND scope = %(scope)s
+            RETURNING units
+        ''', {'quota': daily_quota})
+
+def quota_day(day):
+    return datetime(1970, 1, 1).date() + timedelta(days=day)
+
+# Wraps a discovery client so every request.execute() passes through the limiter
+# and records its latency, quota units and outcome in the harvest metrics
+class RateLimitedClient:
+    def __init__(self, client, limiter, metrics=None):
+        self._client = client
+        self._limiter = limiter
+        self._metrics = metrics or get_harvest_metrics()
+
+    def __getattr__(self, resource_name):
+        resource = getattr(self._client, resource_name)
+
+        def factory(*args, **kwargs):
+            return _RateLimitedResource(resource(*args, **kwargs), resource_name, self._limiter, self._metrics)
+        return factory
+
+class _RateLimitedResource:
+    def __init__(self, resource, resource_name, limiter, metrics):
+        self._resource = resource
+        self._resource_name = resource_name
+        self._limiter = limiter
+        self._metrics = metrics
+
+    def __getattr__(self, method_name):
+        method = getattr(self._resource, method_name)
+
+        def call(*args, **kwargs):
+            api_method = f"{self._resource_name}.{method_name}"
+            return _RateLimitedRequest(method(*args, **kwargs), api_method, self._limiter, self._metrics)
+        return call
+
+class _RateLimitedRequest:
+    def __init__(self, request, api_method, limiter, metrics):
+        self._request = request
+        self.api_method = api_method
+        self._limiter = limiter
+        self._metrics = metrics
+
+    def from_cache(self):
+        return response_from_cache(self._request)
+
+    def execute(self, *args, **kwargs):
+        cached = self.from_cache()
+        if cached is not None:
+            return cached
+        cost = API_QUOTA_COSTS.get(self.api_method, 1)
+        self._limiter.acquire(cost, self.api_method)
+        self._metrics.inc('youtube_api_requests_total', method=self.api_method)
+        self._metrics.inc('youtube_api_quota_units_total', cost, method=self.api_method)
+        try:
+            with self._metrics.timer('youtube_api_request_seconds', method=self.api_method):
+                return self._request.execute(*args, **kwargs)
+        except Exception as e:
+            self._metrics.inc('youtube_api_errors_total', kind=classify_api_error(e))
+            raise
+
+# API Retries
+class CircuitBreaker:
+    def __init__(self, failure_threshold=API_BREAKER_THRESHOLD,
+                 reset_seconds=API_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    # Seconds a caller must wait before sending. Once the reset period is over
+    # a single probe request goes through; everyone else waits on its result.
+    def wait_time(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.reset_seconds - self.clock()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return min(1, self.reset_seconds)
+            self.probing = True
+            return 0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                self.probing = False
+                self.trips += 1
+
+# Runs request.execute() with backoff on transient errors. One executor is
+# shared by every thread of a harvest so the breaker and retry budget see it all.
+class RequestExecutor:
+    def __init__(self, max_attempts=API_RETRY_ATTEMPTS, base_delay=API_RETRY_BASE_SECONDS,
+                 max_delay=API_RETRY_MAX_SECONDS, budget_ratio=API_RETRY_BUDGET_RATIO,
+                 budget_min=API_RETRY_BUDGET_MIN, breaker=None, sleep=time.sleep,
+                 rng=random.random, metrics=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_min = budget_min
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.rng = rng
+        self.metrics = metrics or get_harvest_metrics()
+        self.requests = 0
+        self.retries = 0
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def _take_retry(self):
+        with self.lock:
+            if self.retries >= self.budget_min + self.budget_ratio * self.requests:
+                return False
+            self.retries += 1
+            return True
+
+    def backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        return self.rng() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+    def execute(self, request, *args, **kwargs):
+        attempt = 0
+        while True:
+            wait_time = self.breaker.wait_time()
+            if wait_time > 0:
+                self.metrics.observe('youtube_api_breaker_wait_seconds', wait_time)
+                self.sleep(wait_time)
+                continue
+
+            with self.lock:
+                self.requests += 1
+            try:
+                response = request.execute(*args, **kwargs)
+            except Exception as e:
+                kind = classify_api_error(e)
+                with self.lock:
+                    self.errors[kind] = self.errors.get(kind, 0) + 1
+                if kind != 'transient':
+                    # The API answered, so it is up even if the request was refused
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt >= self.max_attempts or not self._take_retry():
+                    raise
+                self.metrics.inc('youtube_api_retries_total')
+                self.sleep(self.backoff(attempt - 1))
+                continue
+            self.breaker.record_success()
+            return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'errors': dict(self.errors),
+                'breaker_trips': self.breaker.trips
+            }
+
+# Wraps a discovery client so every request.execute() goes through the executor
+class RetryingClient:
+    def __init__(self, client, executor):
+        self._client = client
+        self._executor = executor
+
+    def __getattr__(self, resource_name):
+        resource = getattr(self._client, resource_name)
+
+        def factory(*args, **kwargs):
+            return _RetryingResource(resource(*args, **kwargs), self._executor)
+        return factory
+
+class _RetryingResource:
+    def __init__(self, resource, executor):
+        self._resource = resource
+        self._executor = executor
+
+    def __getattr__(self, method_name):
+        method = getattr(self._resource, method_name)
+
+        def call(*args, **kwargs):
+            return _RetryingRequest(method(*args, **kwargs), self._executor)
+        return call
+
+class _RetryingRequest:
+    def __init__(self, request, executor):
+        self._request = request
+        self._executor = executor
+
+    def from_cache(self):
+        return response_from_cache(self._request)
+
+    # A cached response neither waits on nor closes the circuit breaker
+    def execute(self, *args, **kwargs):
+        cached = self.from_cache()
+        if cached is not None:
+            return cached
+        return self._executor.execute(self._request, *args, **kwargs)
+
+# API Key Pool
+# Parsed once per process; building a client from it then takes about a millisecond
+@st.cache_resource
+def youtube_discovery_document():
+    if API_DISCOVERY_PATH:
+        with open(API_DISCOVERY_PATH) as document:
+            return json.load(document)
+    from googleapiclient.discovery_cache import get_static_doc
+    return json.loads(get_static_doc('youtube', 'v3'))
+
+def build_api_client(api_key):
+    from googleapiclient.discovery import build_from_document
+    http = CachingHttp(get_response_cache(), httplib2.Http(timeout=API_TIMEOUT_SECONDS))
+    return build_from_document(youtube_discovery_document(), developerKey=api_key, http=http)
+
+def mask_api_key(api_key):
+    return f"...{api_key[-4:]}"
+
+# Names a key's row in api_quota_usage without storing the key itself
+def quota_scope(api_key):
+    return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+# Tracks quota and throttling per API key and picks the key each request runs on
+class ApiKeyPool:
+    def __init__(self, api_keys=None, requests_per_second=API_REQUESTS_PER_SECOND,
+                 daily_quota=API_DAILY_QUOTA, build_client=build_api_client,
+                 clock=time.time, sleep=time.sleep, shared_quota=API_SHARED_QUOTA):
+        self.api_keys = list(dict.fromkeys(api_keys or API_KEYS))
+        if not self.api_keys:
+            raise ValueError("At least one API key is required")
+        self.limiters = {
+            api_key: QuotaRateLimiter(requests_per_second, daily_quota, clock, sleep,
+                                      QuotaLedger(quota_scope(api_key)) if shared_quota else None)
+            for api_key in self.api_keys
+        }
+        self.cooldown_until = {api_key: 0 for api_key in self.api_keys}
+        self.backoff = {api_key: 0 for api_key in self.api_keys}
+        self.failovers = 0
+        self.build_client = build_client
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    # Discovery clients are not thread-safe, so each thread asks for its own
+    def client(self):
+        return KeyPoolClient(self)
+
+    def choose(self, cost=1):
+        while True:
+            with self.lock:
+                now = self.clock()
+                candidates = [
+                    api_key for api_key in self.api_keys
+                    if self.limiters[api_key].remaining() >= cost
+                ]
+                if not candidates:
+                    raise QuotaExceededError(
+                        f"Daily quota exhausted on all {len(self.api_keys)} API keys"
+                    )
+                ready = [api_key for api_key in candidates if self.cooldown_until[api_key] <= now]
+                if ready:
+                    # Spend the fullest key first so the pool drains evenly
+                    return max(ready, key=lambda api_key: self.limiters[api_key].remaining())
+                wait_time = min(self.cooldown_until[api_key] for api_key in candidates) - now
+            self.sleep(wait_time)
+
+    def mark_exhausted(self, api_key):
+        self.limiters[api_key].exhaust()
+        with self.lock:
+            self.failovers += 1
+        logging.getLogger('youtube_harvester').warning(
+            "API key %s hit its daily quota", mask_api_key(api_key)
+        )
+
+    def mark_throttled(self, api_key):
+        with self.lock:
+            backoff = self.backoff[api_key] * 2 or API_KEY_BACKOFF_SECONDS
+            self.backoff[api_key] = min(backoff, API_KEY_MAX_BACKOFF_SECONDS)
+            self.cooldown_until[api_key] = self.clock() + self.backoff[api_key]
+            self.failovers += 1
+
+    def mark_ok(self, api_key):
+        if self.backoff[api_key]:
+            with self.lock:
+                self.backoff[api_key] = 0
+
+    def stats(self):
+        now = self.clock()
+        return {
+            'keys': [
+                {
+                    'key': mask_api_key(api_key),
+                    'quota_used': self.limiters[api_key].used,
+                    'quota_remaining': self.limiters[api_key].remaining(),
+                    'calls': dict(self.limiters[api_key].calls),
+                    'cooling_down_seconds': round(max(0, self.cooldown_until[api_key] - now), 1)
+                }
+                for api_key in self.api_keys
+            ],
+            'failovers': self.failovers
+        }
+
+# Drop-in replacement for a discovery client. Requests are only bound to a key
+# at execute() time so a quota or rate-limit error can be retried on another key.
+class KeyPoolClient:
+    def __init__(self, pool):
+        self._pool = pool
+        self._clients = {}
+
+    def for_key(self, api_key):
+        if api_key not in self._clients:
+            self._clients[api_key] = self._pool.build_client(api_key)
+        return self._clients[api_key]
+
+    def __getattr__(self, resource_name):
+        def factory(*args, **kwargs):
+            return _KeyPoolResource(self, resource_name, args, kwargs)
+        return factory
+
+class _KeyPoolResource:
+    def __init__(self, client, resource_name, args, kwargs):
+        self._client = client
+        self._resource = (resource_name, args, kwargs)
+
+    def __getattr__(self, method_name):
+        def call(*args, **kwargs):
+            return _KeyPoolRequest(self._client, self._resource, (method_name, args, kwargs))
+        return call
+
+class _KeyPoolRequest:
+    def __init__(self, client, resource, method):
+        self._client = client
+        self._resource = resource
+        self._method = method
+        self.api_method = f"{resource[0]}.{method[0]}"
+
+    def _bind(self, api_key):
+        resource_name, resource_args, resource_kwargs = self._resource
+        method_name, method_args, method_kwargs = self._method
+        resource = getattr(self._client.for_key(api_key), resource_name)(*resource_args, **resource_kwargs)
+        return getattr(resource, method_name)(*method_args, **method_kwargs)
+
+    # Every key shares the cache, so any key's client can look the request up
+    def from_cache(self):
+        return response_from_cache(self._bind(self._client._pool.api_keys[0]))
+
+    def execute(self, *args, **kwargs):
+        cached = self.from_cache()
+        if cached is not None:
+            return cached
+        pool = self._client._pool
+        cost = API_QUOTA_COSTS.get(self.api_method, 1)
+        throttled = 0
+        while True:
+            api_key = pool.choose(cost)
+            try:
+                pool.limiters[api_key].acquire(cost, self.api_method)
+            except QuotaExceededError:
+                # Another thread spent the key's last units first
+                continue
+
+            try:
+                response = self._bind(api_key).execute(*args, **kwargs)
+            except HttpError as e:
+                reason = http_error_reason(e)
+                if reason in QUOTA_ERROR_REASONS:
+                    pool.mark_exhausted(api_key)
+                    continue
+                if e.resp.status == 429 or reason in RATE_LIMIT_ERROR_REASONS:
+                    throttled += 1
+                    if throttled > API_KEY_THROTTLE_RETRIES:
+                        raise
+                    pool.mark_throttled(api_key)
+                    continue
+                raise
+            pool.mark_ok(api_key)
+            return response
+
+@st.cache_resource
+def get_api_key_pool():
+    return ApiKeyPool()
+
+# Database Operations
+
+# Ordered schema changes applied on top of the base tables. Each version runs
+# once, inside the create_tables transaction, and is recorded in schema_migrations.
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # Durations as integer seconds instead of "HH:MM:SS" strings
+        '''
+        ALTER TABLE videos ALTER COLUMN duration TYPE INTEGER USING (
+            CASE WHEN duration ~ '^[0-9]+:[0-9]+:[0-9]+$' THEN
+                SPLIT_PART(duration, ':', 1)::INTEGER * 3600 +
+                SPLIT_PART(duration, ':', 2)::INTEGER * 60 +
+                SPLIT_PART(duration, ':', 3)::INTEGER
+            END
+        )
+        ''',
+        # Tags as a real array instead of a comma-joined string
+        "ALTER TABLE videos ALTER COLUMN tags TYPE TEXT[] USING string_to_array(tags, ',')",
+        # Foreign key lookups used by every join and per-channel scan
+        "CREATE INDEX IF NOT EXISTS idx_videos_channel_id ON videos (channel_id)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_video_id ON comments (video_id)",
+        # Covering indexes for the top-N questions (index-only scans)
+        "CREATE INDEX IF NOT EXISTS idx_videos_view_count ON videos (view_count DESC) INCLUDE (title, channel_id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_like_count ON videos (like_count DESC) INCLUDE (title, channel_id)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_comment_count ON videos (comment_count DESC) INCLUDE (title, channel_id)",
+        # Date-range filters. Rows are stored in harvest order, not publish order
+        # (channels are harvested side by side and playlists page newest first),
+        # so these are btree: BRIN ranges would overlap and rule out almost nothing
+        "CREATE INDEX IF NOT EXISTS idx_videos_published_at ON videos (published_at)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_published_at ON comments (published_at)"
+    ]),
+    (2, [
+        # Pre-aggregated answers for the canned analysis questions
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_channel_totals (
+            channel_id VARCHAR(255) PRIMARY KEY,
+            channel_name VARCHAR(255),
+            channel_view_count BIGINT,
+            video_count INTEGER NOT NULL,
+            total_views BIGINT NOT NULL,
+            total_duration BIGINT NOT NULL,
+            avg_duration_minutes DOUBLE PRECISION
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_channel_years (
+            channel_id VARCHAR(255),
+            publish_year INTEGER,
+            channel_name VARCHAR(255),
+            video_count INTEGER NOT NULL,
+            total_views BIGINT NOT NULL,
+            video_titles TEXT[],
+            PRIMARY KEY (channel_id, publish_year)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS analytics_top_videos (
+            metric VARCHAR(50),
+            rank INTEGER,
+            video_id VARCHAR(255),
+            video_name VARCHAR(255),
+            channel_name VARCHAR(255),
+            value BIGINT,
+            PRIMARY KEY (metric, rank)
+        )
+        ''',
+        lambda cursor: refresh_analytics(cursor)
+    ]),
+    (3, [
+        # Append-only counter snapshots, range-partitioned by month
+        '''
+        CREATE TABLE IF NOT EXISTS channel_stats_history (
+            channel_id VARCHAR(255) NOT NULL,
+            captured_at TIMESTAMP NOT NULL,
+            subscriber_count BIGINT,
+            view_count BIGINT,
+            video_count INTEGER
+        ) PARTITION BY RANGE (captured_at)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS video_stats_history (
+            video_id VARCHAR(255) NOT NULL,
+            captured_at TIMESTAMP NOT NULL,
+            view_count BIGINT,
+            like_count BIGINT,
+            comment_count BIGINT
+        ) PARTITION BY RANGE (captured_at)
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_channel_stats_history_channel ON channel_stats_history (channel_id, captured_at)",
+        "CREATE INDEX IF NOT EXISTS idx_video_stats_history_video ON video_stats_history (video_id, captured_at)",
+        lambda cursor: backfill_history(cursor)
+    ]),
+    (4, [
+        # When the refresh scheduler last refreshed something, per kind of refresh
+        '''
+        CREATE TABLE IF NOT EXISTS refresh_state (
+            kind VARCHAR(32) NOT NULL,
+            entity_id VARCHAR(255) NOT NULL,
+            refreshed_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (kind, entity_id)
+        )
+        '''
+    ]),
+    (5, [
+        # Full-text search. Triggers keep the vectors current on ingest. The
+        # UPDATE OF trigger skips statistics refreshes, but BEFORE INSERT fires
+        # for every row an upsert proposes, so re-harvested videos and comments
+        # recompute their vector even when the row already exists.
+        '''
+        CREATE OR REPLACE FUNCTION video_search_vector(title TEXT, tags TEXT[], description TEXT)
+        RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+            SELECT setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+                   setweight(to_tsvector('english', COALESCE(array_to_string(tags, ' '), '')), 'B') ||
+                   setweight(to_tsvector('english', COALESCE(description, '')), 'C')
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION videos_search_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := video_search_vector(NEW.title, NEW.tags, NEW.description);
+            RETURN NEW;
+        END
+        $$
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION comments_search_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := to_tsvector('english', COALESCE(NEW.comment_text, ''));
+            RETURN NEW;
+        END
+        $$
+        ''',
+        "ALTER TABLE videos ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+        "ALTER TABLE comments ADD COLUMN IF NOT EXISTS search_vector TSVECTOR",
+        "UPDATE videos SET search_vector = video_search_vector(title, tags, description)",
+        "UPDATE comments SET search_vector = to_tsvector('english', COALESCE(comment_text, ''))",
+        '''
+        CREATE TRIGGER videos_search_update
+        BEFORE INSERT OR UPDATE OF title, tags, description ON videos
+        FOR EACH ROW EXECUTE FUNCTION videos_search_update()
+        ''',
+        '''
+        CREATE TRIGGER comments_search_update
+        BEFORE INSERT OR UPDATE OF comment_text ON comments
+        FOR EACH ROW EXECUTE FUNCTION comments_search_update()
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_videos_search ON videos USING GIN (search_vector)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_search ON comments USING GIN (search_vector)"
+    ]),
+    (6, [
+        # Sharded harvests: a parent job split into work units that any worker
+        # process can claim, with the attempts and claimant of each unit
+        '''
+        ALTER TABLE harvest_jobs
+            ADD COLUMN IF NOT EXISTS parent_job_id INTEGER REFERENCES harvest_jobs(job_id) ON DELETE CASCADE
+        ''',
+        "ALTER TABLE harvest_jobs ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE harvest_jobs ADD COLUMN IF NOT EXISTS claimed_by TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_harvest_jobs_parent ON harvest_jobs (parent_job_id)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_harvest_jobs_claimable ON harvest_jobs (created_at, job_id)
+        WHERE status IN ('queued', 'running')
+        '''
+    ]),
+    (7, [
+        # Snapshots for a month whose partition is missing land here instead of
+        # failing the flush; the next months are created up front
+        "CREATE TABLE IF NOT EXISTS channel_stats_history_default PARTITION OF channel_stats_history DEFAULT",
+        "CREATE TABLE IF NOT EXISTS video_stats_history_default PARTITION OF video_stats_history DEFAULT",
+        lambda cursor: create_history_partitions(cursor, datetime.now())
+    ]),
+    (8, [
+        # A fresh token per claim, so a worker whose unit was taken over after
+        # its heartbeat went stale can tell before it commits anything
+        "ALTER TABLE harvest_jobs ADD COLUMN IF NOT EXISTS claim_token TEXT",
+        # API quota spent per key and day, shared by every worker process
+        '''
+        CREATE TABLE IF NOT EXISTS api_quota_usage (
+            day DATE NOT NULL,
+            scope TEXT NOT NULL,
+            units INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, scope)
+        )
+        '''
+    ])
+]
+
+def apply_schema_migrations(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    ''')
+    # Serializes concurrent start-ups so each migration runs exactly once
+    cursor.execute("LOCK TABLE schema_migrations IN EXCLUSIVE MODE")
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+
+    for version, statements in SCHEMA_MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            if callable(statement):
+                statement(cursor)
+            else:
+                cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+
+# Analytics Summaries
+# Advisory lock namespace: (key, hash of channel id) guards one channel's
+# summaries, the key alone guards the global top-N lists
+ANALYTICS_LOCK_KEY = 7411
+# Metrics kept in analytics_top_videos
+ANALYTICS_TOP_METRICS = ('view_count', 'like_count', 'comment_count')
+
+# Recomputes the summaries for the given channels, or for every channel when
+# channel_ids is None. Per-channel work goes through idx_videos_channel_id, so
+# a refresh costs the size of the changed channels, not of the warehouse.
+# Writers in other processes may rebuild the same channel. They take turns per
+# channel until commit, so each rebuild starts from the previous one's result;
+# locks are taken in key order, so two writers cannot deadlock.
+def lock_channel_summaries(cursor, channel_ids):
+    cursor.execute("SELECT DISTINCT hashtext(id) AS k FROM unnest(%s::text[]) AS id ORDER BY k",
+                   (channel_ids,))
+    for key, in cursor.fetchall():
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (ANALYTICS_LOCK_KEY, key))
+
+# buffers, when given, are the flushed writer rows behind the refresh; only
+# the top-N lists they can change are rebuilt
+def refresh_analytics(cursor, channel_ids=None, buffers=None):
+    if channel_ids is not None:
+        channel_ids = list(channel_ids)
+        if not channel_ids:
+            return
+        lock_channel_summaries(cursor, channel_ids)
+        channel_filter = "WHERE c.channel_id = ANY(%(channels)s)"
+        cursor.execute(
+            "DELETE FROM analytics_channel_totals WHERE channel_id = ANY(%(channels)s)",
+            {'channels': channel_ids}
+        )
+        cursor.execute(
+            "DELETE FROM analytics_channel_years WHERE channel_id = ANY(%(channels)s)",
+            {'channels': channel_ids}
+        )
+    else:
+        channel_filter = ""
+        # A full rebuild waits for every per-channel one, and they for it
+        cursor.execute("LOCK TABLE analytics_channel_totals, analytics_channel_years IN EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM analytics_channel_totals")
+        cursor.execute("DELETE FROM analytics_channel_years")
+
+    cursor.execute(f'''
+        INSERT INTO analytics_channel_totals
+        SELECT
+            c.channel_id,
+            c.channel_name,
+            c.view_count,
+            COUNT(v.video_id),
+            COALESCE(SUM(v.view_count), 0),
+            COALESCE(SUM(v.duration), 0),
+            AVG(v.duration) / 60.0
+        FROM channels c
+        LEFT JOIN videos v ON v.channel_id = c.channel_id
+        {channel_filter}
+        GROUP BY c.channel_id
+    ''', {'channels': channel_ids})
+
+    cursor.execute(f'''
+        INSERT INTO analytics_channel_years
+        SELECT
+            c.channel_id,
+            EXTRACT(YEAR FROM v.published_at)::INTEGER,
+            c.channel_name,
+            COUNT(*),
+            COALESCE(SUM(v.view_count), 0),
+            array_agg(v.title)
+        FROM channels c
+        JOIN videos v ON v.channel_id = c.channel_id
+        {channel_filter}
+        GROUP BY c.channel_id, EXTRACT(YEAR FROM v.published_at)
+    ''', {'channels': channel_ids})
+
+    refresh_top_videos(cursor, buffers)
+
+# Metrics whose top-N list the flushed rows can change: a flushed counter at or
+# above the list's last entry, a listed video or its channel being rewritten,
+# or a list that is not full yet. Checked under the top-N lock, so the list
+# read is the one the last rebuild committed.
+def changed_top_metrics(cursor, buffers):
+    video_ids = list(buffers['videos']) + list(buffers['video_stats'])
+    flushed = {metric: None for metric in ANALYTICS_TOP_METRICS}
+    for table in ('videos', 'video_stats'):
+        columns = STORE_COLUMNS[table]
+        for metric in ANALYTICS_TOP_METRICS:
+            position = columns.index(metric)
+            for row in buffers[table].values():
+                if row[position] is not None and (flushed[metric] is None or row[position] > flushed[metric]):
+                    flushed[metric] = row[position]
+    cursor.execute('''
+        SELECT t.metric, COUNT(*), MIN(t.value),
+               BOOL_OR(t.video_id = ANY(%(videos)s) OR v.channel_id = ANY(%(channels)s))
+        FROM analytics_top_videos t
+        LEFT JOIN videos v ON v.video_id = t.video_id
+        GROUP BY t.metric
+    ''', {'videos': video_ids, 'channels': list(buffers['channels'])})
+    listed = {metric: (count, last, touched) for metric, count, last, touched in cursor.fetchall()}
+    changed = []
+    for metric in ANALYTICS_TOP_METRICS:
+        count, last, touched = listed.get(metric, (0, None, False))
+        if (touched or count < ANALYTICS_TOP_N or
+                (flushed[metric] is not None and flushed[metric] >= last)):
+            changed.append(metric)
+    return changed
+
+# Global top-N lists are cheap to rebuild from the covering indexes. This is the
+# only lock every writer shares, so it is taken last and held only until the
+# flush commits. Without buffers every list is rebuilt.
+def refresh_top_videos(cursor, buffers=None):
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ANALYTICS_LOCK_KEY,))
+    metrics = changed_top_metrics(cursor, buffers) if buffers else list(ANALYTICS_TOP_METRICS)
+    if not metrics:
+        return
+    cursor.execute("DELETE FROM analytics_top_videos WHERE metric = ANY(%s)", (metrics,))
+    for metric in metrics:
+        cursor.execute(f'''
+            INSERT INTO analytics_top_videos
+            SELECT
+                %(metric)s,
+                ROW_NUMBER() OVER (ORDER BY v.{metric} DESC),
+                v.video_id,
+                v.title,
+                c.channel_name,
+                v.{metric}
+            FROM (
+                SELECT video_id, title, channel_id, {metric}
+                FROM videos
+                ORDER BY {metric} DESC
+                LIMIT %(limit)s
+            ) v
+            JOIN channels c ON v.channel_id = c.channel_id
+        ''', {'metric': metric, 'limit': ANALYTICS_TOP_N})
+
+# Recomputes the channels that have summaries, after rows behind them were
+# deleted; channels left without rows just lose theirs
+def refresh_summarized_channels(cursor):
+    cursor.execute("SELECT channel_id FROM analytics_channel_totals")
+    refresh_analytics(cursor, [row[0] for row in cursor.fetchall()])
+
+# Channels whose summaries are affected by a set of buffered writer rows
+def affected_channels(cursor, buffers):
+    channel_ids = set(buffers['channels'])
+    channel_ids.update(row[1] for row in buffers['videos'].values())
+    if buffers['video_stats']:
+        cursor.execute(
+            "SELECT DISTINCT channel_id FROM videos WHERE video_id = ANY(%s)",
+            (list(buffers['video_stats']),)
+        )
+        channel_ids.update(row[0] for row in cursor.fetchall())
+    return channel_ids
+
+# Statistics History
+# History table, id column and tracked counters per entity
+HISTORY_TABLES = {
+    'channels': ('channel_stats_history', 'channel_id', ('subscriber_count', 'view_count', 'video_count')),
+    'videos': ('video_stats_history', 'video_id', ('view_count', 'like_count', 'comment_count'))
+}
+# Written tables whose rows carry counters, and the entity they snapshot
+HISTORY_SOURCES = {'channels': 'channels', 'videos': 'videos', 'video_stats': 'videos'}
+HISTORY_BUCKETS = ('hour', 'day', 'week', 'month')
+
+# Only rows that are new or whose counters differ from the stored row are
+# appended, so the insert has to run before the row is upserted
+HISTORY_INSERT_SQL = '''
+    INSERT INTO {history} ({key}, captured_at, {metrics})
+    SELECT s.{key}, s.captured_at, {source_metrics}
+    FROM {source}
+    LEFT JOIN {base} b ON b.{key} = s.{key}
+    WHERE b.{key} IS NULL OR ({base_metrics}) IS DISTINCT FROM ({source_metrics})
+'''
+
+def history_snapshot(table, rows, captured_at):
+    entity = HISTORY_SOURCES.get(table)
+    if not entity:
+        return None, []
+    _, key, metrics = HISTORY_TABLES[entity]
+    columns = STORE_COLUMNS[table]
+    positions = [columns.index(column) for column in (key,) + metrics]
+    return entity, [(captured_at,) + tuple(row[i] for i in positions) for row in rows]
+
+def history_insert_sql(entity, source):
+    history, key, metrics = HISTORY_TABLES[entity]
+    return HISTORY_INSERT_SQL.format(
+        history=history, key=key, source=source, base=entity,
+        metrics=', '.join(metrics),
+        source_metrics=', '.join(f"CAST(s.{column} AS BIGINT)" for column in metrics),
+        base_metrics=', '.join(f"CAST(b.{column} AS BIGINT)" for column in metrics)
+    )
+
+# Months this process no longer tries to partition: created, or failed once
+# and left to the DEFAULT partition
+HISTORY_PARTITIONS = set()
+
+def history_month(when):
+    return when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def create_history_partitions(cursor, when, months=HISTORY_PARTITIONS_AHEAD + 1):
+    start = history_month(when)
+    for _ in range(months):
+        end = (start + timedelta(days=32)).replace(day=1)
+        for history, _, _ in HISTORY_TABLES.values():
+            cursor.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+                sql.Identifier(f"{history}_{start:%Y_%m}"), sql.Identifier(history)
+            ), (start, end))
+        start = end
+
+# Runs on the writer's connection in a transaction of its own, before the
+# flush starts, so a flush that rolls back cannot undo a cached partition and
+# the writer never waits on a second pooled connection. A month that cannot be
+# created (another process won the race, or its rows already sit in the
+# DEFAULT partition) is left to the DEFAULT partition for the rest of the process.
+def ensure_history_partitions(conn, when):
+    month = history_month(when)
+    if month in HISTORY_PARTITIONS:
+        return
+    # Committing here would also commit someone else's open transaction
+    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SET LOCAL lock_timeout = %s", (HISTORY_PARTITION_LOCK_TIMEOUT,))
+        create_history_partitions(cursor, month)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        logging.getLogger('youtube_harvester').warning(
+            "Could not create history partitions for %s, keeping its rows in the DEFAULT partition: %s",
+            f"{month:%Y-%m}", e
+        )
+    HISTORY_PARTITIONS.add(month)
+
+def record_history(cursor, table, rows, captured_at=None):
+    captured_at = captured_at or datetime.now()
+    entity, snapshots = history_snapshot(table, rows, captured_at)
+    if not snapshots:
+        return
+    _, key, metrics = HISTORY_TABLES[entity]
+    source = f"(VALUES %s) AS s(captured_at, {key}, {', '.join(metrics)})"
+    execute_values(cursor, history_insert_sql(entity, source), snapshots,
+                   template=f"(%s::TIMESTAMP, {', '.join(['%s'] * (len(metrics) + 1))})", page_size=1000)
+
+# Seeds the history with the counters already stored when it is first created
+def backfill_history(cursor):
+    captured_at = datetime.now()
+    create_history_partitions(cursor, captured_at)
+    for entity, (history, key, metrics) in HISTORY_TABLES.items():
+        cursor.execute(
+            f"INSERT INTO {history} ({key}, captured_at, {', '.join(metrics)}) "
+            f"SELECT {key}, %s, {', '.join(metrics)} FROM {entity}",
+            (captured_at,)
+        )
+
+def history_cutoffs(now=None):
+    now = now or datetime.now()
+    return [(now - timedelta(seconds=age), bucket) for age, bucket in HISTORY_DOWNSAMPLE_TIERS]
+
+# Keeps the last snapshot per entity and bucket for snapshots older than the cutoff
+def downsample_history_sql(entity, bucket):
+    history, key, _ = HISTORY_TABLES[entity]
+    return f'''
+        DELETE FROM {history}
+        USING (
+            SELECT {key} AS entity_id, date_trunc('{bucket}', captured_at) AS bucket, MAX(captured_at) AS keep_at
+            FROM {history}
+            WHERE captured_at < %(cutoff)s
+            GROUP BY 1, 2
+            HAVING COUNT(*) > 1
+        ) AS k
+        WHERE {history}.{key} = k.entity_id
+          AND date_trunc('{bucket}', {history}.captured_at) = k.bucket
+          AND {history}.captured_at < k.keep_at
+    '''
+
+def downsample_history(cursor, now=None):
+    deleted = {}
+    for entity in HISTORY_TABLES:
+        deleted[entity] = 0
+        for cutoff, bucket in history_cutoffs(now):
+            cursor.execute(downsample_history_sql(entity, bucket), {'cutoff': cutoff})
+            deleted[entity] += cursor.rowcount
+    return deleted
+
+def check_history_metric(entity, metric, bucket='day'):
+    if entity not in HISTORY_TABLES or metric not in HISTORY_TABLES[entity][2]:
+        raise ValueError(f"No history is kept for {entity} {metric}")
+    if bucket not in HISTORY_BUCKETS:
+        raise ValueError(f"Unknown history bucket {bucket}")
+
+# One row per bucket: the highest value seen and the gain over the previous bucket
+def stats_series_query(entity, metric, bucket='day'):
+    check_history_metric(entity, metric, bucket)
+    history, key, _ = HISTORY_TABLES[entity]
+    return f'''
+        SELECT bucket, value, value - LAG(value) OVER (ORDER BY bucket) AS gain
+        FROM (
+            SELECT date_trunc('{bucket}', captured_at) AS bucket, MAX({metric}) AS value
+            FROM {history}
+            WHERE {key} = %(entity_id)s AND captured_at >= %(start)s AND captured_at < %(end)s
+            GROUP BY 1
+        ) AS buckets
+        ORDER BY bucket
+    '''
+
+# Gain over the window, measured from the last snapshot before it when there
+# is one and from the first snapshot inside it otherwise
+def top_gainers_query(entity, metric, limit=ANALYTICS_TOP_N):
+    check_history_metric(entity, metric)
+    history, key, _ = HISTORY_TABLES[entity]
+    if entity == 'videos':
+        names = "v.title AS video_name, c.channel_name"
+        join = "JOIN videos v ON v.video_id = w.entity_id JOIN channels c ON c.channel_id = v.channel_id"
+    else:
+        names = "c.channel_name"
+        join = "JOIN channels c ON c.channel_id = w.entity_id"
+    return f'''
+        WITH in_window AS (
+            SELECT {key} AS entity_id, MIN({metric}) AS earliest, MAX({metric}) AS latest
+            FROM {history}
+            WHERE captured_at >= %(start)s AND captured_at < %(end)s
+            GROUP BY {key}
+        ),
+        baseline AS (
+            SELECT DISTINCT ON ({key}) {key} AS entity_id, {metric} AS value
+            FROM {history}
+            WHERE captured_at < %(start)s AND {key} IN (SELECT entity_id FROM in_window)
+            ORDER BY {key}, captured_at DESC
+        )
+        SELECT {names}, w.latest - COALESCE(b.value, w.earliest) AS gain, w.latest AS {metric}
+        FROM in_window w
+        LEFT JOIN baseline b ON b.entity_id = w.entity_id
+        {join}
+        ORDER BY gain DESC
+        LIMIT {int(limit)}
+    '''
+
+def create_tables():
+    conn = get_db_connection()
+    if not conn:
+        return False
+    
+    try:
+        cursor = conn.cursor()
+        
+        # Channels table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id VARCHAR(255) PRIMARY KEY,
+            channel_name VARCHAR(255),
+            subscriber_count BIGINT,
+            view_count BIGINT,
+            video_count INTEGER,
+            playlist_id VARCHAR(255),
+            description TEXT
+        )
+        ''')
+        
+        # Videos table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id VARCHAR(255) PRIMARY KEY,
+            channel_id VARCHAR(255) REFERENCES channels(channel_id),
+            title VARCHAR(255),
+            description TEXT,
+            tags TEXT,
+            published_at TIMESTAMP,
+            view_count BIGINT,
+            like_count BIGINT,
+            favorite_count INTEGER,
+            comment_count INTEGER,
+            duration VARCHAR(50),
+            definition VARCHAR(50),
+            caption VARCHAR(50)
+        )
+        ''')
+
+        # Comments table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS comments (
+            comment_id VARCHAR(255) PRIMARY KEY,
+            video_id VARCHAR(255) REFERENCES videos(video_id),
+            parent_id VARCHAR(255),
+            comment_text TEXT,
+            author_name VARCHAR(255),
+            published_at TIMESTAMP
+        )
+        ''')
+        cursor.execute("ALTER TABLE comments ADD COLUMN IF NOT EXISTS parent_id VARCHAR(255)")
+
+        # Harvest jobs and their resume checkpoints
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS harvest_jobs (
+            job_id SERIAL PRIMARY KEY,
+            channel_ids TEXT[] NOT NULL,
+            options JSONB NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            checkpoint JSONB NOT NULL DEFAULT '{}',
+            progress_message TEXT,
+            results JSONB,
+            error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''')
+
+        # Incremental sync watermarks
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS channel_sync_state (
+            channel_id VARCHAR(255) PRIMARY KEY REFERENCES channels(channel_id),
+            last_published_at TIMESTAMP,
+            last_synced_at TIMESTAMP,
+            stats_refreshed_at TIMESTAMP
+        )
+        ''')
+
+        apply_schema_migrations(cursor)
+
+        conn.commit()
+        return True
+    except Exception as e:
+        st.error(f"Error creating tables: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+# Upsert statements shared by the single-row and bulk writers
+UPSERT_SQL = {
+    'channels': '''
+        INSERT INTO channels (
+            channel_name, channel_id, subscriber_count,
+            view_count, video_count, playlist_id, description
+        ) VALUES %s
+        ON CONFLICT (channel_id) DO UPDATE SET
+            subscriber_count = EXCLUDED.subscriber_count,
+            view_count = EXCLUDED.view_count,
+            video_count = EXCLUDED.video_count
+    ''',
+    'videos': '''
+        INSERT INTO videos (
+            video_id, channel_id, title, description, tags,
+            published_at, view_count, like_count,
+            favorite_count, comment_count, duration, definition, caption
+        ) VALUES %s
+        ON CONFLICT (video_id) DO UPDATE SET
+            view_count = EXCLUDED.view_count,
+            like_count = EXCLUDED.like_count,
+            favorite_count = EXCLUDED.favorite_count,
+            comment_count = EXCLUDED.comment_count
+    ''',
+    'comments': '''
+        INSERT INTO comments (
+            comment_id, video_id, parent_id, comment_text,
+            author_name, published_at
+        ) VALUES %s
+        ON CONFLICT (comment_id) DO NOTHING
+    ''',
+    # Statistics-only refresh of videos that are already stored
+    'video_stats': '''
+        UPDATE videos SET
+            view_count = s.view_count,
+            like_count = s.like_count,
+            favorite_count = s.favorite_count,
+            comment_count = s.comment_count
+        FROM (VALUES %s) AS s(video_id, view_count, like_count, favorite_count, comment_count)
+        WHERE videos.video_id = s.video_id
+    '''
+}
+
+# Used when copying sync state between stores; watermarks only move forward
+UPSERT_SQL['channel_sync_state'] = '''
+    INSERT INTO channel_sync_state (
+        channel_id, last_published_at, last_synced_at, stats_refreshed_at
+    ) VALUES %s
+    ON CONFLICT (channel_id) DO UPDATE SET
+        last_published_at = GREATEST(channel_sync_state.last_published_at, EXCLUDED.last_published_at),
+        last_synced_at = GREATEST(channel_sync_state.last_synced_at, EXCLUDED.last_synced_at),
+        stats_refreshed_at = GREATEST(channel_sync_state.stats_refreshed_at, EXCLUDED.stats_refreshed_at)
+'''
+
+# Flush order respects the foreign keys between tables
+TABLE_ORDER = ('channels', 'videos', 'comments', 'video_stats')
+
+# Column order of each table's write rows, as produced by the row builders
+STORE_COLUMNS = {
+    'channels': [
+        'channel_name', 'channel_id', 'subscriber_count',
+        'view_count', 'video_count', 'playlist_id', 'description'
+    ],
+    'videos': VIDEO_COLUMNS,
+    'comments': COMMENT_COLUMNS,
+    'video_stats': VIDEO_STATS_COLUMNS,
+    'channel_sync_state': ['channel_id', 'last_published_at', 'last_synced_at', 'stats_refreshed_at']
+}
+
+def channel_row(channel_data):
+    return (
+        channel_data['channelName'],
+        channel_data['channelid'],
+        channel_data['subscribers'],
+        channel_data['views'],
+        channel_data['totalVideos'],
+        channel_data['playlistId'],
+        channel_data['channel_description']
+    )
+
+# Buffers rows per table and writes them in one transaction per flush
+class BulkWriter:
+    def __init__(self, conn=None, flush_rows=BULK_FLUSH_ROWS, flush_interval=BULK_FLUSH_SECONDS,
+                 before_commit=None, refresh_summaries=True, metrics=None, store=None):
+        self.store = store or get_store()
+        self.conn = conn or self.store.connect()
+        if not self.conn:
+            raise RuntimeError("Could not open a database connection for the bulk writer")
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        # Called with the flush cursor so extra state commits with the rows
+        self.before_commit = before_commit
+        self.refresh_summaries = refresh_summaries
+        self.metrics = metrics or get_harvest_metrics()
+        # Keyed by primary key so one flush never upserts the same row twice
+        self.buffers = {table: {} for table in TABLE_ORDER}
+        # Run once the rows added before them are committed
+        self.callbacks = []
+        self.rows_written = {table: 0 for table in TABLE_ORDER}
+        self.failed_flushes = 0
+        self.last_flush = time.monotonic()
+        # Comment fetch workers stream rows in from their own threads
+        self.lock = threading.RLock()
+
+    def add_channel(self, channel_data):
+        self._add('channels', channel_row(channel_data))
+
+    # Takes a parsed page whose columns follow the table's insert order
+    def add_frame(self, table, frame):
+        key_index = 1 if table == 'channels' else 0
+        rows = frame.itertuples(index=False, name=None)
+        with self.lock:
+            self.buffers[table].update((row[key_index], row) for row in rows)
+            self.maybe_flush()
+
+    def _add(self, table, row):
+        key = row[1] if table == 'channels' else row[0]
+        with self.lock:
+            self.buffers[table][key] = row
+            self.maybe_flush()
+
+    def add_callback(self, callback):
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def pending(self):
+        return sum(len(rows) for rows in self.buffers.values())
+
+    def maybe_flush(self):
+        with self.lock:
+            if (self.pending() >= self.flush_rows or
+                    time.monotonic() - self.last_flush >= self.flush_interval):
+                return self.flush()
+            return True
+
+    def flush(self):
+        with self.lock:
+            return self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending() and not self.callbacks and not self.before_commit:
+            return True
+
+        buffers, callbacks = self.buffers, self.callbacks
+        self.buffers = {table: {} for table in TABLE_ORDER}
+        self.callbacks = []
+        captured_at = datetime.now()
+        try:
+            if any(buffers[table] for table in HISTORY_SOURCES):
+                self.store.ensure_partitions(self.conn, captured_at)
+            cursor = self.conn.cursor()
+            for table in TABLE_ORDER:
+                rows = list(buffers[table].values())
+                if rows:
+                    if table in HISTORY_SOURCES:
+                        with self.metrics.timer('harvest_db_write_seconds', table='history'):
+                            self.store.record_history(cursor, table, rows, captured_at)
+                    with self.metrics.timer('harvest_db_write_seconds', table=table):
+                        self.store.write_rows(cursor, table, rows)
+                        self.store.record_refreshes(cursor, table, rows, captured_at)
+            # Summaries change in the same transaction as the rows behind them
+            if self.refresh_summaries and (buffers['channels'] or buffers['videos'] or buffers['video_stats']):
+                with self.metrics.timer('harvest_db_write_seconds', table='analytics'):
+                    self.store.refresh_summaries(cursor, buffers)
+            if self.before_commit:
+                self.before_commit(cursor)
+            with self.metrics.timer('harvest_db_write_seconds', table='commit'):
+                self.conn.commit()
+            # After a failed flush the checkpoint stays where it was, since a
+            # later cursor or finished video may sit on top of the lost rows
+            if not self.failed_flushes:
+                for callback in callbacks:
+                    callback()
+            for table in TABLE_ORDER:
+                self.rows_written[table] += len(buffers[table])
+                if buffers[table]:
+                    self.metrics.inc('harvest_rows_written_total', len(buffers[table]), table=table)
+            return True
+        except Exception as e:
+            try:
+                self.conn.rollback()
+            except Exception:
+                # A dropped connection has nothing left to roll back
+                pass
+            self.failed_flushes += 1
+            self.metrics.inc('harvest_failed_flushes_total')
+            st.error(f"Error writing batch to database: {str(e)}")
+            return False
+
+    def close(self):
+        try:
+            return self.flush()
+        finally:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+# Incremental Sync State
+def get_sync_state(channel_id):
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT last_published_at, last_synced_at, stats_refreshed_at
+            FROM channel_sync_state WHERE channel_id = %s
+        ''', (channel_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'last_published_at': row[0],
+            'last_synced_at': row[1],
+            'stats_refreshed_at': row[2]
+        }
+    except Exception as e:
+        st.error(f"Error reading sync state: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def store_sync_state(channel_id, last_published_at, stats_refreshed):
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO channel_sync_state (
+                channel_id, last_published_at, last_synced_at, stats_refreshed_at
+            ) VALUES (%s, %s, NOW(), CASE WHEN %s THEN NOW() END)
+            ON CONFLICT (channel_id) DO UPDATE SET
+                last_published_at = GREATEST(
+                    channel_sync_state.last_published_at, EXCLUDED.last_published_at
+                ),
+                last_synced_at = EXCLUDED.last_synced_at,
+                stats_refreshed_at = COALESCE(
+                    EXCLUDED.stats_refreshed_at, channel_sync_state.stats_refreshed_at
+                )
+        ''', (channel_id, last_published_at, stats_refreshed))
+        conn.commit()
+        return True
+    except Exception as e:
+        st.error(f"Error storing sync state: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+def get_channel_video_ids(channel_id):
+    conn = get_db_connection()
+    if not conn:
+        return []
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT video_id FROM videos WHERE channel_id = %s", (channel_id,))
+        return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        st.error(f"Error reading stored videos: {str(e)}")
+        return []
+    finally:
+        conn.close()
+
+def stats_refresh_due(sync_state, now=None):
+    if not sync_state or not sync_state['stats_refreshed_at']:
+        return True
+    now = now or datetime.now()
+    return (now - sync_state['stats_refreshed_at']).total_seconds() >= STATS_REFRESH_SECONDS
+
+# Storage Backends
+# Both stores expose the same create/write/query/sync-state calls, so the
+# harvest engine and the canned analyses do not care which one is in use
+class PostgresStore:
+    name = 'postgres'
+
+    def connect(self):
+        return get_db_connection()
+
+    def create_tables(self):
+        return create_tables()
+
+    def write_rows(self, cursor, table, rows):
+        execute_values(cursor, UPSERT_SQL[table], rows, page_size=1000)
+
+    def refresh_summaries(self, cursor, buffers=None):
+        if buffers:
+            refresh_analytics(cursor, affected_channels(cursor, buffers), buffers)
+        else:
+            refresh_analytics(cursor)
+
+    def ensure_partitions(self, conn, when):
+        ensure_history_partitions(conn, when)
+
+    def record_history(self, cursor, table, rows, captured_at=None):
+        record_history(cursor, table, rows, captured_at)
+
+    def record_refreshes(self, cursor, table, rows, captured_at):
+        record_video_refreshes(cursor, table, rows, captured_at)
+
+    def downsample_history(self, now=None):
+        conn = get_db_connection()
+        if not conn:
+            return None
+
+        try:
+            deleted = downsample_history(conn.cursor(), now)
+            conn.commit()
+            return deleted
+        except Exception as e:
+            conn.rollback()
+            st.error(f"Error downsampling history: {str(e)}")
+            return None
+        finally:
+            conn.close()
+
+    def analysis_query(self, question):
+        return get_analysis_query(question)
+
+    def read_query(self, query, params=None):
+        return execute_analysis_query(query, params)
+
+    def stats_series(self, entity, entity_id, metric, start, end, bucket='day'):
+        return self.read_query(stats_series_query(entity, metric, bucket),
+                               {'entity_id': entity_id, 'start': start, 'end': end})
+
+    def top_gainers(self, entity, metric, start, end, limit=ANALYTICS_TOP_N):
+        return self.read_query(top_gainers_query(entity, metric, limit), {'start': start, 'end': end})
+
+    def search(self, kind, text, after=None):
+        return search_page(kind, text, after)
+
+    def get_sync_state(self, channel_id):
+        return get_sync_state(channel_id)
+
+    def store_sync_state(self, channel_id, last_published_at, stats_refreshed):
+        return store_sync_state(channel_id, last_published_at, stats_refreshed)
+
+    def get_channel_video_ids(self, channel_id):
+        return get_channel_video_ids(channel_id)
+
+    def delete_table(self, table_name):
+        return delete_table_data(table_name)
+
+    def delete_all(self):
+        return delete_all_data()
+
+    # Streams a table in write-row order through a server-side cursor
+    def iter_table(self, conn, table, chunk_rows=STORE_SYNC_CHUNK_ROWS):
+        cursor = conn.cursor(name=f"sync_{table}")
+        cursor.itersize = chunk_rows
+        cursor.execute(sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(map(sql.Identifier, STORE_COLUMNS[table])),
+            sql.Identifier(table)
+        ))
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+DUCKDB_TABLES = {
+    'channels': '''
+        CREATE TABLE IF NOT EXISTS channels (
+            channel_id VARCHAR PRIMARY KEY,
+            channel_name VARCHAR,
+            subscriber_count BIGINT,
+            view_count BIGINT,
+            video_count INTEGER,
+            playlist_id VARCHAR,
+            description VARCHAR
+        )
+    ''',
+    'videos': '''
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id VARCHAR PRIMARY KEY,
+            channel_id VARCHAR,
+            title VARCHAR,
+            description VARCHAR,
+            tags VARCHAR[],
+            published_at TIMESTAMP,
+            view_count BIGINT,
+            like_count BIGINT,
+            favorite_count INTEGER,
+            comment_count INTEGER,
+            duration INTEGER,
+            definition VARCHAR,
+            caption VARCHAR
+        )
+    ''',
+    'comments': '''
+        CREATE TABLE IF NOT EXISTS comments (
+            comment_id VARCHAR PRIMARY KEY,
+            video_id VARCHAR,
+            parent_id VARCHAR,
+            comment_text VARCHAR,
+            author_name VARCHAR,
+            published_at TIMESTAMP
+        )
+    ''',
+    'channel_sync_state': '''
+        CREATE TABLE IF NOT EXISTS channel_sync_state (
+            channel_id VARCHAR PRIMARY KEY,
+            last_published_at TIMESTAMP,
+            last_synced_at TIMESTAMP,
+            stats_refreshed_at TIMESTAMP
+        )
+    ''',
+    # Columnar storage compresses the history well enough without partitions
+    'channel_stats_history': '''
+        CREATE TABLE IF NOT EXISTS channel_stats_history (
+            channel_id VARCHAR NOT NULL,
+            captured_at TIMESTAMP NOT NULL,
+            subscriber_count BIGINT,
+            view_count BIGINT,
+            video_count INTEGER
+        )
+    ''',
+    'video_stats_history': '''
+        CREATE TABLE IF NOT EXISTS video_stats_history (
+            video_id VARCHAR NOT NULL,
+            captured_at TIMESTAMP NOT NULL,
+            view_count BIGINT,
+            like_count BIGINT,
+            comment_count BIGINT
+        )
+    '''
+}
+
+DUCKDB_COLUMN_TYPES = {
+    'subscriber_count': 'BIGINT', 'view_count': 'BIGINT', 'like_count': 'BIGINT',
+    'video_count': 'INTEGER', 'favorite_count': 'INTEGER', 'comment_count': 'INTEGER',
+    'duration': 'INTEGER', 'tags': 'VARCHAR[]', 'published_at': 'TIMESTAMP',
+    'last_published_at': 'TIMESTAMP', 'last_synced_at': 'TIMESTAMP',
+    'stats_refreshed_at': 'TIMESTAMP'
+}
+
+# Same semantics as UPSERT_SQL, reading from the staged batch
+DUCKDB_UPSERT_SQL = {
+    'channels': '''
+        INSERT INTO channels BY NAME SELECT {columns} FROM staged
+        ON CONFLICT (channel_id) DO UPDATE SET
+            subscriber_count = excluded.subscriber_count,
+            view_count = excluded.view_count,
+            video_count = excluded.video_count
+    ''',
+    'videos': '''
+        INSERT INTO videos BY NAME SELECT {columns} FROM staged
+        ON CONFLICT (video_id) DO UPDATE SET
+            view_count = excluded.view_count,
+            like_count = excluded.like_count,
+            favorite_count = excluded.favorite_count,
+            comment_count = excluded.comment_count
+    ''',
+    'comments': '''
+        INSERT INTO comments BY NAME SELECT {columns} FROM staged
+        ON CONFLICT (comment_id) DO NOTHING
+    ''',
+    'video_stats': '''
+        UPDATE videos SET
+            view_count = s.view_count,
+            like_count = s.like_count,
+            favorite_count = s.favorite_count,
+            comment_count = s.comment_count
+        FROM (SELECT {columns} FROM staged) AS s
+        WHERE videos.video_id = s.video_id
+    ''',
+    'channel_sync_state': '''
+        INSERT INTO channel_sync_state BY NAME SELECT {columns} FROM staged
+        ON CONFLICT (channel_id) DO UPDATE SET
+            last_published_at = greatest(channel_sync_state.last_published_at, excluded.last_published_at),
+            last_synced_at = greatest(channel_sync_state.last_synced_at, excluded.last_synced_at),
+            stats_refreshed_at = greatest(channel_sync_state.stats_refreshed_at, excluded.stats_refreshed_at)
+    '''
+}
+
+# The columnar engine aggregates the base tables directly, so the embedded
+# store needs no summary tables
+DUCKDB_ANALYSIS_QUERIES = {
+    '1': '''
+        SELECT v.title AS video_name, c.channel_name
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY c.channel_name, v.title
+    ''',
+    '2': '''
+        SELECT c.channel_name, COUNT(v.video_id) AS video_count
+        FROM channels c
+        LEFT JOIN videos v ON v.channel_id = c.channel_id
+        GROUP BY c.channel_id, c.channel_name
+        ORDER BY video_count DESC
+    ''',
+    '3': f'''
+        SELECT v.title AS video_name, c.channel_name, v.view_count
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY v.view_count DESC
+        LIMIT {ANALYTICS_TOP_N}
+    ''',
+    '4': '''
+        SELECT v.title AS video_name, c.channel_name, v.comment_count
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY v.comment_count DESC
+    ''',
+    '5': f'''
+        SELECT v.title AS video_name, c.channel_name, v.like_count
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY v.like_count DESC
+        LIMIT {ANALYTICS_TOP_N}
+    ''',
+    '6': '''
+        SELECT v.title AS video_name, c.channel_name, v.like_count
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY v.like_count DESC
+    ''',
+    '7': '''
+        SELECT channel_name, view_count AS total_views
+        FROM channels
+        ORDER BY view_count DESC
+    ''',
+    '8': '''
+        SELECT
+            c.channel_name AS "Channel Name",
+            year(v.published_at) AS "Year",
+            COUNT(*) AS "Videos Published",
+            SUM(v.view_count) AS "Total Views",
+            list(v.title) AS "Video Titles"
+        FROM channels c
+        JOIN videos v ON v.channel_id = c.channel_id
+        GROUP BY c.channel_id, c.channel_name, year(v.published_at)
+        ORDER BY "Year" DESC, "Videos Published" DESC
+    ''',
+    '9': '''
+        SELECT c.channel_name, AVG(v.duration) / 60.0 AS avg_duration_minutes
+        FROM channels c
+        JOIN videos v ON v.channel_id = c.channel_id
+        GROUP BY c.channel_id, c.channel_name
+        ORDER BY avg_duration_minutes DESC
+    ''',
+    '10': f'''
+        SELECT v.title AS video_name, c.channel_name, v.comment_count
+        FROM videos v
+        JOIN channels c ON v.channel_id = c.channel_id
+        ORDER BY v.comment_count DESC
+        LIMIT {ANALYTICS_TOP_N}
+    '''
+}
+
+# Mimics the psycopg2 connection calls the writers use: an open transaction
+# that commit/rollback end and immediately reopen
+class DuckDBConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.begin()
+
+    def cursor(self):
+        return self.conn
+
+    def commit(self):
+        self.conn.commit()
+        self.conn.begin()
+
+    def rollback(self):
+        self.conn.rollback()
+        self.conn.begin()
+
+    def close(self):
+        self.conn.close()
+
+class DuckDBStore:
+    name = 'duckdb'
+
+    def __init__(self, path=DUCKDB_PATH):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("The duckdb storage backend requires the duckdb package")
+        self.path = path
+        self.db = duckdb.connect(path)
+
+    # Each caller gets its own cursor; DuckDB cursors are safe to use per thread
+    def connect(self):
+        return DuckDBConnection(self.db.cursor())
+
+    def _run(self, action, label, default):
+        cursor = self.db.cursor()
+        try:
+            return action(cursor)
+        except Exception as e:
+            st.error(f"Error {label}: {str(e)}")
+            return default
+        finally:
+            cursor.close()
+
+    def create_tables(self):
+        def create(cursor):
+            for statement in DUCKDB_TABLES.values():
+                cursor.execute(statement)
+            return True
+        return self._run(create, "creating tables", False)
+
+    def write_rows(self, cursor, table, rows):
+        columns = STORE_COLUMNS[table]
+        # Object columns keep None as NULL instead of turning ints into NaN floats
+        staged = pd.DataFrame({
+            column: pd.Series([row[i] for row in rows], dtype=object)
+            for i, column in enumerate(columns)
+        })
+        select = ', '.join(
+            f"CAST({column} AS {DUCKDB_COLUMN_TYPES.get(column, 'VARCHAR')}) AS {column}"
+            for column in columns
+        )
+        cursor.register('staged', staged)
+        try:
+            cursor.execute(DUCKDB_UPSERT_SQL[table].format(columns=select))
+        finally:
+            cursor.unregister('staged')
+
+    def refresh_summaries(self, cursor, buffers=None):
+        pass
+
+    # History is not partitioned here
+    def ensure_partitions(self, conn, when):
+        pass
+
+    # The refresh scheduler only runs against Postgres
+    def record_refreshes(self, cursor, table, rows, captured_at):
+        pass
+
+    def record_history(self, cursor, table, rows, captured_at=None):
+        entity, snapshots = history_snapshot(table, rows, captured_at or datetime.now())
+        if not snapshots:
+            return
+        _, key, metrics = HISTORY_TABLES[entity]
+        staged = pd.DataFrame({
+            column: pd.Series([row[i] for row in snapshots], dtype=object)
+            for i, column in enumerate(('captured_at', key) + metrics)
+        })
+        source = f"(SELECT CAST(captured_at AS TIMESTAMP) AS captured_at, {key}, {', '.join(metrics)} FROM history_staged) AS s"
+        cursor.register('history_staged', staged)
+        try:
+            cursor.execute(history_insert_sql(entity, source))
+        finally:
+            cursor.unregister('history_staged')
+
+    def downsample_history(self, now=None):
+        def downsample(cursor):
+            deleted = {}
+            for entity in HISTORY_TABLES:
+                deleted[entity] = 0
+                for cutoff, bucket in history_cutoffs(now):
+                    query, values = self._params(downsample_history_sql(entity, bucket), {'cutoff': cutoff})
+                    deleted[entity] += cursor.execute(query, values).fetchone()[0]
+            return deleted
+        return self._run(downsample, "downsampling history", None)
+
+    def analysis_query(self, question):
+        return DUCKDB_ANALYSIS_QUERIES.get(question.split('.')[0])
+
+    # Rewrites the psycopg2 named placeholders the shared queries use
+    def _params(self, query, params):
+        if not params:
+            return query, None
+        for name in params:
+            query = query.replace(f"%({name})s", f"${name}")
+        return query, params
+
+    def read_query(self, query, params=None):
+        query, values = self._params(query, params)
+        return self._run(lambda cursor: cursor.execute(query, values).df(), "executing query", None)
+
+    def stats_series(self, entity, entity_id, metric, start, end, bucket='day'):
+        return self.read_query(stats_series_query(entity, metric, bucket),
+                               {'entity_id': entity_id, 'start': start, 'end': end})
+
+    def top_gainers(self, entity, metric, start, end, limit=ANALYTICS_TOP_N):
+        return self.read_query(top_gainers_query(entity, metric, limit), {'start': start, 'end': end})
+
+    # Unindexed: every term must appear somewhere in the text, and rank
+    # follows the Postgres weights (title over tags over description)
+    def search(self, kind, text, after=None):
+        terms = text.split()
+        params = {f"term{i}": f"%{term.strip(chr(34))}%" for i, term in enumerate(terms)}
+        params.update({
+            'after_rank': after[0] if after else None,
+            'after_id': after[1] if after else None,
+            'limit': SEARCH_PAGE_SIZE + 1
+        })
+        if kind == 'videos':
+            fields = {'v.title': 1.0, "array_to_string(v.tags, ' ')": 0.4, 'v.description': 0.2}
+        else:
+            fields = {'cm.comment_text': 1.0}
+        matches = ' AND '.join(
+            '(' + ' OR '.join(f"{field} ILIKE %(term{i})s" for field in fields) + ')'
+            for i in range(len(terms))
+        )
+        rank = ' + '.join(
+            f"CASE WHEN {field} ILIKE %(term{i})s THEN {weight} ELSE 0 END"
+            for i in range(len(terms)) for field, weight in fields.items()
+        )
+        if kind == 'videos':
+            query = f'''
+                SELECT * FROM (
+                    SELECT v.video_id, CAST({rank} AS REAL) AS rank, v.title, c.channel_name,
+                           v.published_at, v.view_count, left(v.description, 200) AS snippet
+                    FROM videos v JOIN channels c ON c.channel_id = v.channel_id
+                    WHERE {matches}
+                ) AS hits
+                WHERE %(after_rank)s IS NULL OR (rank, video_id) < (%(after_rank)s, %(after_id)s)
+                ORDER BY rank DESC, video_id DESC
+                LIMIT %(limit)s
+            '''
+        else:
+            query = f'''
+                SELECT * FROM (
+                    SELECT cm.comment_id, CAST({rank} AS REAL) AS rank, v.title AS video_title,
+                           cm.author_name, cm.published_at, left(cm.comment_text, 200) AS snippet
+                    FROM comments cm JOIN videos v ON v.video_id = cm.video_id
+                    WHERE {matches}
+                ) AS hits
+                WHERE %(after_rank)s IS NULL OR (rank, comment_id) < (%(after_rank)s, %(after_id)s)
+                ORDER BY rank DESC, comment_id DESC
+                LIMIT %(limit)s
+            '''
+        df = self.read_query(query, params)
+        if df is None:
+            return None, False
+        return df.head(SEARCH_PAGE_SIZE), len(df) > SEARCH_PAGE_SIZE
+
+    def get_sync_state(self, channel_id):
+        def read(cursor):
+            row = cursor.execute('''
+                SELECT last_published_at, last_synced_at, stats_refreshed_at
+                FROM channel_sync_state WHERE channel_id = ?
+            ''', [channel_id]).fetchone()
+            if not row:
+                return None
+            return {
+                'last_published_at': row[0],
+                'last_synced_at': row[1],
+                'stats_refreshed_at': row[2]
+            }
+        return self._run(read, "reading sync state", None)
+
+    def store_sync_state(self, channel_id, last_published_at, stats_refreshed):
+        now = datetime.now()
+        def write(cursor):
+            self.write_rows(cursor, 'channel_sync_state', [
+                (channel_id, last_published_at, now, now if stats_refreshed else None)
+            ])
+            return True
+        return self._run(write, "storing sync state", False)
+
+    def get_channel_video_ids(self, channel_id):
+        def read(cursor):
+            rows = cursor.execute("SELECT video_id FROM videos WHERE channel_id = ?", [channel_id]).fetchall()
+            return [row[0] for row in rows]
+        return self._run(read, "reading stored videos", [])
+
+    def delete_table(self, table_name):
+        def delete(cursor):
+            if table_name == 'channels':
+                cursor.execute("DELETE FROM channel_sync_state")
+            if table_name in HISTORY_TABLES:
+                cursor.execute(f"DELETE FROM {HISTORY_TABLES[table_name][0]}")
+            cursor.execute(f"DELETE FROM {table_name}")
+            return True
+        return self._run(delete, "deleting data", False)
+
+    def delete_all(self):
+        def delete(cursor):
+            for table in ('comments', 'videos', 'channel_sync_state', 'channels',
+                          'video_stats_history', 'channel_stats_history'):
+                cursor.execute(f"DELETE FROM {table}")
+            return True
+        return self._run(delete, "deleting all data", False)
+
+    def iter_table(self, conn, table, chunk_rows=STORE_SYNC_CHUNK_ROWS):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(STORE_COLUMNS[table])} FROM {table}")
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield rows
+
+@st.cache_resource
+def get_store(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend == 'duckdb':
+        return DuckDBStore()
+    if backend == 'postgres':
+        return PostgresStore()
+    raise ValueError(f"Unknown storage backend {backend}")
+
+# Creates and migrates the schema once per process; returns how long that took
+# in milliseconds. A failure is not cached, so the next call tries again.
+@st.cache_resource
+def ensure_schema(backend=None):
+    started = time.perf_counter()
+    if not get_store(backend).create_tables():
+        raise RuntimeError("Could not create the database tables")
+    return round((time.perf_counter() - started) * 1000, 1)
+
+SYNC_TABLES = ('channels', 'videos', 'comments', 'channel_sync_state')
+
+# Copies every table from one store into the other with the harvest's upsert
+# rules, committing per chunk; returns the rows copied per table
+def sync_stores(source, target, chunk_rows=STORE_SYNC_CHUNK_ROWS):
+    if not target.create_tables():
+        return None
+    source_conn = source.connect()
+    target_conn = target.connect()
+    if not source_conn or not target_conn:
+        return None
+
+    copied = {}
+    try:
+        target_cursor = target_conn.cursor()
+        for table in SYNC_TABLES:
+            copied[table] = 0
+            for rows in source.iter_table(source_conn, table, chunk_rows):
+                target.write_rows(target_cursor, table, rows)
+                target_conn.commit()
+                copied[table] += len(rows)
+        target.refresh_summaries(target_cursor)
+        target_conn.commit()
+        return copied
+    except Exception as e:
+        target_conn.rollback()
+        st.error(f"Error syncing {source.name} into {target.name}: {str(e)}")
+        return None
+    finally:
+        source_conn.close()
+        target_conn.close()
+
+# Harvest Engine
+def default_client_factory():
+    return get_api_key_pool().client()
+
+# Engine-wide limits: the per-key limits in the pool times the number of keys.
+# One per process, like the pool itself, so concurrent harvests and the refresh
+# scheduler share it instead of each adding the whole pool's rate again. Since
+# it only sums the keys' limits, the per-key limiters are the ones that pace
+# requests; this one caps and counts the process as a whole.
+@st.cache_resource
+def pool_rate_limiter():
+    key_count = len(get_api_key_pool().api_keys)
+    return QuotaRateLimiter(API_REQUESTS_PER_SECOND * key_count, API_DAILY_QUOTA * key_count)
+
+def streamlit_worker_initializer():
+    # Lets st.error/st.warning calls from worker threads reach the current page
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return lambda: add_script_run_ctx(threading.current_thread(), ctx)
+
+# Harvest Pipeline
+# Channel lookup, playlist paging, video details, comments and database writes
+# run as separate stages joined by bounded queues: every stage works at once,
+# and a stage that gets ahead blocks on a full queue instead of buffering a
+# whole channel in memory. The writer stage is the only one that touches the
+# database, so API threads never wait on a commit. Queue sizes are set by
+# PIPELINE_QUEUE_SIZES.
+STAGE_DONE = object()
+
+class PipelineStage:
+    def __init__(self, name, handler, workers, maxsize=0, on_error=None, idle=None,
+                 idle_seconds=None, worker_initializer=None, metrics=None):
+        self.name = name
+        self.handler = handler
+        self.metrics = metrics or get_harvest_metrics()
+        self.queue = queue.Queue(maxsize)
+        self.on_error = on_error
+        # Called when no item arrives for idle_seconds
+        self.idle = idle
+        self.idle_seconds = idle_seconds
+        self.worker_initializer = worker_initializer
+        # Set when a worker thread dies, so producers stop waiting on this stage
+        self.error = None
+        self.threads = [
+            threading.Thread(target=self._run, name=f"harvest-{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    # Blocks while the queue is full; the wait is charged to the producing stage.
+    # Raises once the stage has died, since nothing would ever drain the queue.
+    def put(self, item, source=None):
+        started = time.monotonic()
+        self._put(item)
+        if source:
+            self.metrics.inc('harvest_stage_blocked_seconds_total', time.monotonic() - started, stage=source)
+        self.metrics.set_gauge('harvest_stage_queue_depth', self.queue.qsize(), stage=self.name)
+
+    def _put(self, item):
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Pipeline stage {self.name} stopped: {self.error}")
+            try:
+                self.queue.put(item, timeout=PIPELINE_REPORT_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def _next(self):
+        while True:
+            try:
+                return self.queue.get(timeout=self.idle_seconds if self.idle else None)
+            except queue.Empty:
+                # Idle work (the writer's timed flush) fails like any item would
+                try:
+                    self.idle()
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(None, e)
+
+    def _run(self):
+        try:
+            if self.worker_initializer:
+                self.worker_initializer()
+            while True:
+                item = self._next()
+                self.metrics.set_gauge('harvest_stage_queue_depth', self.queue.qsize(), stage=self.name)
+                if item is STAGE_DONE:
+                    return
+                started = time.monotonic()
+                try:
+                    self.handler(item)
+                except Exception as e:
+                    if self.on_error:
+                        self.on_error(item, e)
+                finally:
+                    self.metrics.inc('harvest_stage_busy_seconds_total', time.monotonic() - started, stage=self.name)
+                    self.metrics.inc('harvest_stage_items_total', stage=self.name)
+        except Exception as e:
+            self.error = e
+            logging.exception("Pipeline stage %s stopped", self.name)
+
+    # Called once every upstream stage has finished, so nothing new can arrive
+    def close(self, on_wait=None):
+        for _ in self.threads:
+            try:
+                self._put(STAGE_DONE)
+            except RuntimeError:
+                break
+        for thread in self.threads:
+            while thread.is_alive():
+                thread.join(PIPELINE_REPORT_SECONDS)
+                if on_wait:
+                    on_wait()
+        self.metrics.set_gauge('harvest_stage_queue_depth', 0, stage=self.name)
+
+# API threads per stage; comments need the most calls, so they get max_workers
+def pipeline_workers(max_workers, channel_count):
+    share = max(1, max_workers // 4)
+    return {
+        'channels': max(1, min(share, channel_count)),
+        'playlist': max(1, min(share, channel_count)),
+        'videos': max(1, max_workers // 2),
+        'comments': max(1, max_workers)
+    }
+
+def harvest_channels(channel_ids, progress_text, client_factory=default_client_factory,
+                     max_workers=HARVEST_WORKERS, limiter=None, worker_initializer=None,
+                     writer=None, incremental=False, max_comments=MAX_COMMENTS_PER_VIDEO,
+                     include_replies=INCLUDE_COMMENT_REPLIES, comment_budget=None,
+                     checkpoint=None, executor=None, metrics=None, store=None, video_batch=False):
+    # video_batch: the checkpoint already lists the videos to fetch, and the
+    # channel's watermark and statistics refresh are left to the coordinator
+    store = store or get_store()
+    limiter = limiter or pool_rate_limiter()
+    metrics = metrics or get_harvest_metrics()
+    executor = executor or RequestExecutor(metrics=metrics)
+    metrics.start_harvest()
+    results = {channel_id: False for channel_id in channel_ids}
+    if writer is None:
+        try:
+            # A channel split into batches gets its summaries once, when the
+            # last batch is done, instead of once per flush of every batch
+            writer = BulkWriter(before_commit=checkpoint.save if checkpoint else None,
+                                refresh_summaries=not video_batch, metrics=metrics, store=store)
+        except RuntimeError as e:
+            st.error(str(e))
+            return results
+    local = threading.local()
+
+    # Discovery clients are not thread-safe, so each worker builds its own.
+    # Every retry passes the rate limiter again, since it costs quota too.
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = RetryingClient(RateLimitedClient(client_factory(), limiter, metrics), executor)
+        return local.client
+
+    budget = CommentBudget(comment_budget) if comment_budget is not None else None
+    state_lock = threading.Lock()
+    counts = {'total_videos': 0, 'processed_videos': 0}
+    newest_published = {}
+    stats_refreshed = set()
+
+    def channel_failed(item, error):
+        st.error(f"Error processing channel {item[0]}: {str(error)}")
+        results[item[0]] = False
+
+    # Once another worker owns the job, the rest of the work is theirs
+    def lease_lost():
+        return checkpoint is not None and checkpoint.lost
+
+    def write_failed(item, error):
+        st.error(f"Error writing batch to database: {str(error)}")
+        writer.failed_flushes += 1
+
+    def fetch_channel(item):
+        channel_id, = item
+        result = get_channel_stats(client(), channel_id)
+        if not result:
+            st.error(f"Could not fetch data for channel {channel_id}")
+            return
+        writer_stage.put(('channels', result), 'channels')
+        results[channel_id] = True
+        if video_batch:
+            playlist_stage.put((channel_id, result['playlistId'], None), 'channels')
+            return
+        sync_state = store.get_sync_state(channel_id) if incremental else None
+        since = sync_state['last_published_at'] if sync_state else None
+        playlist_stage.put((channel_id, result['playlistId'], since), 'channels')
+
+        # A full sync fetches fresh statistics for every video anyway
+        if not sync_state:
+            stats_refreshed.add(channel_id)
+
+        # Known videos only get a statistics refresh, on its own cadence
+        elif stats_refresh_due(sync_state):
+            stats_refreshed.add(channel_id)
+            known_ids = store.get_channel_video_ids(channel_id)
+            for batch in chunk_list(known_ids, VIDEO_BATCH_SIZE):
+                video_stage.put((channel_id, 'stats', batch), 'channels')
+
+    # Hands each playlist page on as soon as it arrives
+    def list_videos(item):
+        channel_id, playlist_id, since = item
+        if lease_lost():
+            return
+        listed = []
+
+        def emit(video_ids):
+            listed.extend(video_ids)
+            with state_lock:
+                counts['total_videos'] += len(video_ids)
+            for batch in chunk_list(video_ids, VIDEO_BATCH_SIZE):
+                video_stage.put((channel_id, 'videos', batch), 'playlist')
+
+        if checkpoint is None:
+            get_video_ids(client(), playlist_id, since, on_page=lambda video_ids, _: emit(video_ids))
+        else:
+            # Videos listed before a restart but not yet finished go first; a
+            # resumed job that already listed the playlist does not page it again
+            channel_state = checkpoint.channel(channel_id)
+            emit(checkpoint.pending_videos(channel_id))
+            if channel_state['stage'] == 'listing':
+                def on_page(video_ids, next_page_token):
+                    checkpoint.record_page(channel_id, video_ids, next_page_token)
+                    emit(video_ids)
+
+                get_video_ids(client(), playlist_id, since, channel_state['page_token'], on_page)
+
+        if not listed and not incremental and not video_batch:
+            st.warning(f"No videos found for channel {channel_id}")
+
+    def fetch_videos(item):
+        channel_id, kind, video_ids = item
+        if lease_lost():
+            return
+        if kind == 'stats':
+            writer_stage.put(('video_stats', get_video_statistics_bulk(client(), video_ids)), 'videos')
+            return
+
+        frame = get_video_frame(client(), video_ids)
+        with state_lock:
+            # Videos the API no longer returns have no comments to wait for
+            counts['processed_videos'] += len(video_ids) - len(frame)
+        if frame.empty:
+            return
+        writer_stage.put(('videos', frame), 'videos')
+        published = parse_timestamp(frame['published_at'].max())
+        with state_lock:
+            newest_published[channel_id] = max(published, newest_published.get(channel_id, published))
+        for video_id in frame['video_id']:
+            comment_stage.put((channel_id, video_id), 'videos')
+
+    # Checkpoint updates travel through the writer queue behind the rows they
+    # cover and only apply once those rows are committed, so a saved
+    # checkpoint never gets ahead of the data
+    def fetch_comments(item):
+        channel_id, video_id = item
+        if lease_lost():
+            return
+        page_token = on_page = None
+        if checkpoint is not None:
+            page_token = checkpoint.comment_cursor(channel_id, video_id)
+
+            def on_page(next_page_token):
+                writer_stage.put(('call', functools.partial(
+                    checkpoint.record_comment_cursor, channel_id, video_id, next_page_token
+                )), 'comments')
+
+        for frame in iter_comment_batches(client(), video_id, max_comments, include_replies,
+                                          budget, page_token, on_page):
+            writer_stage.put(('comments', frame), 'comments')
+        if checkpoint is not None:
+            writer_stage.put(('call', functools.partial(checkpoint.video_done, channel_id, video_id)), 'comments')
+        with state_lock:
+            counts['processed_videos'] += 1
+
+    def write(item):
+        table, payload = item
+        if lease_lost():
+            return
+        if table == 'call':
+            writer.add_callback(payload)
+        elif table == 'channels':
+            writer.add_channel(payload)
+        else:
+            writer.add_frame(table, payload)
+
+    def report_progress():
+        with state_lock:
+            processed_videos, total_videos = counts['processed_videos'], counts['total_videos']
+        if total_videos:
+            metrics.set_progress(processed_videos, total_videos)
+            progress_text.text(f"Processed {processed_videos}/{total_videos} videos...")
+
+    workers = pipeline_workers(max_workers, len(channel_ids))
+    stage_options = {'metrics': metrics, 'worker_initializer': worker_initializer}
+    channel_stage = PipelineStage('channels', fetch_channel, workers['channels'],
+                                  on_error=channel_failed, **stage_options)
+    playlist_stage = PipelineStage('playlist', list_videos, workers['playlist'],
+                                   PIPELINE_QUEUE_SIZES['playlist'], channel_failed, **stage_options)
+    video_stage = PipelineStage('videos', fetch_videos, workers['videos'],
+                                PIPELINE_QUEUE_SIZES['videos'], channel_failed, **stage_options)
+    comment_stage = PipelineStage('comments', fetch_comments, workers['comments'],
+                                  PIPELINE_QUEUE_SIZES['comments'], channel_failed, **stage_options)
+    # Flushes on its own timer when the API side goes quiet
+    writer_stage = PipelineStage('writer', write, 1, PIPELINE_QUEUE_SIZES['writer'], write_failed,
+                                 idle=writer.maybe_flush, idle_seconds=writer.flush_interval, **stage_options)
+    stages = [channel_stage, playlist_stage, video_stage, comment_stage, writer_stage]
+
+    with writer:
+        for stage in stages:
+            stage.start()
+        progress_text.text(f"Fetching channel data for {len(channel_ids)} channels...")
+        for channel_id in channel_ids:
+            channel_stage.put((channel_id,))
+
+        # Stages drain in order, each closed once everything feeding it is done
+        for stage in stages:
+            stage.close(report_progress)
+        report_progress()
+
+        if not writer.flush() or writer.failed_flushes or writer_stage.error:
+            return {channel_id: False for channel_id in channel_ids}
+
+    # Watermarks only move once everything they cover has been written
+    for channel_id, success in results.items():
+        if success and not video_batch:
+            store.store_sync_state(
+                channel_id,
+                newest_published.get(channel_id),
+                channel_id in stats_refreshed
+            )
+
+    return results
+
+# Harvest Jobs
+# Raised when a job's unit was claimed by another worker while this one was
+# still running it, e.g. after a slow stretch let its heartbeat go stale
+class LeaseLostError(Exception):
+    pass
+
+# Resume state of one job: playlist page tokens, listed and finished video IDs
+# and comment cursors per channel, saved in the same transaction as the rows
+class HarvestCheckpoint:
+    def __init__(self, job_id, state=None, claim_token=None):
+        self.job_id = job_id
+        self.claim_token = claim_token
+        self.lost = False
+        self.state = state or {}
+        self.done = {
+            channel_id: set(channel_state['done_video_ids'])
+            for channel_id, channel_state in self.state.items()
+        }
+        self.lock = threading.Lock()
+
+    def channel(self, channel_id):
+        with self.lock:
+            return self._channel(channel_id)
+
+    def _channel(self, channel_id):
+        if channel_id not in self.state:
+            self.state[channel_id] = {
+                'stage': 'listing',
+                'page_token': None,
+                'video_ids': [],
+                'done_video_ids': [],
+                'comment_cursors': {}
+            }
+            self.done[channel_id] = set()
+        return self.state[channel_id]
+
+    def record_page(self, channel_id, video_ids, next_page_token):
+        with self.lock:
+            channel_state = self._channel(channel_id)
+            channel_state['video_ids'].extend(video_ids)
+            channel_state['page_token'] = next_page_token
+            if not next_page_token:
+                channel_state['stage'] = 'videos'
+
+    def pending_videos(self, channel_id):
+        with self.lock:
+            channel_state = self._channel(channel_id)
+            done = self.done[channel_id]
+            return [video_id for video_id in channel_state['video_ids'] if video_id not in done]
+
+    def comment_cursor(self, channel_id, video_id):
+        with self.lock:
+            return self._channel(channel_id)['comment_cursors'].get(video_id)
+
+    def record_comment_cursor(self, channel_id, video_id, page_token):
+        with self.lock:
+            if page_token:
+                self._channel(channel_id)['comment_cursors'][video_id] = page_token
+
+    def video_done(self, channel_id, video_id):
+        with self.lock:
+            channel_state = self._channel(channel_id)
+            channel_state['comment_cursors'].pop(video_id, None)
+            if video_id not in self.done[channel_id]:
+                self.done[channel_id].add(video_id)
+                channel_state['done_video_ids'].append(video_id)
+
+    # Runs inside the writer's flush, so rows from a worker that lost its
+    # claim are rolled back with the checkpoint
+    def save(self, cursor):
+        with self.lock:
+            snapshot = json.dumps(self.state)
+        cursor.execute('''
+            UPDATE harvest_jobs SET checkpoint = %s, heartbeat_at = NOW()
+            WHERE job_id = %s AND claim_token IS NOT DISTINCT FROM %s
+        ''', (snapshot, self.job_id, self.claim_token))
+        if not cursor.rowcount:
+            self.lost = True
+            raise LeaseLostError(f"Job {self.job_id} was claimed by another worker")
+
+# Stands in for the st.empty() placeholder when a job runs in the background
+class JobProgress:
+    def __init__(self, job_id, min_interval=1.0, claim_token=None):
+        self.job_id = job_id
+        self.claim_token = claim_token
+        self.min_interval = min_interval
+        self.last_update = 0
+
+    def text(self, message):
+        now = time.monotonic()
+        if now - self.last_update < self.min_interval:
+            return
+        self.last_update = now
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE harvest_jobs SET progress_message = %s, heartbeat_at = NOW()
+                WHERE job_id = %s AND claim_token IS NOT DISTINCT FROM %s
+            ''', (message, self.job_id, self.claim_token))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def empty(self):
+        pass
+
+def submit_harvest_job(channel_ids, options=None):
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO harvest_jobs (channel_ids, options)
+            VALUES (%s, %s) RETURNING job_id
+        ''', (list(channel_ids), json.dumps(options or {})))
+        job_id = cursor.fetchone()[0]
+        conn.commit()
+        return job_id
+    except Exception as e:
+        st.error(f"Error submitting harvest job: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+# Identifies the process holding a job, e.g. in the dashboard's job list
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def claim_harvest_job(stale_seconds=HARVEST_JOB_STALE_SECONDS, max_attempts=HARVEST_JOB_MAX_ATTEMPTS):
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        # Jobs that keep dying mid-run (e.g. crashing their worker) stop here
+        cursor.execute('''
+            UPDATE harvest_jobs SET
+                status = 'failed', finished_at = NOW(),
+                error = 'Abandoned after ' || attempts || ' attempts'
+            WHERE status = 'running' AND attempts >= %s
+              AND heartbeat_at < NOW() - %s * INTERVAL '1 second'
+            RETURNING parent_job_id
+        ''', (max_attempts, stale_seconds))
+        for parent_job_id in {row[0] for row in cursor.fetchall() if row[0]}:
+            finish_sharded_job(cursor, parent_job_id)
+
+        # SKIP LOCKED lets any number of workers poll the same queue: each
+        # one takes the oldest job nobody else is claiming right now
+        cursor.execute('''
+            UPDATE harvest_jobs SET
+                status = 'running',
+                started_at = COALESCE(started_at, NOW()),
+                heartbeat_at = NOW(),
+                attempts = attempts + 1,
+                claimed_by = %s,
+                claim_token = %s
+            WHERE job_id = (
+                SELECT job_id FROM harvest_jobs
+                WHERE status = 'queued'
+                   OR (status = 'running' AND heartbeat_at < NOW() - %s * INTERVAL '1 second')
+                ORDER BY created_at, job_id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING job_id, channel_ids, options, checkpoint, parent_job_id, claim_token
+        ''', (worker_name(), uuid.uuid4().hex, stale_seconds))
+        row = cursor.fetchone()
+        conn.commit()
+        if not row:
+            return None
+        return {
+            'job_id': row[0],
+            'channel_ids': row[1],
+            'options': row[2],
+            'checkpoint': row[3],
+            'parent_job_id': row[4],
+            'claim_token': row[5]
+        }
+    except Exception as e:
+        st.error(f"Error claiming harvest job: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+def finish_harvest_job(job_id, status, results=None, error=None, claim_token=None):
+    conn = get_db_connection()
+    if not conn:
+        return False
+
+    try:
+        cursor = conn.cursor()
+        # A job claimed again in the meantime belongs to its new worker
+        cursor.execute('''
+            UPDATE harvest_jobs SET
+                status = %s, results = %s, error = %s, finished_at = NOW()
+            WHERE job_id = %s AND claim_token IS NOT DISTINCT FROM %s
+            RETURNING parent_job_id
+        ''', (status, json.dumps(results) if results is not None else None, error, job_id, claim_token))
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            logging.getLogger('youtube_harvester').warning(
+                "Job %s was claimed by another worker; leaving it to them", job_id
+            )
+            return False
+        parent_job_id = row[0]
+        if parent_job_id:
+            finish_sharded_job(cursor, parent_job_id)
+        conn.commit()
+        return True
+    except Exception as e:
+        st.error(f"Error updating harvest job: {str(e)}")
+        return False
+    finally:
+        conn.close()
+
+def run_harvest_job(job, **engine_options):
+    job_id = job['job_id']
+    claim_token = job.get('claim_token')
+    checkpoint = HarvestCheckpoint(job_id, job['checkpoint'], claim_token)
+    try:
+        # Jobs and their checkpoints live in Postgres, so their rows do too
+        results = harvest_channels(
+            job['channel_ids'], JobProgress(job_id, claim_token=claim_token), checkpoint=checkpoint,
+            store=get_store('postgres'), **job['options'], **engine_options
+        )
+        status = 'completed' if all(results.values()) else 'failed'
+        finish_harvest_job(job_id, status, results, claim_token=claim_token)
+        return results
+    except Exception as e:
+        finish_harvest_job(job_id, 'failed', error=str(e), claim_token=claim_token)
+        return None
+
+def run_job_worker(poll_seconds=HARVEST_JOB_POLL_SECONDS, stop_event=None, once=False,
+                   maintenance=True, **engine_options):
+    stop_event = stop_event or threading.Event()
+    last_downsample = None
+    while not stop_event.is_set():
+        job = claim_harvest_job()
+        if job:
+            run_harvest_job(job, **engine_options)
+        elif once:
+            return
+        else:
+            # Old history is thinned out while the queue is idle
+            if maintenance and (last_downsample is None or
+                                time.monotonic() - last_downsample >= HISTORY_DOWNSAMPLE_INTERVAL_SECONDS):
+                get_store('postgres').downsample_history()
+                last_downsample = time.monotonic()
+            stop_event.wait(poll_seconds)
+
+# One set of background workers per Streamlit server process, shared by every
+# session; only the first one does the idle-time maintenance
+@st.cache_resource
+def start_job_worker(workers=DASHBOARD_JOB_WORKERS):
+    threads = [
+        threading.Thread(target=run_job_worker, kwargs={'maintenance': index == 0},
+                         name=f'harvest-job-worker-{index}', daemon=True)
+        for index in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+# Work units of sharded jobs are summarized on their parent's row
+def list_harvest_jobs(limit=20):
+    return execute_analysis_query(f'''
+        SELECT job_id, status, array_to_string(channel_ids, ', ') AS channels,
+               (SELECT COUNT(*) FILTER (WHERE unit.status IN ('completed', 'failed')) || '/' || COUNT(*)
+                FROM harvest_jobs unit WHERE unit.parent_job_id = job.job_id
+                HAVING COUNT(*) > 0) AS units_done,
+               progress_message, results, error, created_at, started_at, finished_at
+        FROM harvest_jobs job
+        WHERE parent_job_id IS NULL
+        ORDER BY job_id DESC
+        LIMIT {int(limit)}
+    ''')
+
+# Sharded Harvests
+# A coordinator splits a harvest into work units - one per channel, or batches
+# of video IDs for large channels - queued as child jobs of a 'sharded' parent.
+# Worker processes on any number of machines claim units from the same queue.
+# A unit whose worker dies is taken over once its heartbeat goes stale and
+# resumes from its checkpoint, so every unit runs at least once; the upserts
+# make running one twice harmless.
+
+# Seeds a unit's checkpoint with the videos the coordinator already listed, so
+# the unit does not page the playlist again
+def shard_checkpoint(channel_id, video_ids):
+    return {channel_id: {
+        'stage': 'videos',
+        'page_token': None,
+        'video_ids': video_ids,
+        'done_video_ids': [],
+        'comment_cursors': {}
+    }}
+
+# Returns (channel_ids, options, checkpoint) per unit and the channels split into
+# video batches. Without videos_per_unit no API calls are made: every channel
+# becomes one unit that lists its own playlist.
+def plan_harvest_units(channel_ids, options, videos_per_unit=None, client=None, store=None):
+    if not videos_per_unit:
+        return [([channel_id], options, {}) for channel_id in channel_ids], []
+    store = store or get_store('postgres')
+    units = []
+    split_channels = []
+    for channel_id in channel_ids:
+        channel = get_channel_stats(client, channel_id)
+        if not channel:
+            # Left to a unit, which reports the missing channel as failed
+            units.append(([channel_id], options, {}))
+            continue
+        sync_state = store.get_sync_state(channel_id) if options.get('incremental') else None
+        since = sync_state['last_published_at'] if sync_state else None
+        video_ids = get_video_ids(client, channel['playlistId'], since)
+        if len(video_ids) <= videos_per_unit:
+            units.append(([channel_id], options, shard_checkpoint(channel_id, video_ids)))
+            continue
+        split_channels.append(channel_id)
+        for batch in chunk_list(video_ids, videos_per_unit):
+            units.append(([channel_id], dict(options, video_batch=True), shard_checkpoint(channel_id, batch)))
+    return units, split_channels
+
+def submit_sharded_harvest(channel_ids, options=None, videos_per_unit=None, client_factory=default_client_factory):
+    options = options or {}
+    client = None
+    if videos_per_unit:
+        client = RetryingClient(RateLimitedClient(client_factory(), pool_rate_limiter()), RequestExecutor())
+    try:
+        units, split_channels = plan_harvest_units(channel_ids, options, videos_per_unit, client)
+    except HttpError as e:
+        st.error(f"Error listing channel videos: {str(e)}")
+        return None
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO harvest_jobs (channel_ids, options, status, checkpoint, started_at)
+            VALUES (%s, %s, 'sharded', %s, NOW()) RETURNING job_id
+        ''', (list(channel_ids), json.dumps(options), json.dumps({'split_channels': split_channels})))
+        job_id = cursor.fetchone()[0]
+        execute_values(cursor, '''
+            INSERT INTO harvest_jobs (parent_job_id, channel_ids, options, checkpoint) VALUES %s
+        ''', [
+            (job_id, unit_channels, json.dumps(unit_options), json.dumps(checkpoint))
+            for unit_channels, unit_options, checkpoint in units
+        ])
+        conn.commit()
+        return job_id
+    except Exception as e:
+        st.error(f"Error submitting sharded harvest: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+# Runs in the transaction that finishes a unit. Locking the parent serializes
+# the units finishing at the same time, so exactly one of them sees the last
+# unit done and closes the parent.
+def finish_sharded_job(cursor, parent_job_id):
+    cursor.execute('''
+        SELECT options, checkpoint FROM harvest_jobs
+        WHERE job_id = %s AND status = 'sharded'
+        FOR UPDATE
+    ''', (parent_job_id,))
+    parent = cursor.fetchone()
+    if not parent:
+        return False
+    cursor.execute('''
+        SELECT status, results FROM harvest_jobs WHERE parent_job_id = %s
+    ''', (parent_job_id,))
+    units = cursor.fetchall()
+    if any(status not in ('completed', 'failed') for status, _ in units):
+        return False
+
+    # A channel succeeded only if every unit covering it did
+    results = {}
+    for status, unit_results in units:
+        for channel_id, success in (unit_results or {}).items():
+            results[channel_id] = results.get(channel_id, True) and success
+    options, checkpoint = parent
+    # Batches of split channels skipped the summaries (see harvest_channels)
+    refresh_analytics(cursor, checkpoint.get('split_channels', []))
+    split_channels = [
+        channel_id for channel_id in checkpoint.get('split_channels', [])
+        if results.get(channel_id)
+    ]
+    # Split channels get their watermark only now that all their batches are
+    # stored; an incremental run did not refresh their older videos' statistics
+    if split_channels:
+        cursor.execute('''
+            INSERT INTO channel_sync_state (
+                channel_id, last_published_at, last_synced_at, stats_refreshed_at
+            )
+            SELECT channel_id, MAX(published_at), NOW(), CASE WHEN %s THEN NOW() END
+            FROM videos WHERE channel_id = ANY(%s)
+            GROUP BY channel_id
+            ON CONFLICT (channel_id) DO UPDATE SET
+                last_published_at = GREATEST(
+                    channel_sync_state.last_published_at, EXCLUDED.last_published_at
+                ),
+                last_synced_at = EXCLUDED.last_synced_at,
+                stats_refreshed_at = COALESCE(
+                    EXCLUDED.stats_refreshed_at, channel_sync_state.stats_refreshed_at
+                )
+        ''', (not options.get('incremental'), split_channels))
+
+    status = 'completed' if all(status == 'completed' for status, _ in units) else 'failed'
+    cursor.execute('''
+        UPDATE harvest_jobs SET
+            status = %s, results = %s, finished_at = NOW(),
+            progress_message = %s
+        WHERE job_id = %s
+    ''', (status, json.dumps(results), f"{len(units)} work units finished", parent_job_id))
+    return True
+
+def sharded_job_progress(job_id):
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT job.status,
+                   COUNT(unit.job_id),
+                   COUNT(unit.job_id) FILTER (WHERE unit.status = 'completed'),
+                   COUNT(unit.job_id) FILTER (WHERE unit.status = 'failed'),
+                   COUNT(unit.job_id) FILTER (WHERE unit.status = 'running'),
+                   COUNT(DISTINCT unit.claimed_by),
+                   job.results
+            FROM harvest_jobs job
+            LEFT JOIN harvest_jobs unit ON unit.parent_job_id = job.job_id
+            WHERE job.job_id = %s
+            GROUP BY job.job_id
+        ''', (job_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'status': row[0],
+            'units': row[1],
+            'completed': row[2],
+            'failed': row[3],
+            'running': row[4],
+            'workers': row[5],
+            'results': row[6]
+        }
+    except Exception as e:
+        st.error(f"Error reading sharded job progress: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+# Entry point of a spawned worker process. The processes started together on
+# one machine split the per-key request rate between them. The daily quota is
+# counted in Postgres and shared across machines too, unless API_SHARED_QUOTA
+# is off, in which case they split it like the rate.
+def run_worker_process(db_config, processes, worker_options, metrics_port=None):
+    DB_CONFIG.update(db_config)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s %(levelname)s %(processName)s %(message)s')
+    if metrics_port:
+        serve_metrics(metrics_port)
+    daily_quota = API_DAILY_QUOTA if API_SHARED_QUOTA else API_DAILY_QUOTA / processes
+    pool = ApiKeyPool(requests_per_second=API_REQUESTS_PER_SECOND / processes, daily_quota=daily_quota)
+    key_count = len(pool.api_keys)
+    limiter = QuotaRateLimiter(API_REQUESTS_PER_SECOND * key_count / processes, daily_quota * key_count)
+    run_job_worker(client_factory=pool.client, limiter=limiter, **worker_options)
+
+# Processes are spawned rather than forked, so none of them inherits the
+# parent's connection pool or threads
+def start_worker_processes(target, args_list):
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=target, args=args, name=f"harvest-worker-{index}")
+        for index, args in enumerate(args_list)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+# Refresh Scheduler
+# Each tick scores every useful refresh by its value per quota unit and
+# dispatches the best ones until the day's budget is spent:
+# - 'uploads': an incremental harvest job for a channel likely to have new
+#   videos (upload frequency times time since it was last checked)
+# - 'video_stats' / 'channel_stats': one statistics-only call per 50 ids,
+#   valued by the views likely gained since the last refresh (view velocity
+#   from the history tables times staleness)
+REFRESH_CHANNELS_SQL = '''
+    WITH uploads AS (
+        SELECT channel_id, COUNT(*) AS recent_uploads
+        FROM videos
+        WHERE published_at >= %(upload_since)s
+        GROUP BY channel_id
+    ),
+    velocity AS (
+        SELECT channel_id,
+               (MAX(view_count) - MIN(view_count))::float8
+                   / NULLIF(EXTRACT(EPOCH FROM MAX(captured_at) - MIN(captured_at)) / 3600.0, 0) AS views_per_hour
+        FROM channel_stats_history
+        WHERE captured_at >= %(velocity_since)s
+        GROUP BY channel_id
+    )
+    SELECT c.channel_id,
+           GREATEST(ru.refreshed_at, s.last_synced_at) AS uploads_checked_at,
+           GREATEST(rc.refreshed_at, s.stats_refreshed_at, s.last_synced_at) AS stats_checked_at,
+           COALESCE(u.recent_uploads, 0) AS recent_uploads,
+           COALESCE(v.views_per_hour, 0) AS views_per_hour
+    FROM channels c
+    LEFT JOIN channel_sync_state s ON s.channel_id = c.channel_id
+    LEFT JOIN refresh_state ru ON ru.kind = 'uploads' AND ru.entity_id = c.channel_id
+    LEFT JOIN refresh_state rc ON rc.kind = 'channel_stats' AND rc.entity_id = c.channel_id
+    LEFT JOIN uploads u ON u.channel_id = c.channel_id
+    LEFT JOIN velocity v ON v.channel_id = c.channel_id
+'''
+
+# Videos without history yet fall back to their lifetime average view rate.
+# A video counts as checked when its own statistics were last fetched, or when
+# its channel last refreshed every stored video; an incremental uploads sync
+# only fetches new videos, so it does not count.
+REFRESH_VIDEOS_SQL = '''
+    WITH velocity AS (
+        SELECT video_id,
+               (MAX(view_count) - MIN(view_count))::float8
+                   / NULLIF(EXTRACT(EPOCH FROM MAX(captured_at) - MIN(captured_at)) / 3600.0, 0) AS views_per_hour
+        FROM video_stats_history
+        WHERE captured_at >= %(velocity_since)s
+        GROUP BY video_id
+    ),
+    scored AS (
+        SELECT v.video_id,
+               GREATEST(r.refreshed_at, s.stats_refreshed_at) AS checked_at,
+               COALESCE(h.views_per_hour, v.view_count::float8
+                   / GREATEST(EXTRACT(EPOCH FROM %(now)s - v.published_at) / 3600.0, 1)) AS views_per_hour
+        FROM videos v
+        LEFT JOIN velocity h ON h.video_id = v.video_id
+        LEFT JOIN channel_sync_state s ON s.channel_id = v.channel_id
+        LEFT JOIN refresh_state r ON r.kind = 'video_stats' AND r.entity_id = v.video_id
+    )
+    SELECT video_id, checked_at, views_per_hour
+    FROM scored
+    WHERE checked_at IS NULL OR checked_at < %(fresh_before)s
+    ORDER BY views_per_hour DESC NULLS LAST
+    LIMIT %(limit)s
+'''
+
+REFRESH_STATE_SQL = '''
+    INSERT INTO refresh_state (kind, entity_id, refreshed_at) VALUES %s
+    ON CONFLICT (kind, entity_id) DO UPDATE SET
+        refreshed_at = GREATEST(refresh_state.refreshed_at, EXCLUDED.refreshed_at)
+'''
+
+# Every written video row carries statistics fetched at captured_at, whichever
+# harvest or scheduler round fetched them
+def record_video_refreshes(cursor, table, rows, captured_at):
+    if table not in ('videos', 'video_stats'):
+        return
+    execute_values(cursor, REFRESH_STATE_SQL, [('video_stats', row[0], captured_at) for row in rows],
+                   page_size=1000)
+
+def refresh_age_hours(checked_at, now):
+    if checked_at is None:
+        return REFRESH_MAX_AGE_HOURS
+    return min(max((now - checked_at).total_seconds() / 3600, 0), REFRESH_MAX_AGE_HOURS)
+
+# Builds the candidate refreshes from channel and video rows as dicts
+def refresh_tasks(channels, videos, now):
+    min_age_hours = REFRESH_MIN_AGE_SECONDS / 3600
+    tasks = []
+    for channel in channels:
+        age = refresh_age_hours(channel['uploads_checked_at'], now)
+        if age < min_age_hours:
+            continue
+        expected_uploads = channel['recent_uploads'] / (REFRESH_UPLOAD_WINDOW_DAYS * 24) * age
+        tasks.append({
+            'kind': 'uploads',
+            'ids': [channel['channel_id']],
+            'value': expected_uploads * REFRESH_UPLOAD_VALUE + age,
+            # channels.list and a playlist page, then a videos.list share
+            # and a comment page for each new upload
+            'cost': 2 + 2 * expected_uploads
+        })
+
+    for kind, rows, key, checked in (('channel_stats', channels, 'channel_id', 'stats_checked_at'),
+                                     ('video_stats', videos, 'video_id', 'checked_at')):
+        scored = []
+        for row in rows:
+            age = refresh_age_hours(row[checked], now)
+            if age >= min_age_hours:
+                scored.append(((row['views_per_hour'] or 0) * age + age, row[key]))
+        # Batches group similar priorities so the hottest ids share calls
+        scored.sort(reverse=True)
+        for batch in chunk_list(scored, VIDEO_BATCH_SIZE):
+            tasks.append({
+                'kind': kind,
+                'ids': [entity_id for _, entity_id in batch],
+                'value': sum(value for value, _ in batch),
+                'cost': 1
+            })
+    return tasks
+
+# Highest value per quota unit first; tasks that no longer fit are skipped
+def plan_refreshes(tasks, budget):
+    heap = [(-task['value'] / task['cost'], i, task) for i, task in enumerate(tasks)]
+    heapq.heapify(heap)
+    plan = []
+    while heap and budget >= 1:
+        _, _, task = heapq.heappop(heap)
+        if task['cost'] <= budget:
+            plan.append(task)
+            budget -= task['cost']
+    return plan
+
+class RefreshScheduler:
+    def __init__(self, daily_quota=REFRESH_DAILY_QUOTA, clock=datetime.now,
+                 client_factory=default_client_factory, submit_job=None, store=None):
+        self.daily_quota = daily_quota
+        # Returns the current time; tests drive the scheduler with a simulated one
+        self.clock = clock
+        self.client_factory = client_factory
+        self.submit_job = submit_job or submit_harvest_job
+        self.store = store or get_store('postgres')
+        self.day = None
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def remaining_budget(self, now=None):
+        today = (now or self.clock()).date()
+        with self.lock:
+            if today != self.day:
+                self.day = today
+                self.spent = 0
+            return self.daily_quota - self.spent
+
+    def load_candidates(self, now):
+        conn = get_db_connection()
+        if not conn:
+            return [], []
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(REFRESH_CHANNELS_SQL, {
+                'upload_since': now - timedelta(days=REFRESH_UPLOAD_WINDOW_DAYS),
+                'velocity_since': now - timedelta(days=REFRESH_VELOCITY_WINDOW_DAYS)
+            })
+            columns = [column[0] for column in cursor.description]
+            channels = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.execute(REFRESH_VIDEOS_SQL, {
+                'now': now,
+                'velocity_since': now - timedelta(days=REFRESH_VELOCITY_WINDOW_DAYS),
+                'fresh_before': now - timedelta(seconds=REFRESH_MIN_AGE_SECONDS),
+                'limit': REFRESH_MAX_VIDEOS
+            })
+            columns = [column[0] for column in cursor.description]
+            videos = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return channels, videos
+        except Exception as e:
+            st.error(f"Error loading refresh candidates: {str(e)}")
+            return [], []
+        finally:
+            conn.close()
+
+    def plan(self, now=None):
+        now = now or self.clock()
+        channels, videos = self.load_candidates(now)
+        return plan_refreshes(refresh_tasks(channels, videos, now), self.remaining_budget(now))
+
+    def mark_refreshed(self, kind, entity_ids, now):
+        conn = get_db_connection()
+        if not conn:
+            return False
+
+        try:
+            cursor = conn.cursor()
+            execute_values(cursor, REFRESH_STATE_SQL, [(kind, entity_id, now) for entity_id in entity_ids])
+            conn.commit()
+            return True
+        except Exception as e:
+            st.error(f"Error recording refresh: {str(e)}")
+            return False
+        finally:
+            conn.close()
+
+    def refresh_statistics(self, client, task):
+        with BulkWriter(store=self.store) as writer:
+            if task['kind'] == 'video_stats':
+                writer.add_frame('video_stats', get_video_statistics_bulk(client, task['ids']))
+            else:
+                for channel in get_channel_stats_bulk(client, task['ids']):
+                    writer.add_channel(channel)
+            ok = writer.flush()
+        return ok and not writer.failed_flushes
+
+    # Plans and dispatches one round; returns the dispatched tasks
+    def tick(self):
+        now = self.clock()
+        plan = self.plan(now)
+        if not plan:
+            return []
+
+        dispatched = []
+        # Channels due for new uploads go out as one incremental harvest job
+        uploads = [task for task in plan if task['kind'] == 'uploads']
+        if uploads:
+            channel_ids = [task['ids'][0] for task in uploads]
+            if self.submit_job(channel_ids, {'incremental': True}) is not None:
+                self.mark_refreshed('uploads', channel_ids, now)
+                dispatched.extend(uploads)
+
+        statistics = [task for task in plan if task['kind'] != 'uploads']
+        if statistics:
+            metrics = get_harvest_metrics()
+            client = RetryingClient(
+                RateLimitedClient(self.client_factory(), pool_rate_limiter(), metrics),
+                RequestExecutor(metrics=metrics)
+            )
+            for task in statistics:
+                try:
+                    refreshed = self.refresh_statistics(client, task)
+                except Exception as e:
+                    st.error(f"Error refreshing {task['kind']}: {str(e)}")
+                    refreshed = False
+                if refreshed:
+                    self.mark_refreshed(task['kind'], task['ids'], now)
+                    dispatched.append(task)
+
+        with self.lock:
+            self.spent += sum(task['cost'] for task in dispatched)
+        return dispatched
+
+    def run(self, interval=REFRESH_INTERVAL_SECONDS, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.tick()
+            stop_event.wait(interval)
+
+# One scheduler per Streamlit server process when REFRESH_SCHEDULER_ENABLED is set
+@st.cache_resource
+def start_refresh_scheduler():
+    scheduler = RefreshScheduler()
+    thread = threading.Thread(target=scheduler.run, name='refresh-scheduler', daemon=True)
+    thread.start()
+    return scheduler
+
+def refresh_plan_frame(plan):
+    return pd.DataFrame([{
+        'kind': task['kind'],
+        'ids': len(task['ids']),
+        'first_id': task['ids'][0],
+        'value': round(task['value'], 1),
+        'quota_units': round(task['cost'], 1)
+    } for task in plan])
+
+# Table Browser
+# Primary key used for keyset paging and the wide text columns loaded lazily
+BROWSER_TABLES = {
+    'channels': {'key': 'channel_id', 'large': ['description']},
+    'videos': {'key': 'video_id', 'large': ['description']},
+    'comments': {'key': 'comment_id', 'large': ['comment_text']}
+}
+
+def get_table_columns(table):
+    conn = get_db_connection()
+    if not conn:
+        return []
 
-        # Comments table
+    try:
+        cursor = conn.cursor()
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS comments (
-            comment_id VARCHAR(255) PRIMARY KEY,
-            video_id VARCHAR(255) REFERENCES videos(video_id),
-            comment_text TEXT,
-            author_name VARCHAR(255),
-            published_at TIMESTAMP
-        )
-        ''')
-
-        conn.commit()
-        return True
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+              AND data_type <> 'tsvector'
+            ORDER BY ordinal_position
+        ''', (table,))
+        return [row[0] for row in cursor.fetchall()]
     except Exception as e:
-        st.error(f"Error creating tables: {str(e)}")
-        return False
+        st.error(f"Error reading columns: {str(e)}")
+        return []
     finally:
         conn.close()
 
-def store_channel_data(channel_data):
+def build_browse_query(table, columns, after_key=None, filter_column=None, filter_value=None,
+                       match='contains', full_text=False, limit=BROWSER_PAGE_SIZE):
+    key = BROWSER_TABLES[table]['key']
+    large = BROWSER_TABLES[table]['large']
+
+    # The key is always selected so the next page can start after it
+    selected = [sql.Identifier(key)]
+    for column in columns:
+        if column == key:
+            continue
+        if column in large and not full_text:
+            selected.append(sql.SQL("LEFT({col}, {n}) AS {col}").format(
+                col=sql.Identifier(column), n=sql.Literal(BROWSER_TEXT_PREVIEW)))
+        else:
+            selected.append(sql.Identifier(column))
+
+    conditions = []
+    params = []
+    if after_key is not None:
+        conditions.append(sql.SQL("{} > %s").format(sql.Identifier(key)))
+        params.append(after_key)
+    if filter_column and filter_value:
+        if match == 'equals':
+            conditions.append(sql.SQL("{} = %s").format(sql.Identifier(filter_column)))
+            params.append(filter_value)
+        else:
+            conditions.append(sql.SQL("{}::TEXT ILIKE %s").format(sql.Identifier(filter_column)))
+            params.append(f"%{filter_value}%")
+
+    query = sql.SQL("SELECT {columns} FROM {table}").format(
+        columns=sql.SQL(', ').join(selected), table=sql.Identifier(table))
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY {} LIMIT %s").format(sql.Identifier(key))
+    params.append(limit + 1)
+    return query, params
+
+# Returns one page plus whether another page follows. Pages are read through
+# a named (server-side) cursor so only the requested rows reach the client.
+def fetch_table_page(table, columns, after_key=None, filter_column=None, filter_value=None,
+                     match='contains', full_text=False, page_size=BROWSER_PAGE_SIZE):
+    known_columns = get_table_columns(table)
+    columns = [column for column in columns if column in known_columns]
+    if filter_column not in known_columns:
+        filter_column = None
+
     conn = get_db_connection()
     if not conn:
-        return False
-    
+        return None, False
+
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO channels (
-                channel_name, channel_id, subscriber_count, 
-                view_count, video_count, playlist_id, description
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (channel_id) DO UPDATE SET
-                subscriber_count = EXCLUDED.subscriber_count,
-                view_count = EXCLUDED.view_count,
-                video_count = EXCLUDED.video_count
-        ''', (
-            channel_data['channelName'],
-            channel_data['channelid'],
-            channel_data['subscribers'],
-            channel_data['views'],
-            channel_data['totalVideos'],
-            channel_data['playlistId'],
-            channel_data['channel_description']
-        ))
-        conn.commit()
-        return True
+        query, params = build_browse_query(
+            table, columns, after_key, filter_column, filter_value, match, full_text, page_size
+        )
+        cursor = conn.cursor(name=f"browse_{table}")
+        cursor.itersize = page_size + 1
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(page_size + 1)
+        names = [desc[0] for desc in cursor.description]
+        cursor.close()
+        has_next = len(rows) > page_size
+        return pd.DataFrame(rows[:page_size], columns=names), has_next
     except Exception as e:
-        st.error(f"Error storing channel data: {str(e)}")
-        return False
+        st.error(f"Error viewing data: {str(e)}")
+        return None, False
     finally:
         conn.close()
 
-def store_video_data(video_data):
+def fetch_full_text(table, column, key_value):
+    if column not in BROWSER_TABLES[table]['large']:
+        return None
     conn = get_db_connection()
     if not conn:
-        return False
-    
+        return None
+
     try:
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO videos (
-                video_id, channel_id, title, description, tags,
-                published_at, view_count, like_count,
-                favorite_count, comment_count, duration, definition, caption
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (video_id) DO UPDATE SET
-                view_count = EXCLUDED.view_count,
-                like_count = EXCLUDED.like_count,
-                dislike_count = EXCLUDED.dislike_count,
-                comment_count = EXCLUDED.comment_count
-        ''', (
-            video_data['video_id'],
-            video_data['channelid'],
-            video_data['title'],
-            video_data['description'],
-            ','.join(video_data['tags']) if video_data.get('tags') else None,
-            video_data['publishedAt'],
-            video_data['viewCount'],
-            video_data['likeCount'],
-
-            video_data['favoriteCount'],
-            video_data['commentCount'],
-            video_data['duration'],
-            video_data['definition'],
-            video_data['caption']
-        ))
-        conn.commit()
-        return True
+        cursor.execute(sql.SQL("SELECT {} FROM {} WHERE {} = %s").format(
+            sql.Identifier(column), sql.Identifier(table),
+            sql.Identifier(BROWSER_TABLES[table]['key'])
+        ), (key_value,))
+        row = cursor.fetchone()
+        return row[0] if row else None
     except Exception as e:
-        st.error(f"Error storing video data: {str(e)}")
-        return False
+        st.error(f"Error loading text: {str(e)}")
+        return None
     finally:
         conn.close()
 
-def store_comment_data(comment):
+def show_table_browser(table):
+    columns = get_table_columns(table)
+    if not columns:
+        st.info(f"No data available in {table} table")
+        return
+
+    key = BROWSER_TABLES[table]['key']
+    large = BROWSER_TABLES[table]['large']
+    selected = st.multiselect("Columns", columns, default=columns, key=f'columns-{table}')
+
+    col1, col2, col3 = st.columns([2, 1, 2])
+    with col1:
+        filter_column = st.selectbox("Filter column", ['(none)'] + columns, key=f'filter-col-{table}')
+    with col2:
+        match = st.selectbox("Match", ['contains', 'equals'], key=f'filter-match-{table}')
+    with col3:
+        filter_value = st.text_input("Filter value", key=f'filter-value-{table}')
+    filter_column = None if filter_column == '(none)' else filter_column
+
+    # Page start keys for Previous/Next; reset whenever the view changes
+    view = (table, tuple(selected), filter_column, match, filter_value)
+    if st.session_state.get('browser_view') != view:
+        st.session_state['browser_view'] = view
+        st.session_state['browser_keys'] = [None]
+    page_keys = st.session_state['browser_keys']
+
+    df, has_next = fetch_table_page(
+        table, selected, page_keys[-1], filter_column, filter_value, match
+    )
+    if df is None:
+        return
+    if df.empty:
+        st.info(f"No data available in {table} table")
+        return
+
+    st.dataframe(df)
+    st.caption(f"Page {len(page_keys)} · {len(df)} rows · long text trimmed to {BROWSER_TEXT_PREVIEW} characters")
+
+    col1, col2, _ = st.columns([1, 1, 4])
+    with col1:
+        if st.button("Previous", disabled=len(page_keys) == 1, key=f'prev-{table}'):
+            page_keys.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next", disabled=not has_next, key=f'next-{table}'):
+            page_keys.append(df[key].iloc[-1])
+            st.rerun()
+
+    # Wide text columns are fetched in full for one row at a time
+    shown_large = [column for column in large if column in df.columns]
+    if shown_large:
+        with st.expander("Show full text"):
+            row_key = st.selectbox("Row", df[key].tolist(), key=f'full-row-{table}')
+            column = st.selectbox("Column", shown_large, key=f'full-col-{table}')
+            st.text_area(column, fetch_full_text(table, column, row_key) or "", height=200)
+
+    csv = df.to_csv(index=False)
+    st.download_button(
+        "Download Page",
+        csv,
+        f"{table}_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        "text/csv",
+        key=f'download-{table}'
+    )
+
+# Full-Text Search
+# Matches come off the GIN index, are ranked, and are paged by (rank, id) like
+# the table browser pages by key. Snippets are only built for the page shown.
+# Terms with more than SEARCH_MAX_CANDIDATES matches rank only the newest ones,
+# so every page of a search ranks the same set.
+SEARCH_QUERIES = {
+    'videos': '''
+        WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) AS query),
+        candidates AS (
+            SELECT v.video_id AS id, v.search_vector
+            FROM videos v, q
+            WHERE v.search_vector @@ q.query
+            ORDER BY v.published_at DESC NULLS LAST, v.video_id DESC
+            LIMIT %(candidates)s
+        ),
+        matches AS (
+            SELECT id, ts_rank_cd(search_vector, q.query) AS rank FROM candidates, q
+        ),
+        page AS (
+            SELECT id, rank FROM matches
+            WHERE %(after_rank)s IS NULL OR (rank, id) < (%(after_rank)s::real, %(after_id)s)
+            ORDER BY rank DESC, id DESC
+            LIMIT %(limit)s
+        )
+        SELECT p.id AS video_id, p.rank, v.title, c.channel_name, v.published_at, v.view_count,
+               ts_headline('english', COALESCE(v.description, ''), q.query,
+                           'MaxFragments=1, MaxWords=25, MinWords=8') AS snippet,
+               (SELECT COUNT(*) FROM candidates) AS candidates
+        FROM page p
+        JOIN videos v ON v.video_id = p.id
+        JOIN channels c ON c.channel_id = v.channel_id
+        CROSS JOIN q
+        ORDER BY p.rank DESC, p.id DESC
+    ''',
+    'comments': '''
+        WITH q AS (SELECT websearch_to_tsquery('english', %(query)s) AS query),
+        candidates AS (
+            SELECT cm.comment_id AS id, cm.search_vector
+            FROM comments cm, q
+            WHERE cm.search_vector @@ q.query
+            ORDER BY cm.published_at DESC NULLS LAST, cm.comment_id DESC
+            LIMIT %(candidates)s
+        ),
+        matches AS (
+            SELECT id, ts_rank_cd(search_vector, q.query) AS rank FROM candidates, q
+        ),
+        page AS (
+            SELECT id, rank FROM matches
+            WHERE %(after_rank)s IS NULL OR (rank, id) < (%(after_rank)s::real, %(after_id)s)
+            ORDER BY rank DESC, id DESC
+            LIMIT %(limit)s
+        )
+        SELECT p.id AS comment_id, p.rank, v.title AS video_title, cm.author_name, cm.published_at,
+               ts_headline('english', cm.comment_text, q.query,
+                           'MaxFragments=2, MaxWords=25, MinWords=8') AS snippet,
+               (SELECT COUNT(*) FROM candidates) AS candidates
+        FROM page p
+        JOIN comments cm ON cm.comment_id = p.id
+        JOIN videos v ON v.video_id = cm.video_id
+        CROSS JOIN q
+        ORDER BY p.rank DESC, p.id DESC
+    '''
+}
+
+# Returns one page of hits plus whether another page follows
+def search_page(kind, text, after=None, page_size=SEARCH_PAGE_SIZE):
     conn = get_db_connection()
     if not conn:
-        return False
-    
+        return None, False
+
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO comments (
-                comment_id, video_id, comment_text,
-                author_name, published_at
-            ) VALUES (%s, %s, %s, %s, %s)
-            ON CONFLICT (comment_id) DO NOTHING
-        ''', (
-            comment['comment_id'],
-            comment['video_id'],
-            comment['comment_text'],
-            comment['author_name'],
-            comment['published_at']
-        ))
-        conn.commit()
-        return True
+        df = pd.read_sql_query(SEARCH_QUERIES[kind], conn, params={
+            'query': text,
+            'candidates': SEARCH_MAX_CANDIDATES,
+            'after_rank': after[0] if after else None,
+            'after_id': after[1] if after else None,
+            'limit': page_size + 1
+        })
+        return df.head(page_size), len(df) > page_size
     except Exception as e:
-        st.error(f"Error storing comment data: {str(e)}")
-        return False
+        st.error(f"Error searching {kind}: {str(e)}")
+        return None, False
     finally:
         conn.close()
 
-def process_channel(channel_id, progress_text):
+def show_search(store):
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        text = st.text_input("Search", placeholder='e.g. python tutorial -beginner or "exact phrase"')
+    with col2:
+        kind = st.radio("In", ['videos', 'comments'], key='search-kind')
+    if not text.strip():
+        return
+
+    # Page start keys for Previous/Next; reset whenever the search changes
+    view = (text, kind)
+    if st.session_state.get('search_view') != view:
+        st.session_state['search_view'] = view
+        st.session_state['search_keys'] = [None]
+    page_keys = st.session_state['search_keys']
+
+    started = time.perf_counter()
+    df, has_next = store.search(kind, text.strip(), page_keys[-1])
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if df is None:
+        return
+    if df.empty:
+        st.info("No matches")
+        return
+
+    # The unindexed DuckDB search ranks every match
+    truncated = 'candidates' in df.columns and df['candidates'].iloc[0] >= SEARCH_MAX_CANDIDATES
+    df = df.drop(columns='candidates', errors='ignore')
+    st.dataframe(df, hide_index=True)
+    st.caption(f"Page {len(page_keys)} · {len(df)} results · {elapsed_ms:.0f} ms")
+    if truncated:
+        st.caption(f"Very common terms: only the {SEARCH_MAX_CANDIDATES:,} newest matches are ranked. "
+                   "Add words to narrow the search.")
+
+    col1, col2, _ = st.columns([1, 1, 4])
+    with col1:
+        if st.button("Previous", disabled=len(page_keys) == 1, key='search-prev'):
+            page_keys.pop()
+            st.rerun()
+    with col2:
+        if st.button("Next", disabled=not has_next, key='search-next'):
+            last = df.iloc[-1]
+            page_keys.append((float(last['rank']), last[df.columns[0]]))
+            st.rerun()
+
+# Streaming Exports
+def export_query(source):
+    # Whole tables by name, anything else is a trusted canned query
+    if source in BROWSER_TABLES:
+        return sql.SQL("SELECT {} FROM {}").format(
+            sql.SQL(', ').join(map(sql.Identifier, get_table_columns(source))),
+            sql.Identifier(source)
+        )
+    return sql.SQL(source.strip().rstrip(';'))
+
+def export_to_csv(conn, query, path, compress=False):
+    # COPY streams straight from the server into the file
+    opener = gzip.open if compress else open
+    cursor = conn.cursor()
+    copy = sql.SQL("COPY ({}) TO STDOUT WITH CSV HEADER").format(query)
+    with opener(path, 'wb') as fh:
+        cursor.copy_expert(copy.as_string(cursor), fh)
+    return cursor.rowcount
+
+# Postgres type OIDs mapped to Arrow types; anything else is written as text
+def arrow_type(type_code):
+    import pyarrow as pa
+    return {
+        16: pa.bool_(),
+        20: pa.int64(),
+        21: pa.int64(),
+        23: pa.int64(),
+        700: pa.float64(),
+        701: pa.float64(),
+        1700: pa.float64(),
+        1114: pa.timestamp('us'),
+        1184: pa.timestamp('us', tz='UTC'),
+        1009: pa.list_(pa.string()),
+        1015: pa.list_(pa.string())
+    }.get(type_code, pa.string())
+
+def arrow_value(value, type_):
+    import pyarrow as pa
+    if value is None:
+        return None
+    if pa.types.is_string(type_) and not isinstance(value, str):
+        return json.dumps(value, default=str) if isinstance(value, (dict, list)) else str(value)
+    if pa.types.is_floating(type_):
+        return float(value)
+    return value
+
+def export_to_parquet(conn, query, path, compress=False):
     try:
-        # Get channel data
-        progress_text.text(f"Fetching channel data for {channel_id}...")
-        channel_data = get_channel_stats(youtube, channel_id)
-        if not channel_data:
-            st.error(f"Could not fetch data for channel {channel_id}")
-            return False
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the pyarrow package")
 
-        # Store channel data
-        progress_text.text(f"Storing channel information...")
-        if not store_channel_data(channel_data):
-            st.error("Failed to store channel data")
-            return False
+    # A named cursor keeps only one chunk of rows in memory at a time
+    cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}")
+    cursor.itersize = EXPORT_CHUNK_ROWS
+    cursor.execute(query)
+    rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+    schema = pa.schema([(desc[0], arrow_type(desc[1])) for desc in cursor.description])
 
-        # Get video IDs from channel's upload playlist
-        progress_text.text(f"Fetching video list...")
-        video_ids = get_video_ids(youtube, channel_data['playlistId'])
-        if not video_ids:
-            st.warning("No videos found for this channel")
-            return True
+    total = 0
+    with pq.ParquetWriter(path, schema, compression='zstd' if compress else 'none') as writer:
+        while rows:
+            columns = {
+                field.name: [arrow_value(row[i], field.type) for row in rows]
+                for i, field in enumerate(schema)
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            total += len(rows)
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+    cursor.close()
+    return total
 
-        total_videos = len(video_ids)
-        progress_text.text(f"Processing {total_videos} videos...")
-
-        # Process each video
-        for i, video_id in enumerate(video_ids, 1):
-            # Get and store video details
-            video_data = get_video_details(youtube, video_id)
-            if video_data:
-                if store_video_data(video_data):
-                    # Get and store video comments
-                    comments = get_video_comments(youtube, video_id)
-                    for comment in comments:
-                        store_comment_data(comment)
-            
-            # Update progress message
-            progress_text.text(f"Processed {i}/{total_videos} videos...")
-
-        progress_text.text(f"Completed processing channel {channel_id}")
-        return True
-    except Exception as e:
-        st.error(f"Error processing channel: {str(e)}")
-        return False
+def run_export(source, fmt='csv', compress=False, path=None):
+    if path is None:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        name = source if source in BROWSER_TABLES else 'analysis'
+        extension = 'parquet' if fmt == 'parquet' else ('csv.gz' if compress else 'csv')
+        path = os.path.join(EXPORT_DIR, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Could not open a database connection for the export")
+    try:
+        query = export_query(source)
+        if fmt == 'parquet':
+            rows = export_to_parquet(conn, query, path, compress)
+        else:
+            rows = export_to_csv(conn, query, path, compress)
+        return {'path': path, 'rows': rows, 'bytes': os.path.getsize(path)}
+    finally:
+        conn.close()
+
+# Runs exports in the background and remembers their outcome for the UI
+class ExportManager:
+    def __init__(self, workers=EXPORT_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, source, fmt='csv', compress=False, label=None):
+        export_id = uuid.uuid4().hex[:8]
+        with self.lock:
+            self.jobs[export_id] = {
+                'id': export_id,
+                'label': label or source,
+                'format': fmt + (' (compressed)' if compress else ''),
+                'status': 'running',
+                'started': datetime.now()
+            }
+        self.pool.submit(self._run, export_id, source, fmt, compress)
+        return export_id
+
+    def _run(self, export_id, source, fmt, compress):
+        try:
+            result = run_export(source, fmt, compress)
+            update = dict(result, status='completed')
+        except Exception as e:
+            update = {'status': 'failed', 'error': str(e)}
+        with self.lock:
+            self.jobs[export_id].update(update)
+
+    def list(self):
+        with self.lock:
+            return sorted((dict(job) for job in self.jobs.values()),
+                          key=lambda job: job['started'], reverse=True)
 
-def execute_analysis_query(query):
+@st.cache_resource
+def get_export_manager():
+    return ExportManager()
+
+def show_export_controls(source, label, key):
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        fmt = st.selectbox("Format", ['csv', 'parquet'], key=f'export-format-{key}')
+    with col2:
+        compress = st.checkbox("Compress", key=f'export-compress-{key}')
+    with col3:
+        if st.button("Export to file", key=f'export-{key}'):
+            get_export_manager().submit(source, fmt, compress, label)
+            st.caption("Export started; it is listed under Exports below")
+
+# A finished export is only read into the page when its download is asked for,
+# so idle reruns never load export files into memory
+def show_exports():
+    jobs = get_export_manager().list()
+    if not jobs:
+        st.info("No exports yet")
+    for job in jobs:
+        if job['status'] == 'completed':
+            size_mb = job['bytes'] / (1024 * 1024)
+            st.caption(f"{job['label']} · {job['format']} · {job['rows']} rows · {size_mb:.1f} MB · {job['path']}")
+            if job['bytes'] > EXPORT_DOWNLOAD_MAX_BYTES:
+                continue
+            if st.button("Prepare download", key=f"prepare-{job['id']}"):
+                with open(job['path'], 'rb') as fh:
+                    st.download_button(
+                        "Download",
+                        fh,
+                        os.path.basename(job['path']),
+                        key=f"download-{job['id']}"
+                    )
+        elif job['status'] == 'failed':
+            st.caption(f"{job['label']} · export failed: {job['error']}")
+        else:
+            st.caption(f"{job['label']} · {job['format']} · exporting...")
+
+def execute_analysis_query(query, params=None):
     conn = get_db_connection()
     if not conn:
         return None
     
     try:
-        return pd.read_sql_query(query, conn)
+        return pd.read_sql_query(query, conn, params=params)
     except Exception as e:
         st.error(f"Error executing query: {str(e)}")
         return None
     finally:
         conn.close()
 
+ANALYSIS_QUESTIONS = [
+    "1. What are the names of all the videos and their corresponding channels?",
+    "2. Which channels have the most number of videos, and how many videos do they have?",
+    "3. What are the top 10 most viewed videos and their respective channels?",
+    "4. How many comments were made on each video, and what are their corresponding video names?",
+    "5. Which videos have the highest number of likes, and what are their corresponding channel names?",
+    "6. What is the total number of likes for each video, and what are their corresponding video names?",
+    "7. What is the total number of views for each channel, and what are their corresponding channel names?",
+    "8. What are the names of all the channels that have published videos in the year 2022?",
+    "9. What is the average duration of all videos in each channel, and what are their corresponding channel names?",
+    "10. Which videos have the highest number of comments, and what are their corresponding channel names?"
+]
+
 def get_analysis_query(question):
     queries = {
         "1. What are the names of all the videos and their corresponding channels?": """
@@ -417,19 +4873,16 @@ def get_analysis_query(question):
         """,
         
         "2. Which channels have the most number of videos, and how many videos do they have?": """
-            SELECT c.channel_name, COUNT(v.video_id) as video_count
-            FROM channels c
-            LEFT JOIN videos v ON c.channel_id = v.channel_id
-            GROUP BY c.channel_name
+            SELECT channel_name, video_count
+            FROM analytics_channel_totals
             ORDER BY video_count DESC;
         """,
         
         "3. What are the top 10 most viewed videos and their respective channels?": """
-            SELECT v.title AS video_name, c.channel_name, v.view_count
-            FROM videos v
-            JOIN channels c ON v.channel_id = c.channel_id
-            ORDER BY v.view_count DESC
-            LIMIT 10;
+            SELECT video_name, channel_name, value AS view_count
+            FROM analytics_top_videos
+            WHERE metric = 'view_count'
+            ORDER BY rank;
 
         """,
         
@@ -442,11 +4895,10 @@ def get_analysis_query(question):
         """,
         
         "5. Which videos have the highest number of likes, and what are their corresponding channel names?": """
-            SELECT v.title AS video_name, c.channel_name, v.like_count
-            FROM videos v
-            JOIN channels c ON v.channel_id = c.channel_id
-            ORDER BY v.like_count DESC
-            LIMIT 10;
+            SELECT video_name, channel_name, value AS like_count
+            FROM analytics_top_videos
+            WHERE metric = 'like_count'
+            ORDER BY rank;
 
         """,
         
@@ -459,70 +4911,142 @@ def get_analysis_query(question):
         """,
         
         "7. What is the total number of views for each channel, and what are their corresponding channel names?": """
-            SELECT c.channel_name, c.view_count as total_views
-            FROM channels c
-            ORDER BY c.view_count DESC;
+            SELECT channel_name, channel_view_count as total_views
+            FROM analytics_channel_totals
+            ORDER BY channel_view_count DESC;
         """,
         
         "8. What are the names of all the channels that have published videos in the year 2022?": """
-            WITH yearly_stats AS (
-                SELECT 
-                    c.channel_name,
-                    EXTRACT(YEAR FROM v.published_at) as publish_year,
-                    COUNT(*) as video_count,
-                    SUM(v.view_count) as total_views,
-                    array_agg(v.title) as video_titles
-                FROM channels c
-                JOIN videos v ON c.channel_id = v.channel_id
-                GROUP BY c.channel_name, EXTRACT(YEAR FROM v.published_at)
-            )
             SELECT 
                 channel_name as "Channel Name",
                 publish_year as "Year",
                 video_count as "Videos Published",
                 total_views as "Total Views",
                 video_titles as "Video Titles"
-            FROM yearly_stats
+            FROM analytics_channel_years
             ORDER BY publish_year DESC, video_count DESC;
         """,
         
         "9. What is the average duration of all videos in each channel, and what are their corresponding channel names?": """
-            SELECT 
-                c.channel_name,
-                AVG(
-                    EXTRACT(EPOCH FROM 
-                        INTERVAL '1 second' * (
-                            CAST(SPLIT_PART(v.duration, ':', 1) AS INTEGER) * 3600 +
-                            CAST(SPLIT_PART(v.duration, ':', 2) AS INTEGER) * 60 +
-                            CAST(SPLIT_PART(v.duration, ':', 3) AS INTEGER)
-                        )
-                    )
-                ) / 60 as avg_duration_minutes
-            FROM videos v
-            JOIN channels c ON v.channel_id = c.channel_id
-            GROUP BY c.channel_name
+            SELECT channel_name, avg_duration_minutes
+            FROM analytics_channel_totals
+            WHERE video_count > 0
             ORDER BY avg_duration_minutes DESC;
         """,
         
         "10. Which videos have the highest number of comments, and what are their corresponding channel names?": """
-            SELECT v.title AS video_name, c.channel_name, v.comment_count
-            FROM videos v
-            JOIN channels c ON v.channel_id = c.channel_id
-            ORDER BY v.comment_count DESC
-            LIMIT 10;
+            SELECT video_name, channel_name, value AS comment_count
+            FROM analytics_top_videos
+            WHERE metric = 'comment_count'
+            ORDER BY rank;
 
         """
     }
     return queries.get(question)
 
+def show_pool_stats():
+    try:
+        stats = get_db_pool().stats()
+    except psycopg2.Error:
+        return
+    with st.sidebar.expander("Database connection pool"):
+        st.json(stats)
+
+def show_cache_stats():
+    with st.sidebar.expander("API response cache"):
+        st.json(get_response_cache().stats())
+
+def show_startup_timings(schema_ms):
+    timings = f"Script loaded in {STARTUP_TIMINGS.get('module_load_ms', 0):.0f} ms"
+    if schema_ms is not None:
+        timings += f" · schema checked once in {schema_ms:.0f} ms"
+    st.sidebar.caption(timings)
+
+def show_api_key_stats():
+    with st.sidebar.expander("API keys"):
+        st.json(get_api_key_pool().stats())
+
+def format_eta(seconds):
+    if seconds is None:
+        return "—"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+def show_harvest_metrics():
+    metrics = get_harvest_metrics()
+    snapshot = metrics.snapshot()
+    progress = snapshot['progress']
+    if not progress:
+        st.info("No harvest has run in this process yet")
+        return
+
+    if progress['videos_total']:
+        st.progress(min(1.0, progress['videos_done'] / progress['videos_total']),
+                    text=f"{progress['videos_done']}/{progress['videos_total']} videos")
+    counters = snapshot['counters']
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Videos / s", progress['videos_per_second'])
+    col2.metric("ETA", format_eta(progress['eta_seconds']))
+    col3.metric("Quota units", sum(counters.get('youtube_api_quota_units_total', {}).values()))
+    col4.metric("Retries", sum(counters.get('youtube_api_retries_total', {}).values()))
+
+    # Where the time goes: API round trips, database writes or parsing
+    latency = snapshot['latency']
+    rows = []
+    for name, stage in [('youtube_api_request_seconds', 'API'),
+                        ('harvest_db_write_seconds', 'Database'),
+                        ('harvest_parse_seconds', 'Parsing')]:
+        for labels, stats in latency.get(name, {}).items():
+            rows.append({
+                'stage': stage,
+                'labels': labels,
+                'calls': stats['count'],
+                'total_seconds': round(stats['mean'] * stats['count'], 2),
+                'p50_seconds': stats['p50'],
+                'p95_seconds': stats['p95']
+            })
+    if rows:
+        st.dataframe(pd.DataFrame(rows).sort_values('total_seconds', ascending=False),
+                     hide_index=True)
+    # A stage with a long blocked time is waiting on the one after it
+    if snapshot['stages']:
+        st.dataframe(pd.DataFrame([
+            {'pipeline stage': stage, **stats} for stage, stats in snapshot['stages'].items()
+        ]), hide_index=True)
+    if progress['rows_per_second']:
+        st.caption("Rows written per second: " + ", ".join(
+            f"{table} {rate}" for table, rate in progress['rows_per_second'].items()
+        ))
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Prometheus metrics", metrics.to_prometheus(),
+                         file_name='harvest_metrics.prom', mime='text/plain')
+    col2.download_button("JSON metrics", json.dumps(snapshot, default=str),
+                         file_name='harvest_metrics.json', mime='application/json')
+
 def main():
     st.title("YouTube Data Harvester and Analytics")
-    # Create tables if they don't exist
-    create_tables()
+    store = get_store()
+    if store.name == 'postgres':
+        show_pool_stats()
+    show_cache_stats()
+    show_api_key_stats()
+    # Tables are created once per server process, not on every rerun
+    try:
+        schema_ms = ensure_schema(store.name)
+    except RuntimeError:
+        schema_ms = None
+    show_startup_timings(schema_ms)
 
     # Data Collection Section
     st.header("1. Data Collection")
     channel_id = st.text_input("Enter the Channel IDs here (comma-separated)")
+    incremental = st.checkbox(
+        "Only fetch videos published since the last harvest",
+        value=True,
+        help="Already stored videos get a statistics-only refresh once a week"
+    )
     
     if st.button("Collect and Store Data"):
         if not channel_id:
@@ -530,22 +5054,62 @@ def main():
             return
 
         channels = [ch.strip() for ch in channel_id.split(',') if ch.strip()]
-        progress_text = st.empty()
-        
-        for channel in channels:
-            progress_text.text(f"Starting to process channel {channel}...")
-            success = process_channel(channel, progress_text)
-            if success:
-                st.success(f"Successfully processed channel {channel}")
+        if store.name == 'postgres':
+            # Several channels become one work unit each, so any running
+            # worker process can pick them up
+            if len(channels) > 1:
+                job_id = submit_sharded_harvest(channels, {'incremental': incremental})
             else:
-                st.error(f"Failed to process channel {channel}")
-        
-        progress_text.empty()
+                job_id = submit_harvest_job(channels, {'incremental': incremental})
+            if job_id:
+                st.success(f"Submitted harvest job {job_id} for {len(channels)} channel(s)")
+        else:
+            # The embedded store has no job queue; harvest in this session
+            progress_text = st.empty()
+            results = harvest_channels(
+                channels, progress_text, incremental=incremental, store=store,
+                worker_initializer=streamlit_worker_initializer()
+            )
+            failed = [ch for ch, success in results.items() if not success]
+            if failed:
+                st.error(f"Harvest failed for: {', '.join(failed)}")
+            else:
+                st.success(f"Harvested {len(channels)} channel(s)")
+
+    # Jobs run on the background worker, so a rerun or refresh never loses progress
+    if store.name == 'postgres':
+        start_job_worker()
+        with st.expander("Harvest jobs", expanded=True):
+            st.button("Refresh status", key='refresh-jobs')
+            jobs = list_harvest_jobs()
+            if jobs is not None and not jobs.empty:
+                st.dataframe(jobs)
+            else:
+                st.info("No harvest jobs submitted yet")
+
+        scheduler = start_refresh_scheduler() if REFRESH_SCHEDULER_ENABLED else None
+        with st.expander("Refresh schedule"):
+            if scheduler:
+                st.caption(f"Background refresh is on; {scheduler.remaining_budget():g} "
+                           f"of {scheduler.daily_quota} quota units left today")
+            else:
+                st.caption("Background refresh is off (REFRESH_SCHEDULER_ENABLED)")
+            # Scoring every stored video is too slow to repeat on each rerun
+            if st.button("Show what would be refreshed next", key='plan-refresh'):
+                plan = (scheduler or RefreshScheduler(store=store)).plan()
+                if plan:
+                    st.dataframe(refresh_plan_frame(plan), hide_index=True)
+                else:
+                    st.info("Nothing is due for a refresh")
+
+    with st.expander("Harvest metrics"):
+        st.button("Refresh metrics", key='refresh-metrics')
+        show_harvest_metrics()
 
     # Data Viewing and Analysis Section
     st.header("2. Data Exploration and Analysis")
     
-    tab1, tab2 = st.tabs(["Basic Data View", "Advanced Analysis"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Basic Data View", "Advanced Analysis", "Trends", "Search"])
     
     with tab1:
         col1, col2 = st.columns([4, 1])
@@ -558,38 +5122,20 @@ def main():
         
         with col2:
             if st.button('🗑️ Delete', key='delete_basic', type='secondary'):
-                if delete_table_data(table_choice):
+                if store.delete_table(table_choice):
                     st.success(f"Successfully deleted all data from {table_choice}")
                     time.sleep(1)
                     st.rerun()
         
-        if table_choice:
-            conn = get_db_connection()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute(f"SELECT * FROM {table_choice} LIMIT 1000")
-                    data = cursor.fetchall()
-                    
-                    if data:
-                        columns = [desc[0] for desc in cursor.description]
-                        df = pd.DataFrame(data, columns=columns)
-                        st.dataframe(df)
-                        
-                        csv = df.to_csv(index=False)
-                        st.download_button(
-                            "Download Data",
-                            csv,
-                            f"{table_choice}_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                            "text/csv",
-                            key=f'download-{table_choice}'
-                        )
-                    else:
-                        st.info(f"No data available in {table_choice} table")
-                except Exception as e:
-                    st.error(f"Error viewing data: {str(e)}")
-                finally:
-                    conn.close()
+        if table_choice and store.name == 'postgres':
+            show_table_browser(table_choice)
+
+            with st.expander("Export full table"):
+                show_export_controls(table_choice, table_choice, 'table')
+        elif table_choice:
+            df = store.read_query(f"SELECT * FROM {table_choice} LIMIT {BROWSER_PAGE_SIZE}")
+            if df is not None:
+                st.dataframe(df)
     
     with tab2:
         col1, col2 = st.columns([4, 1])
@@ -599,43 +5145,27 @@ def main():
         
         with col2:
             if st.button('🗑️ Delete All', key='delete_advanced', type='secondary'):
-                if delete_all_data():
+                if store.delete_all():
                     st.success("Successfully deleted all data")
                     time.sleep(1)
                     st.rerun()
         
         analysis_question = st.selectbox(
             "Select your question",
-            [
-                "Select a question...",
-                "1. What are the names of all the videos and their corresponding channels?",
-                "2. Which channels have the most number of videos, and how many videos do they have?",
-                "3. What are the top 10 most viewed videos and their respective channels?",
-                "4. How many comments were made on each video, and what are their corresponding video names?",
-                "5. Which videos have the highest number of likes, and what are their corresponding channel names?",
-                "6. What is the total number of likes for each video, and what are their corresponding video names?",
-                "7. What is the total number of views for each channel, and what are their corresponding channel names?",
-                "8. What are the names of all the channels that have published videos in the year 2022?",
-                "9. What is the average duration of all videos in each channel, and what are their corresponding channel names?",
-                "10. Which videos have the highest number of comments, and what are their corresponding channel names?"
-            ]
+            ["Select a question..."] + ANALYSIS_QUESTIONS
         )
         
         if analysis_question != "Select a question...":
-            query = get_analysis_query(analysis_question)
+            query = store.analysis_query(analysis_question)
             if query:
-                df = execute_analysis_query(query)
+                df = store.read_query(query)
                 if df is not None and not df.empty:
                     st.dataframe(df)
-                    
-                    csv = df.to_csv(index=False)
-                    st.download_button(
-                        "Download Results",
-                        csv,
-                        f"youtube_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                        "text/csv",
-                        key='download-analysis'
-                    )
+
+                    if store.name == 'postgres':
+                        with st.expander("Export results"):
+                            label = f"question {analysis_question.split('.')[0]}"
+                            show_export_controls(query, label, 'analysis')
                     
                     numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns
                     if not numeric_cols.empty:
@@ -644,5 +5174,777 @@ def main():
                 else:
                     st.info("No data available for this analysis")
 
+    with tab3:
+        st.subheader("Statistics Over Time")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            entity = st.radio("Track", ['videos', 'channels'], horizontal=True)
+        with col2:
+            metric = st.selectbox("Metric", HISTORY_TABLES[entity][2])
+        with col3:
+            days = st.number_input("Window (days)", min_value=1, max_value=365, value=7)
+
+        end = datetime.now()
+        start = end - timedelta(days=int(days))
+        gainers = store.top_gainers(entity, metric, start, end)
+        if gainers is not None and not gainers.empty:
+            st.write(f"Top gainers by {metric.replace('_', ' ')}")
+            st.dataframe(gainers)
+        else:
+            st.info("No snapshots in this window yet; harvest the channels again to build up history")
+
+        entity_id = st.text_input("Channel or video ID to chart per day")
+        if entity_id:
+            series = store.stats_series(entity, entity_id.strip(), metric, start, end)
+            if series is not None and not series.empty:
+                st.line_chart(series.set_index('bucket')['value'])
+                st.dataframe(series)
+            else:
+                st.info("No snapshots for this ID in the window")
+
+    with tab4:
+        show_search(store)
+
+    # Listed once, below the tabs that start exports
+    if store.name == 'postgres':
+        with st.expander("Exports"):
+            st.button("Refresh exports", key='refresh-exports')
+            show_exports()
+
+# Headless CLI
+# Writes one JSON object per line to stdout for progress and summaries
+class JsonProgress:
+    def __init__(self, stream=sys.stdout, min_interval=1.0, **context):
+        self.stream = stream
+        self.min_interval = min_interval
+        self.context = context
+        self.last_update = 0
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(self.context)
+        record.update(fields)
+        self.stream.write(json.dumps(record, default=str) + '\n')
+        self.stream.flush()
+
+    def text(self, message):
+        now = time.monotonic()
+        if now - self.last_update >= self.min_interval:
+            self.last_update = now
+            self.emit('progress', message=message)
+
+    def empty(self):
+        pass
+
+def read_channel_ids(path):
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    try:
+        channel_ids = []
+        for line in stream:
+            line = line.split('#', 1)[0]
+            channel_ids.extend(ch.strip() for ch in line.split(',') if ch.strip())
+        # Keep input order but drop duplicates
+        return list(dict.fromkeys(channel_ids))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def run_cli_harvest(args):
+    channel_ids = read_channel_ids(args.file)
+    progress = JsonProgress()
+    if not channel_ids:
+        progress.emit('summary', channels=0, failed=0)
+        return 1
+    try:
+        store = get_store(args.store)
+    except RuntimeError as e:
+        st.error(str(e))
+        return 1
+    if not store.create_tables():
+        return 1
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    try:
+        pool = ApiKeyPool(args.api_key, args.rate, args.daily_quota)
+    except ValueError as e:
+        st.error(str(e))
+        return 1
+    key_count = len(pool.api_keys)
+    limiter = QuotaRateLimiter(args.rate * key_count, args.daily_quota * key_count)
+    executor = RequestExecutor(max_attempts=args.max_attempts)
+    engine_options = {
+        'client_factory': pool.client,
+        'executor': executor,
+        'store': store,
+        'max_workers': args.workers,
+        'limiter': limiter,
+        'incremental': args.incremental,
+        'max_comments': args.max_comments,
+        'include_replies': args.replies
+    }
+
+    started = time.monotonic()
+    failed = []
+    rows_written = {table: 0 for table in TABLE_ORDER}
+    for start in range(0, len(channel_ids), args.chunk_size):
+        chunk = channel_ids[start:start + args.chunk_size]
+        try:
+            writer = BulkWriter(flush_rows=args.flush_rows, store=store)
+        except RuntimeError as e:
+            st.error(str(e))
+            return 1
+
+        results = harvest_channels(chunk, progress, writer=writer, **engine_options)
+        failed.extend(channel_id for channel_id, success in results.items() if not success)
+        for table, count in writer.rows_written.items():
+            rows_written[table] += count
+
+        elapsed = time.monotonic() - started
+        progress.emit(
+            'stats',
+            channels_done=start + len(chunk),
+            channels_total=len(channel_ids),
+            failed=len(failed),
+            elapsed_seconds=round(elapsed, 2),
+            videos_per_second=round(rows_written['videos'] / elapsed, 2) if elapsed else 0.0,
+            api_calls=dict(limiter.calls),
+            quota_used=limiter.used,
+            api_keys=pool.stats(),
+            retries=executor.stats(),
+            stages=get_harvest_metrics().stages(),
+            latency=get_harvest_metrics().snapshot()['latency'],
+            rows_written=rows_written
+        )
+
+    progress.emit(
+        'summary',
+        channels=len(channel_ids),
+        failed=len(failed),
+        failed_channels=failed,
+        elapsed_seconds=round(time.monotonic() - started, 2),
+        api_calls=sum(limiter.calls.values()),
+        quota_used=limiter.used,
+        rows_written=rows_written
+    )
+    return 1 if failed else 0
+
+def run_cli_export(args):
+    if args.table not in BROWSER_TABLES:
+        st.error(f"Unknown table {args.table}")
+        return 1
+    started = time.monotonic()
+    result = run_export(args.table, args.format, args.compress, args.output)
+    result['elapsed_seconds'] = round(time.monotonic() - started, 2)
+    JsonProgress().emit('export', table=args.table, **result)
+    return 0
+
+def run_cli_worker(args):
+    if not create_tables():
+        return 1
+    worker_options = {'poll_seconds': args.poll, 'once': args.once, 'max_workers': args.workers}
+    if args.processes > 1:
+        # Each process serves its own metrics port, counting up from --metrics-port
+        processes = start_worker_processes(run_worker_process, [
+            (dict(DB_CONFIG), args.processes, worker_options, args.metrics_port and args.metrics_port + index)
+            for index in range(args.processes)
+        ])
+        for process in processes:
+            process.join()
+        return 1 if any(process.exitcode for process in processes) else 0
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    run_job_worker(**worker_options)
+    return 0
+
+def run_cli_shard(args):
+    channel_ids = read_channel_ids(args.file)
+    progress = JsonProgress()
+    if not channel_ids:
+        progress.emit('summary', channels=0, failed=0)
+        return 1
+    if not create_tables():
+        return 1
+    options = {
+        'incremental': args.incremental,
+        'max_comments': args.max_comments,
+        'include_replies': args.replies
+    }
+    job_id = submit_sharded_harvest(channel_ids, options, args.videos_per_unit)
+    if not job_id:
+        return 1
+    state = sharded_job_progress(job_id)
+    if state is None:
+        return 1
+    progress.emit('sharded', job_id=job_id, channels=len(channel_ids), units=state['units'])
+    if not args.wait:
+        return 0
+
+    started = time.monotonic()
+    while state['status'] == 'sharded':
+        time.sleep(args.poll)
+        state = sharded_job_progress(job_id)
+        if state is None:
+            return 1
+        progress.emit('stats', job_id=job_id, elapsed_seconds=round(time.monotonic() - started, 2),
+                      **{key: value for key, value in state.items() if key != 'results'})
+    failed = [channel_id for channel_id, success in state['results'].items() if not success]
+    progress.emit('summary', job_id=job_id, channels=len(channel_ids), failed=len(failed),
+                  failed_channels=failed, elapsed_seconds=round(time.monotonic() - started, 2))
+    return 1 if failed or state['status'] != 'completed' else 0
+
+def run_cli_schedule(args):
+    if not create_tables():
+        return 1
+    try:
+        pool = ApiKeyPool(args.api_key)
+    except ValueError as e:
+        st.error(str(e))
+        return 1
+    scheduler = RefreshScheduler(daily_quota=args.daily_quota, client_factory=pool.client)
+    progress = JsonProgress()
+    while True:
+        if args.dry_run:
+            plan = scheduler.plan()
+        else:
+            plan = scheduler.tick()
+        progress.emit(
+            'schedule',
+            dry_run=args.dry_run,
+            tasks=[{'kind': task['kind'], 'ids': len(task['ids']), 'quota_units': round(task['cost'], 1)}
+                   for task in plan],
+            remaining_quota=round(scheduler.remaining_budget(), 1)
+        )
+        if args.once or args.dry_run:
+            return 0
+        time.sleep(args.interval)
+
+# Times the pieces a cold process initializes on first use
+def run_cli_startup(args):
+    report = {
+        'module_load_ms': STARTUP_TIMINGS['module_load_ms'],
+        'loaded_at_startup': [
+            name for name in ('pandas', 'googleapiclient.discovery', 'httplib2', 'streamlit')
+            if name in sys.modules
+        ]
+    }
+    steps = [
+        ('pandas_import_ms', lambda: pd.DataFrame),
+        ('api_client_build_ms', lambda: build_api_client(API_KEYS[0])),
+        ('second_api_client_build_ms', lambda: build_api_client(API_KEYS[0])),
+        ('schema_bootstrap_ms', lambda: ensure_schema(args.store)),
+        ('cached_schema_bootstrap_ms', lambda: ensure_schema(args.store))
+    ]
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except RuntimeError as e:
+            st.error(str(e))
+            return 1
+        report[name] = round((time.perf_counter() - started) * 1000, 1)
+    JsonProgress().emit('startup', **report)
+    return 0
+
+# Offline Benchmarks
+# Deterministic synthetic channels in the shape of the API's responses.
+# Comments are not stored but built on request from their index.
+class SyntheticDataset:
+    def __init__(self, channels=5, videos=200, comments=20, seed=0):
+        rng = random.Random(seed)
+        self.comments_per_video = comments
+        self.channels = {}
+        self.videos = {}
+        for c in range(channels):
+            channel_id = f"UCbench{c:06d}"
+            video_ids = [f"bv{c:04d}_{v:06d}" for v in range(videos)]
+            self.channels[channel_id] = {
+                'id': channel_id,
+                'snippet': {'title': f"Benchmark channel {c}", 'description': "Synthetic channel " * 20},
+                'statistics': {
+                    'subscriberCount': str(rng.randint(0, 10 ** 7)),
+                    'viewCount': str(rng.randint(0, 10 ** 9)),
+                    'videoCount': str(videos)
+                },
+                'contentDetails': {'relatedPlaylists': {'uploads': 'UU' + channel_id[2:]}},
+                'video_ids': video_ids
+            }
+            for v, video_id in enumerate(video_ids):
+                # Uploads playlists list newest first
+                published = datetime.fromtimestamp(1.7e9 - v * 86400).strftime('%Y-%m-%dT%H:%M:%SZ')
+                self.videos[video_id] = {
+                    'id': video_id,
+                    'snippet': {
+                        'channelId': channel_id,
+                        'title': f"Synthetic video {v} of channel {c}",
+                        'description': "Lorem ipsum dolor sit amet " * rng.randint(1, 40),
+                        'tags': [f"tag{rng.randint(0, 50)}" for _ in range(rng.randint(0, 8))],
+                        'publishedAt': published
+                    },
+                    'statistics': {
+                        'viewCount': str(rng.randint(0, 10 ** 7)),
+                        'likeCount': str(rng.randint(0, 10 ** 5)),
+                        'favoriteCount': '0',
+                        'commentCount': str(comments)
+                    },
+                    'contentDetails': {
+                        'duration': f"PT{rng.randint(0, 2)}H{rng.randint(0, 59)}M{rng.randint(0, 59)}S",
+                        'definition': rng.choice(['hd', 'sd']),
+                        'caption': rng.choice(['true', 'false'])
+                    }
+                }
+
+    def comment(self, video_id, index):
+        return {
+            'id': f"{video_id}_c{index:06d}",
+            'snippet': {
+                'totalReplyCount': 0,
+                'topLevelComment': {'snippet': {
+                    'textDisplay': f"Synthetic comment {index} " * 3,
+                    'authorDisplayName': f"viewer{index % 997}",
+                    'publishedAt': self.videos[video_id]['snippet']['publishedAt']
+                }}
+            }
+        }
+
+# Stand-in for the discovery resource. Calls sleep for `latency` seconds (with
+# jitter) and fail with a 503 at `error_rate`, so retries get exercised too.
+class FakeYouTube:
+    def __init__(self, dataset, latency=0.0, error_rate=0.0, seed=0, sleep=time.sleep):
+        self.dataset = dataset
+        self.latency = latency
+        self.error_rate = error_rate
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __getattr__(self, resource_name):
+        if resource_name.startswith('_'):
+            raise AttributeError(resource_name)
+        handler = getattr(self, f"_{resource_name}")
+        return lambda: _FakeResource(self, handler)
+
+    def _call(self, handler, kwargs):
+        with self.lock:
+            delay = self.latency * (0.5 + self.rng.random())
+            failed = self.rng.random() < self.error_rate
+        if delay:
+            self.sleep(delay)
+        if failed:
+            content = json.dumps({'error': {'errors': [{'reason': 'backendError'}], 'message': 'Backend Error'}})
+            raise HttpError(httplib2.Response({'status': 503}), content.encode())
+        return handler(**kwargs)
+
+    def _channels(self, id, **kwargs):
+        channel = self.dataset.channels.get(id)
+        if not channel:
+            return {'items': []}
+        return {'items': [{k: v for k, v in channel.items() if k != 'video_ids'}]}
+
+    def _playlistItems(self, playlistId, maxResults=50, pageToken=None, **kwargs):
+        channel = self.dataset.channels.get('UC' + playlistId[2:])
+        video_ids = channel['video_ids'] if channel else []
+        start = int(pageToken or 0)
+        items = [
+            {'contentDetails': {
+                'videoId': video_id,
+                'videoPublishedAt': self.dataset.videos[video_id]['snippet']['publishedAt']
+            }}
+            for video_id in video_ids[start:start + maxResults]
+        ]
+        response = {'items': items}
+        if start + maxResults < len(video_ids):
+            response['nextPageToken'] = str(start + maxResults)
+        return response
+
+    def _videos(self, id, **kwargs):
+        return {'items': [self.dataset.videos[v] for v in id.split(',') if v in self.dataset.videos]}
+
+    def _commentThreads(self, videoId, maxResults=20, pageToken=None, **kwargs):
+        start = int(pageToken or 0)
+        end = min(start + maxResults, self.dataset.comments_per_video)
+        response = {'items': [self.dataset.comment(videoId, i) for i in range(start, end)]}
+        if end < self.dataset.comments_per_video:
+            response['nextPageToken'] = str(end)
+        return response
+
+    def _comments(self, parentId, **kwargs):
+        return {'items': []}
+
+class _FakeResource:
+    def __init__(self, api, handler):
+        self._api = api
+        self._handler = handler
+
+    def list(self, **kwargs):
+        return _FakeRequest(self._api, self._handler, kwargs)
+
+class _FakeRequest:
+    def __init__(self, api, handler, kwargs):
+        self._api = api
+        self._handler = handler
+        self._kwargs = kwargs
+
+    def execute(self, *args, **kwargs):
+        return self._api._call(self._handler, self._kwargs)
+
+# Points DB_CONFIG at a scratch database, creating it on first use. Must run
+# before the connection pool is created.
+def use_benchmark_database(database):
+    if database == DB_CONFIG['database']:
+        raise ValueError(f"Refusing to benchmark against the main database {database}")
+    conn = psycopg2.connect(**dict(DB_CONFIG, database='postgres'))
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+        if not cursor.fetchone():
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(database)))
+    finally:
+        conn.close()
+    DB_CONFIG['database'] = database
+
+def current_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def time_analysis_queries(store, repeat):
+    latencies = {}
+    for question in ANALYSIS_QUESTIONS:
+        query = store.analysis_query(question)
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            store.read_query(query)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        latencies[question.split('.')[0]] = round(timings[len(timings) // 2] * 1000, 2)
+    return latencies
+
+# Higher is better for throughput, lower is better for query latency
+def find_regressions(result, previous, tolerance=BENCHMARK_TOLERANCE):
+    regressions = []
+    for metric in ('videos_per_second', 'comments_per_second', 'db_rows_per_second'):
+        before, after = previous['results'].get(metric), result['results'].get(metric)
+        if before and after is not None and after < before * (1 - tolerance):
+            regressions.append({'metric': metric, 'previous': before, 'current': after})
+    for question, after in result['results']['query_ms'].items():
+        before = previous['results']['query_ms'].get(question)
+        if before and after > before * (1 + tolerance):
+            regressions.append({'metric': f"query_ms.{question}", 'previous': before, 'current': after})
+    return regressions
+
+def load_benchmark_results(path=BENCHMARK_RESULTS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as results_file:
+        return [json.loads(line) for line in results_file if line.strip()]
+
+def record_benchmark_result(result, path=BENCHMARK_RESULTS_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as results_file:
+        results_file.write(json.dumps(result, default=str) + '\n')
+
+# Fake failures come back instantly, so back off on the same scale
+def benchmark_executor(metrics=None):
+    return RequestExecutor(base_delay=0.01, max_delay=0.1,
+                           breaker=CircuitBreaker(reset_seconds=0.5), metrics=metrics)
+
+# Entry point of a spawned benchmark worker: drains the scratch database's
+# work units against its own copy of the fake API
+def run_benchmark_worker(db_config, params):
+    DB_CONFIG.update(db_config)
+    dataset = SyntheticDataset(params['channels'], params['videos'], params['comments'], params['seed'])
+    api = FakeYouTube(dataset, params['latency'], params['error_rate'], params['seed'])
+    run_job_worker(once=True, client_factory=lambda: api, max_workers=params['workers'],
+                   limiter=QuotaRateLimiter(10 ** 9, 10 ** 12), executor=benchmark_executor())
+
+# Sharded run: the units go through the queue and the worker processes. Each
+# process keeps its own metrics, so throughput is measured from the stored rows.
+def run_sharded_benchmark(params, store, dataset, api, progress):
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        conn.cursor().execute("DELETE FROM harvest_jobs")
+        conn.commit()
+    finally:
+        conn.close()
+
+    started = time.perf_counter()
+    job_id = submit_sharded_harvest(list(dataset.channels), {'max_comments': None},
+                                    params['videos_per_unit'], client_factory=lambda: api)
+    if not job_id:
+        return None
+    processes = start_worker_processes(run_benchmark_worker, [
+        (dict(DB_CONFIG), params) for _ in range(params['processes'])
+    ])
+    for process in processes:
+        process.join()
+    harvest_seconds = time.perf_counter() - started
+
+    state = sharded_job_progress(job_id)
+    counts = store.read_query(
+        "SELECT (SELECT COUNT(*) FROM videos) AS videos, (SELECT COUNT(*) FROM comments) AS comments"
+    ).iloc[0]
+    progress.emit('stats', job_id=job_id, **{key: value for key, value in state.items() if key != 'results'})
+    return {
+        'failed_channels': sum(1 for success in (state['results'] or {}).values() if not success),
+        'harvest_seconds': round(harvest_seconds, 3),
+        'videos_per_second': round(int(counts['videos']) / harvest_seconds, 1),
+        'comments_per_second': round(int(counts['comments']) / harvest_seconds, 1),
+        'db_rows_per_second': None,
+        'units': state['units'],
+        'rows_written': {'videos': int(counts['videos']), 'comments': int(counts['comments'])},
+        'query_ms': time_analysis_queries(store, params['repeat'])
+    }
+
+def run_benchmark(params, store, progress=None):
+    progress = progress or JsonProgress()
+    dataset = SyntheticDataset(params['channels'], params['videos'], params['comments'], params['seed'])
+    api = FakeYouTube(dataset, params['latency'], params['error_rate'], params['seed'])
+    if not store.create_tables() or not store.delete_all():
+        return None
+
+    result = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': current_revision(),
+        'params': params
+    }
+    if params.get('processes', 1) > 1:
+        result['results'] = run_sharded_benchmark(params, store, dataset, api, progress)
+        return result if result['results'] else None
+
+    metrics = HarvestMetrics()
+    executor = benchmark_executor(metrics)
+    started = time.perf_counter()
+    results = harvest_channels(
+        list(dataset.channels), progress,
+        client_factory=lambda: api,
+        max_workers=params['workers'],
+        limiter=QuotaRateLimiter(10 ** 9, 10 ** 12),
+        max_comments=None,
+        executor=executor,
+        metrics=metrics,
+        store=store
+    )
+    harvest_seconds = time.perf_counter() - started
+
+    snapshot = metrics.snapshot()
+    rows = {
+        labels.split('=', 1)[1]: count
+        for labels, count in snapshot['counters'].get('harvest_rows_written_total', {}).items()
+    }
+    db_seconds = sum(
+        stats['mean'] * stats['count']
+        for stats in snapshot['latency'].get('harvest_db_write_seconds', {}).values()
+    )
+    result['results'] = {
+        'failed_channels': sum(1 for success in results.values() if not success),
+        'harvest_seconds': round(harvest_seconds, 3),
+        'videos_per_second': round(rows.get('videos', 0) / harvest_seconds, 1),
+        'comments_per_second': round(rows.get('comments', 0) / harvest_seconds, 1),
+        'db_rows_per_second': round(sum(rows.values()) / db_seconds, 1) if db_seconds else None,
+        'api_calls': sum(snapshot['counters'].get('youtube_api_requests_total', {}).values()),
+        'retries': executor.retries,
+        'rows_written': rows,
+        'stages': snapshot['stages'],
+        'query_ms': time_analysis_queries(store, params['repeat'])
+    }
+    return result
+
+def run_cli_benchmark(args):
+    try:
+        if args.store == 'duckdb':
+            store = DuckDBStore(args.duckdb_path)
+        else:
+            use_benchmark_database(args.database)
+            store = get_store('postgres')
+    except (RuntimeError, ValueError, psycopg2.Error) as e:
+        st.error(f"Could not prepare benchmark database: {e}")
+        return 1
+
+    params = {
+        'store': args.store,
+        'channels': args.channels,
+        'videos': args.videos,
+        'comments': args.comments,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'workers': args.workers,
+        'repeat': args.repeat,
+        'seed': args.seed
+    }
+    # Single-process runs keep their parameters, and stay comparable with older runs
+    if args.processes > 1:
+        if args.store != 'postgres':
+            st.error("Sharded benchmarks need the Postgres work queue")
+            return 1
+        params.update(processes=args.processes, videos_per_unit=args.videos_per_unit)
+    progress = JsonProgress()
+    result = run_benchmark(params, store, progress)
+    if result is None:
+        return 1
+
+    # Only runs with identical parameters are comparable
+    previous = [r for r in load_benchmark_results(args.results) if r['params'] == params]
+    regressions = find_regressions(result, previous[-1], args.tolerance) if previous else []
+    result['regressions'] = regressions
+    if not args.no_record:
+        record_benchmark_result(result, args.results)
+    progress.emit('benchmark', **result)
+    return 1 if regressions and args.fail_on_regression else 0
+
+def run_cli_sync(args):
+    if args.source == args.target:
+        st.error("Source and target stores must differ")
+        return 1
+    try:
+        source, target = get_store(args.source), get_store(args.target)
+    except RuntimeError as e:
+        st.error(str(e))
+        return 1
+    started = time.monotonic()
+    copied = sync_stores(source, target, args.chunk_rows)
+    if copied is None:
+        return 1
+    JsonProgress().emit('sync', source=args.source, target=args.target, rows=copied,
+                        elapsed_seconds=round(time.monotonic() - started, 2))
+    return 0
+
+def run_cli_downsample(args):
+    try:
+        store = get_store(args.store)
+    except RuntimeError as e:
+        st.error(str(e))
+        return 1
+    if not store.create_tables():
+        return 1
+    deleted = store.downsample_history()
+    if deleted is None:
+        return 1
+    JsonProgress().emit('downsample', store=args.store, deleted=deleted)
+    return 0
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Headless YouTube harvester")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    harvest = commands.add_parser('harvest', help="Harvest channel IDs read from a file or stdin")
+    harvest.add_argument('file', nargs='?', default='-',
+                         help="File with channel IDs, one per line or comma-separated ('-' for stdin)")
+    harvest.add_argument('--workers', type=int, default=HARVEST_WORKERS)
+    harvest.add_argument('--store', choices=['postgres', 'duckdb'], default=STORAGE_BACKEND)
+    harvest.add_argument('--chunk-size', type=int, default=CLI_CHANNEL_CHUNK,
+                         help="Channels harvested per engine run")
+    harvest.add_argument('--incremental', action='store_true')
+    harvest.add_argument('--max-comments', type=int, default=MAX_COMMENTS_PER_VIDEO)
+    harvest.add_argument('--replies', action='store_true')
+    harvest.add_argument('--api-key', action='append',
+                         help="API key to add to the pool (repeatable, defaults to API_KEYS)")
+    harvest.add_argument('--rate', type=float, default=API_REQUESTS_PER_SECOND,
+                         help="API requests per second per key")
+    harvest.add_argument('--daily-quota', type=int, default=API_DAILY_QUOTA,
+                         help="Daily quota units per key")
+    harvest.add_argument('--max-attempts', type=int, default=API_RETRY_ATTEMPTS,
+                         help="Attempts per API request on transient errors")
+    harvest.add_argument('--flush-rows', type=int, default=BULK_FLUSH_ROWS)
+    harvest.add_argument('--metrics-port', type=int,
+                         help="Serve /metrics and /metrics.json on this port while running")
+    harvest.set_defaults(handler=run_cli_harvest)
+
+    export = commands.add_parser('export', help="Stream a full table to CSV or Parquet")
+    export.add_argument('table', choices=sorted(BROWSER_TABLES))
+    export.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    export.add_argument('--compress', action='store_true')
+    export.add_argument('--output', help="Output path (defaults to a timestamped file in exports/)")
+    export.set_defaults(handler=run_cli_export)
+
+    bench = commands.add_parser('bench', help="Benchmark a harvest against a fake API and synthetic channels")
+    bench.add_argument('--channels', type=int, default=5)
+    bench.add_argument('--videos', type=int, default=200, help="Videos per channel")
+    bench.add_argument('--comments', type=int, default=20, help="Comments per video")
+    bench.add_argument('--latency', type=float, default=0.0, help="Mean fake API latency in seconds")
+    bench.add_argument('--error-rate', type=float, default=0.0, help="Share of fake API calls failing with 503")
+    bench.add_argument('--workers', type=int, default=HARVEST_WORKERS)
+    bench.add_argument('--processes', type=int, default=1,
+                       help="Harvest through the work queue with this many worker processes")
+    bench.add_argument('--videos-per-unit', type=int, help="Split channels into video batches of this size")
+    bench.add_argument('--repeat', type=int, default=5, help="Runs per analysis query")
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--store', choices=['postgres', 'duckdb'], default=STORAGE_BACKEND)
+    bench.add_argument('--database', default=BENCHMARK_DATABASE,
+                       help="Scratch Postgres database, emptied before every run")
+    bench.add_argument('--duckdb-path', default=BENCHMARK_DUCKDB_PATH,
+                       help="Scratch DuckDB file used with --store duckdb")
+    bench.add_argument('--results', default=BENCHMARK_RESULTS_PATH)
+    bench.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE)
+    bench.add_argument('--no-record', action='store_true', help="Do not append this run to the results file")
+    bench.add_argument('--fail-on-regression', action='store_true')
+    bench.set_defaults(handler=run_cli_benchmark)
+
+    sync = commands.add_parser('sync', help="Copy all data from one storage backend into the other")
+    sync.add_argument('source', choices=['postgres', 'duckdb'])
+    sync.add_argument('target', choices=['postgres', 'duckdb'])
+    sync.add_argument('--chunk-rows', type=int, default=STORE_SYNC_CHUNK_ROWS)
+    sync.set_defaults(handler=run_cli_sync)
+
+    downsample = commands.add_parser('downsample', help="Thin out old statistics history snapshots")
+    downsample.add_argument('--store', choices=['postgres', 'duckdb'], default=STORAGE_BACKEND)
+    downsample.set_defaults(handler=run_cli_downsample)
+
+    shard = commands.add_parser('shard', help="Split a harvest into work units for the worker processes")
+    shard.add_argument('file', nargs='?', default='-',
+                       help="File with channel IDs, one per line or comma-separated ('-' for stdin)")
+    shard.add_argument('--videos-per-unit', type=int,
+                       help="List each channel now and split channels with more videos than this "
+                            f"into batches (e.g. {SHARD_VIDEOS_PER_UNIT}); one unit per channel otherwise")
+    shard.add_argument('--incremental', action='store_true')
+    shard.add_argument('--max-comments', type=int, default=MAX_COMMENTS_PER_VIDEO)
+    shard.add_argument('--replies', action='store_true')
+    shard.add_argument('--wait', action='store_true', help="Report progress until every unit has finished")
+    shard.add_argument('--poll', type=float, default=HARVEST_JOB_POLL_SECONDS)
+    shard.set_defaults(handler=run_cli_shard)
+
+    worker = commands.add_parser('worker', help="Run queued harvest jobs")
+    worker.add_argument('--processes', type=int, default=1,
+                        help="Worker processes to run on this machine, sharing its API quota")
+    worker.add_argument('--workers', type=int, default=HARVEST_WORKERS)
+    worker.add_argument('--poll', type=float, default=HARVEST_JOB_POLL_SECONDS)
+    worker.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    worker.add_argument('--metrics-port', type=int,
+                        help="Serve /metrics and /metrics.json on this port while running")
+    worker.set_defaults(handler=run_cli_worker)
+
+    schedule = commands.add_parser('schedule', help="Keep stored channels and videos fresh within a quota budget")
+    schedule.add_argument('--daily-quota', type=int, default=REFRESH_DAILY_QUOTA,
+                          help="Quota units the scheduler may spend per day")
+    schedule.add_argument('--interval', type=float, default=REFRESH_INTERVAL_SECONDS,
+                          help="Seconds between scheduling rounds")
+    schedule.add_argument('--api-key', action='append',
+                          help="API key to add to the pool (repeatable, defaults to API_KEYS)")
+    schedule.add_argument('--once', action='store_true', help="Run a single round and exit")
+    schedule.add_argument('--dry-run', action='store_true', help="Print the next round without running it")
+    schedule.set_defaults(handler=run_cli_schedule)
+
+    startup = commands.add_parser('startup', help="Report how long a cold process takes to initialize")
+    startup.add_argument('--store', choices=['postgres', 'duckdb'], default=STORAGE_BACKEND)
+    startup.set_defaults(handler=run_cli_startup)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    return args.handler(args)
+
+STARTUP_TIMINGS = {'module_load_ms': round((time.perf_counter() - STARTUP_STARTED) * 1000, 1)}
+
 if __name__ == "__main__":
-    main()
+    if 'streamlit' in sys.modules:
+        main()
+    else:
+        sys.exit(cli())
@@ -0,0 +1,64 @@
+import importlib.util
+import os
+import pathlib
+import sys
+
+import pytest
+
+APP_PATH = pathlib.Path(__file__).resolve().parent.parent / "YouTube Data Harvesting and Warehousing.py"
+
+
+# The app is a single script whose name has spaces, so it is loaded by path
+@pytest.fixture(scope='session')
+def app():
+    spec = importlib.util.spec_from_file_location('youtube_harvester_app', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Time that only moves when something sleeps or the test advances it
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+# Postgres-backed tests drop every table in the database they run against, so
+# they only run when TEST_POSTGRES_DATABASE names a scratch database
+@pytest.fixture
+def postgres(app, monkeypatch):
+    database = os.environ.get('TEST_POSTGRES_DATABASE')
+    if not database:
+        pytest.skip("TEST_POSTGRES_DATABASE is not set")
+    monkeypatch.setitem(app.DB_CONFIG, 'database', database)
+    app.get_db_pool.cache_clear()
+    app.HISTORY_PARTITIONS.clear()
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")
+    for table, in cursor.fetchall():
+        cursor.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE')
+    conn.commit()
+    conn.close()
+    assert app.create_tables()
+    yield app.PostgresStore()
+    app.get_db_pool().closeall()
+    app.get_db_pool.cache_clear()
+    app.HISTORY_PARTITIONS.clear()
@@ -0,0 +1,95 @@
+import json
+from urllib.parse import parse_qsl, urlsplit
+
+import httplib2
+import pytest
+
+from test_duckdb_store import Progress
+
+
+# httplib2 stand-in that answers the discovery client from FakeYouTube and
+# honours If-None-Match with a 304
+class FakeHttp:
+    def __init__(self, app, dataset, etag='"v1"'):
+        self.api = app.FakeYouTube(dataset)
+        self.etag = etag
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        parts = urlsplit(uri)
+        resource = parts.path.rstrip('/').split('/')[-1]
+        self.requests.append(resource)
+        if (headers or {}).get('if-none-match') == self.etag:
+            return httplib2.Response({'status': '304'}), b''
+        params = {k: v for k, v in parse_qsl(parts.query) if k not in ('key', 'alt', 'part')}
+        if 'maxResults' in params:
+            params['maxResults'] = int(params['maxResults'])
+        content = json.dumps(getattr(self.api, f"_{resource}")(**params)).encode()
+        return httplib2.Response({'status': '200', 'content-type': 'application/json', 'etag': self.etag}), content
+
+
+@pytest.fixture
+def cache(app, tmp_path, clock):
+    return app.ResponseCache(str(tmp_path / 'cache.sqlite'), clock=clock)
+
+
+def build_client(app, cache, http):
+    from googleapiclient.discovery import build_from_document
+    return lambda api_key: build_from_document(
+        app.youtube_discovery_document(), developerKey=api_key, http=app.CachingHttp(cache, http)
+    )
+
+
+def test_cache_serves_fresh_entries_and_revalidates_stale_ones(app, cache, clock):
+    dataset = app.SyntheticDataset(channels=1, videos=1)
+    channel_id = next(iter(dataset.channels))
+    http = FakeHttp(app, dataset)
+    client = build_client(app, cache, http)('key-a')
+
+    first = client.channels().list(part='statistics', id=channel_id).execute()
+    second = client.channels().list(part='statistics', id=channel_id).execute()
+    assert first == second
+    assert http.requests == ['channels']
+    assert cache.stats()['hits'] == 1
+
+    # Past the TTL the entry is revalidated with its ETag, and a 304 keeps it
+    clock.advance(app.API_CACHE_TTL_SECONDS['channels'] + 1)
+    assert client.channels().list(part='statistics', id=channel_id).execute() == first
+    assert http.requests == ['channels', 'channels']
+    assert cache.stats()['revalidated'] == 1
+
+
+def test_cache_is_shared_by_every_key(app, cache):
+    dataset = app.SyntheticDataset(channels=1, videos=1)
+    channel_id = next(iter(dataset.channels))
+    http = FakeHttp(app, dataset)
+    build = build_client(app, cache, http)
+
+    build('key-a').channels().list(part='statistics', id=channel_id).execute()
+    build('key-b').channels().list(part='statistics', id=channel_id).execute()
+    assert http.requests == ['channels']
+
+
+def test_cached_harvest_spends_no_quota(app, cache, tmp_path):
+    pytest.importorskip('duckdb')
+    store = app.DuckDBStore(str(tmp_path / 'warehouse.duckdb'))
+    assert store.create_tables()
+    dataset = app.SyntheticDataset(channels=2, videos=30, comments=3)
+    http = FakeHttp(app, dataset)
+    pool = app.ApiKeyPool(['key-a'], build_client=build_client(app, cache, http), shared_quota=False)
+    limiter = app.QuotaRateLimiter(10 ** 6, 10 ** 6)
+
+    def harvest():
+        return app.harvest_channels(
+            list(dataset.channels), Progress(), client_factory=pool.client, limiter=limiter,
+            metrics=app.HarvestMetrics(), store=store
+        )
+
+    assert all(harvest().values())
+    spent, key_spent, requests = limiter.used, pool.limiters['key-a'].used, len(http.requests)
+    assert spent > 0 and requests > 0
+
+    assert all(harvest().values())
+    assert limiter.used == spent
+    assert pool.limiters['key-a'].used == key_spent
+    assert len(http.requests) == requests
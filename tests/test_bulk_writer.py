@@ -0,0 +1,76 @@
+import pytest
+
+from test_duckdb_store import duckdb_store, table_count  # noqa: F401 (fixture)
+
+
+def channel(channel_id, name=None):
+    return {
+        'channelName': name or f"Channel {channel_id}",
+        'channelid': channel_id,
+        'subscribers': 1,
+        'views': 2,
+        'totalVideos': 3,
+        'playlistId': 'UU' + channel_id[2:],
+        'channel_description': ''
+    }
+
+
+def make_writer(app, store, **options):
+    options.setdefault('flush_interval', 3600)
+    return app.BulkWriter(store=store, metrics=app.HarvestMetrics(), **options)
+
+
+def test_writer_keeps_the_last_row_per_key_and_flushes_when_full(app, duckdb_store):
+    writer = make_writer(app, duckdb_store, flush_rows=3)
+    writer.add_channel(channel('UC1'))
+    writer.add_channel(channel('UC1', 'Renamed'))
+    assert writer.pending() == 1
+
+    writer.add_channel(channel('UC2'))
+    assert table_count(duckdb_store, 'channels') == 0
+    writer.add_channel(channel('UC3'))
+    assert writer.pending() == 0
+    assert table_count(duckdb_store, 'channels') == 3
+    names = duckdb_store.read_query("SELECT channel_name FROM channels WHERE channel_id = 'UC1'")
+    assert names['channel_name'].tolist() == ['Renamed']
+    assert writer.rows_written['channels'] == 3
+    writer.close()
+
+
+def test_callbacks_run_only_after_their_rows_commit(app, duckdb_store):
+    writer = make_writer(app, duckdb_store, flush_rows=100)
+    done = []
+    writer.add_channel(channel('UC1'))
+    writer.add_callback(lambda: done.append('UC1'))
+    assert done == []
+    assert writer.flush()
+    assert done == ['UC1']
+
+    def fail(cursor):
+        raise RuntimeError("database went away")
+
+    writer.before_commit = fail
+    writer.add_channel(channel('UC2'))
+    writer.add_callback(lambda: done.append('UC2'))
+    assert not writer.flush()
+    assert writer.failed_flushes == 1
+    assert table_count(duckdb_store, 'channels') == 1
+
+    # Rows after a failed flush still commit, but their callbacks would mark
+    # progress past the rows that were lost, so they are dropped
+    writer.before_commit = None
+    writer.add_channel(channel('UC3'))
+    writer.add_callback(lambda: done.append('UC3'))
+    assert writer.flush()
+    assert table_count(duckdb_store, 'channels') == 2
+    assert done == ['UC1']
+    writer.close()
+
+
+def test_writer_requires_a_connection(app):
+    class Unreachable:
+        def connect(self):
+            return None
+
+    with pytest.raises(RuntimeError):
+        app.BulkWriter(store=Unreachable(), metrics=app.HarvestMetrics())
@@ -0,0 +1,39 @@
+import json
+
+
+class Cursor:
+    def __init__(self, rowcount=1):
+        self.rowcount = rowcount
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append(params)
+
+
+def test_checkpoint_tracks_listing_and_pending_videos(app):
+    checkpoint = app.HarvestCheckpoint(1)
+    checkpoint.record_page('UC1', ['a', 'b'], 'page2')
+    assert checkpoint.channel('UC1')['stage'] == 'listing'
+
+    checkpoint.record_page('UC1', ['c'], None)
+    checkpoint.record_comment_cursor('UC1', 'a', 'cursor1')
+    checkpoint.video_done('UC1', 'b')
+    assert checkpoint.channel('UC1')['stage'] == 'videos'
+    assert checkpoint.pending_videos('UC1') == ['a', 'c']
+    assert checkpoint.comment_cursor('UC1', 'a') == 'cursor1'
+
+    checkpoint.video_done('UC1', 'a')
+    assert checkpoint.comment_cursor('UC1', 'a') is None
+
+
+def test_checkpoint_resumes_from_saved_state(app):
+    checkpoint = app.HarvestCheckpoint(1)
+    checkpoint.record_page('UC1', ['a', 'b', 'c'], None)
+    checkpoint.video_done('UC1', 'a')
+    cursor = Cursor()
+    checkpoint.save(cursor)
+    snapshot, job_id, _ = cursor.executed[0]
+    assert job_id == 1
+
+    resumed = app.HarvestCheckpoint(1, json.loads(snapshot))
+    assert resumed.pending_videos('UC1') == ['b', 'c']
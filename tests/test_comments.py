@@ -0,0 +1,82 @@
+import json
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+# Records the page size of every commentThreads().list call
+class PagingYouTube:
+    def __init__(self, app, dataset):
+        self.api = app.FakeYouTube(dataset)
+        self.page_sizes = []
+
+    def commentThreads(self):
+        resource = self.api.commentThreads()
+        youtube = self
+
+        class Resource:
+            def list(self, **kwargs):
+                youtube.page_sizes.append(kwargs['maxResults'])
+                return resource.list(**kwargs)
+        return Resource()
+
+
+def first_video(dataset):
+    return next(iter(dataset.videos))
+
+
+def test_comments_are_paged_to_the_end(app):
+    dataset = app.SyntheticDataset(channels=1, videos=1, comments=250)
+    youtube = PagingYouTube(app, dataset)
+    cursors = []
+    frames = list(app.iter_comment_batches(youtube, first_video(dataset), max_comments=None,
+                                           include_replies=False, on_page=cursors.append))
+    assert [len(frame) for frame in frames] == [100, 100, 50]
+    assert cursors == ['100', '200', None]
+    comment_ids = [comment_id for frame in frames for comment_id in frame['comment_id']]
+    assert len(set(comment_ids)) == 250
+
+
+def test_comment_limit_shrinks_the_last_page(app):
+    dataset = app.SyntheticDataset(channels=1, videos=1, comments=250)
+    youtube = PagingYouTube(app, dataset)
+    frames = list(app.iter_comment_batches(youtube, first_video(dataset), max_comments=120,
+                                           include_replies=False))
+    assert sum(len(frame) for frame in frames) == 120
+    assert youtube.page_sizes == [100, 20]
+
+
+def test_comment_budget_is_shared_across_videos(app):
+    dataset = app.SyntheticDataset(channels=1, videos=2, comments=50)
+    youtube = PagingYouTube(app, dataset)
+    budget = app.CommentBudget(70)
+    counts = [
+        sum(len(frame) for frame in app.iter_comment_batches(
+            youtube, video_id, max_comments=None, include_replies=False, budget=budget))
+        for video_id in dataset.videos
+    ]
+    assert counts == [50, 20]
+    assert budget.remaining == 0
+
+
+def test_comments_resume_from_a_saved_cursor(app):
+    dataset = app.SyntheticDataset(channels=1, videos=1, comments=250)
+    frames = list(app.iter_comment_batches(PagingYouTube(app, dataset), first_video(dataset),
+                                           max_comments=None, include_replies=False,
+                                           page_token='200'))
+    assert sum(len(frame) for frame in frames) == 50
+
+
+def test_disabled_comments_yield_nothing(app):
+    class Disabled:
+        def commentThreads(self):
+            return self
+
+        def list(self, **kwargs):
+            return self
+
+        def execute(self):
+            content = json.dumps({'error': {'errors': [{'reason': 'commentsDisabled'}]}}).encode()
+            raise HttpError(httplib2.Response({'status': 403}), content)
+
+    assert list(app.iter_comment_batches(Disabled(), 'v1', max_comments=None)) == []
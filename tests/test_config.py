@@ -0,0 +1,75 @@
+import json
+import sys
+
+import pytest
+
+SETTINGS = {
+    'API_KEY': 'API',
+    'API_KEYS': ['API'],
+    'API_DAILY_QUOTA': 10000,
+    'API_REQUESTS_PER_SECOND': 5,
+    'API_SHARED_QUOTA': True,
+    'DB_CONFIG': {'host': 'localhost', 'port': '5432'},
+    'REFRESH_DAILY_QUOTA': None
+}
+
+
+def load(app, environ=None, config=None, tmp_path=None):
+    path = None
+    if config is not None:
+        path = tmp_path / 'harvester_config.json'
+        path.write_text(json.dumps(config))
+    return app.load_config(SETTINGS, path=str(path) if path else None, environ=environ or {})
+
+
+def test_environment_values_are_parsed_by_setting_type(app):
+    overrides = load(app, {
+        'HARVESTER_API_DAILY_QUOTA': '20000',
+        'HARVESTER_API_REQUESTS_PER_SECOND': '2.5',
+        'HARVESTER_API_SHARED_QUOTA': 'off',
+        'HARVESTER_API_KEYS': 'key-a, key-b',
+        'HARVESTER_DB_CONFIG': '{"host": "db"}',
+        'HARVESTER_REFRESH_DAILY_QUOTA': '500',
+        'PATH': '/usr/bin'
+    })
+    assert overrides == {
+        'API_DAILY_QUOTA': 20000,
+        'API_REQUESTS_PER_SECOND': 2.5,
+        'API_SHARED_QUOTA': False,
+        'API_KEYS': ['key-a', 'key-b'],
+        'DB_CONFIG': {'host': 'db', 'port': '5432'},
+        'REFRESH_DAILY_QUOTA': 500
+    }
+
+
+def test_environment_overrides_the_config_file(app, tmp_path):
+    overrides = load(app, {'HARVESTER_API_DAILY_QUOTA': '30000'},
+                     {'API_DAILY_QUOTA': 20000, 'API_KEY': 'file-key'}, tmp_path)
+    assert overrides['API_DAILY_QUOTA'] == 30000
+    # A single key stands in for the key list
+    assert overrides['API_KEYS'] == ['file-key']
+
+
+@pytest.mark.parametrize('environ, message', [
+    ({'HARVESTER_API_DAILY_QUOTE': '1'}, 'HARVESTER_API_DAILY_QUOTE'),
+    ({'HARVESTER_API_DAILY_QUOTA': 'lots'}, 'HARVESTER_API_DAILY_QUOTA'),
+    ({'HARVESTER_API_SHARED_QUOTA': 'maybe'}, 'HARVESTER_API_SHARED_QUOTA'),
+    ({'HARVESTER_DB_CONFIG': '{host: db}'}, 'HARVESTER_DB_CONFIG')
+])
+def test_bad_environment_settings_are_rejected(app, environ, message):
+    with pytest.raises(ValueError, match=message):
+        load(app, environ)
+
+
+def test_unknown_config_file_settings_are_rejected(app, tmp_path):
+    with pytest.raises(ValueError, match='API_DAILY_QUOTE'):
+        load(app, config={'API_DAILY_QUOTE': 1}, tmp_path=tmp_path)
+
+
+def test_lazy_modules_import_on_first_use(app):
+    name = 'colorsys'
+    sys.modules.pop(name, None)
+    module = app.LazyModule(name)
+    assert name not in sys.modules
+    assert module.rgb_to_hsv(1, 0, 0) == (0.0, 1.0, 1.0)
+    assert name in sys.modules
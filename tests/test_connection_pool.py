@@ -0,0 +1,85 @@
+import types
+
+import psycopg2
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, broken):
+        self.broken = broken
+        self.closed = 0
+        self.info = types.SimpleNamespace(transaction_status=TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+# Stands in for psycopg2.connect; hands out broken connections first
+@pytest.fixture
+def connections(monkeypatch):
+    made = []
+    broken = {'count': 0}
+
+    def connect(*args, **kwargs):
+        conn = FakeConnection(broken=len(made) < broken['count'])
+        made.append(conn)
+        return conn
+
+    monkeypatch.setattr(psycopg2, 'connect', connect)
+    return made, broken
+
+
+# psycopg2 keeps up to minconn idle connections and closes the rest on return
+def test_pool_reuses_idle_connections(app, connections):
+    made, _ = connections
+    pool = app.MonitoredConnectionPool(1, 2, timeout=1)
+    pool.checkin(pool.checkout())
+    pool.checkin(pool.checkout())
+    # Both checkouts get the connection opened with the pool
+    assert len(made) == 1
+    assert pool.stats()['checkouts'] == 2
+    assert pool.stats()['reused'] == 2
+
+
+def test_pool_replaces_connections_that_fail_the_health_check(app, connections):
+    made, broken = connections
+    broken['count'] = 2
+    pool = app.MonitoredConnectionPool(0, 2, timeout=1)
+    conn = pool.checkout()
+    assert not conn.broken
+    assert len(made) == 3
+    assert all(stale.closed for stale in made[:2])
+    assert pool.stats()['health_check_failures'] == 2
+
+
+def test_pool_gives_up_after_the_health_check_attempts(app, connections):
+    made, broken = connections
+    broken['count'] = 10
+    pool = app.MonitoredConnectionPool(0, 1, timeout=1, health_check_attempts=3)
+    with pytest.raises(PoolError):
+        pool.checkout()
+    assert len(made) == 3
+
+    # The slot is handed back, so the next checkout can still succeed
+    broken['count'] = 0
+    pool.checkin(pool.checkout())
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+
+class Progress:
+    def text(self, message):
+        pass
+
+    def empty(self):
+        pass
+
+
+# Counts which API resources a harvest asks for
+class CountingYouTube:
+    def __init__(self, app, dataset):
+        self.api = app.FakeYouTube(dataset)
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def __getattr__(self, resource_name):
+        with self.lock:
+            self.calls[resource_name] = self.calls.get(resource_name, 0) + 1
+        return getattr(self.api, resource_name)
+
+
+@pytest.fixture
+def duckdb_store(app, tmp_path):
+    pytest.importorskip('duckdb')
+    store = app.DuckDBStore(str(tmp_path / 'warehouse.duckdb'))
+    assert store.create_tables()
+    return store
+
+
+def harvest(app, store, api, **options):
+    return app.harvest_channels(
+        list(api.api.dataset.channels), Progress(), client_factory=lambda: api,
+        max_workers=4, limiter=app.QuotaRateLimiter(10 ** 6, 10 ** 9),
+        metrics=app.HarvestMetrics(), store=store, **options
+    )
+
+
+def table_count(store, table):
+    return int(store.read_query(f"SELECT COUNT(*) AS n FROM {table}")['n'][0])
+
+
+def test_duckdb_harvest_stores_channels_videos_and_comments(app, duckdb_store):
+    dataset = app.SyntheticDataset(channels=2, videos=60, comments=3)
+    results = harvest(app, duckdb_store, CountingYouTube(app, dataset), max_comments=None)
+
+    assert results == {channel_id: True for channel_id in dataset.channels}
+    assert table_count(duckdb_store, 'channels') == 2
+    assert table_count(duckdb_store, 'videos') == 120
+    assert table_count(duckdb_store, 'comments') == 360
+    durations = duckdb_store.read_query("SELECT duration FROM videos")['duration']
+    assert durations.between(0, 3 * 3600).all()
+
+
+def test_duckdb_incremental_harvest_skips_known_videos(app, duckdb_store):
+    dataset = app.SyntheticDataset(channels=1, videos=30, comments=1)
+    harvest(app, duckdb_store, CountingYouTube(app, dataset), incremental=True)
+    channel_id = next(iter(dataset.channels))
+    assert duckdb_store.get_sync_state(channel_id)['last_published_at'] is not None
+
+    again = CountingYouTube(app, dataset)
+    assert harvest(app, duckdb_store, again, incremental=True) == {channel_id: True}
+    assert 'commentThreads' not in again.calls
+    assert table_count(duckdb_store, 'videos') == 30
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from test_duckdb_store import CountingYouTube, harvest
+
+
+@pytest.fixture
+def warehouse(app, postgres):
+    dataset = app.SyntheticDataset(channels=2, videos=15, comments=2)
+    harvest(app, postgres, CountingYouTube(app, dataset), max_comments=None)
+    return dataset
+
+
+def test_arrow_values_follow_the_column_types(app):
+    pa = pytest.importorskip('pyarrow')
+    assert app.arrow_type(20) == pa.int64()
+    assert app.arrow_type(1009) == pa.list_(pa.string())
+    # Unknown types, e.g. tsvector, are written as text
+    assert app.arrow_type(3614) == pa.string()
+    assert app.arrow_value({'a': 1}, pa.string()) == '{"a": 1}'
+    assert app.arrow_value(7, pa.string()) == '7'
+    assert app.arrow_value(None, pa.int64()) is None
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_csv_export_streams_the_whole_table(app, warehouse, tmp_path, compress):
+    path = str(tmp_path / ('videos.csv.gz' if compress else 'videos.csv'))
+    result = app.run_export('videos', 'csv', compress, path)
+    assert result['rows'] == 30
+    exported = pd.read_csv(path)
+    assert len(exported) == 30
+    assert list(exported.columns) == app.get_table_columns('videos')
+
+
+def test_parquet_export_writes_every_chunk(app, warehouse, tmp_path, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_ROWS', 7)
+    path = str(tmp_path / 'comments.parquet')
+    assert app.run_export('comments', 'parquet', True, path)['rows'] == 60
+
+    # One row group per fetched chunk
+    assert pq.ParquetFile(path).num_row_groups == 9
+    table = pq.read_table(path)
+    assert table.num_rows == 60
+    assert len(set(table.column('comment_id').to_pylist())) == 60
+
+
+def test_export_manager_records_failures(app, postgres):
+    manager = app.ExportManager(workers=1)
+    export_id = manager.submit('SELECT * FROM no_such_table', label='broken')
+    manager.pool.shutdown(wait=True)
+    job = next(job for job in manager.list() if job['id'] == export_id)
+    assert job['status'] == 'failed'
+    assert 'no_such_table' in job['error']
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from test_duckdb_store import CountingYouTube, duckdb_store, harvest, table_count  # noqa: F401 (fixture)
+
+
+def check_history_dedup(app, store):
+    dataset = app.SyntheticDataset(channels=2, videos=10, comments=0)
+    harvest(app, store, CountingYouTube(app, dataset))
+    assert table_count(store, 'video_stats_history') == 20
+    assert table_count(store, 'channel_stats_history') == 2
+
+    # Unchanged counters add nothing
+    harvest(app, store, CountingYouTube(app, dataset))
+    assert table_count(store, 'video_stats_history') == 20
+
+    video_id = next(iter(dataset.videos))
+    views = int(dataset.videos[video_id]['statistics']['viewCount'])
+    dataset.videos[video_id]['statistics']['viewCount'] = str(views + 100)
+    harvest(app, store, CountingYouTube(app, dataset))
+    assert table_count(store, 'video_stats_history') == 21
+    series = store.read_query(
+        "SELECT view_count FROM video_stats_history WHERE video_id = %(video_id)s ORDER BY captured_at",
+        {'video_id': video_id}
+    )
+    assert series['view_count'].tolist() == [views, views + 100]
+
+
+def test_duckdb_history_only_appends_changed_counters(app, duckdb_store):
+    check_history_dedup(app, duckdb_store)
+
+
+def test_postgres_history_only_appends_changed_counters(app, postgres):
+    check_history_dedup(app, postgres)
+
+
+def test_history_partitions_are_created_once_per_month(app, postgres):
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    month = app.history_month(datetime.now() + timedelta(days=200))
+    app.ensure_history_partitions(conn, month)
+    cursor.execute("SELECT to_regclass(%s)", (f"video_stats_history_{month:%Y_%m}",))
+    assert cursor.fetchone()[0] is not None
+    assert month in app.HISTORY_PARTITIONS
+
+    # A month whose rows already sit in the DEFAULT partition cannot get its own;
+    # it is given up on instead of retried by every flush
+    later = app.history_month(month + timedelta(days=200))
+    cursor.execute("INSERT INTO video_stats_history VALUES ('v1', %s, 1, 1, 1)", (later,))
+    conn.commit()
+    app.ensure_history_partitions(conn, later)
+    assert later in app.HISTORY_PARTITIONS
+    cursor.execute("SELECT tableoid::regclass::text FROM video_stats_history WHERE video_id = 'v1'")
+    assert cursor.fetchone()[0] == 'video_stats_history_default'
+    conn.close()
+
+
+def test_flush_creates_partitions_on_its_own_connection(app, postgres):
+    app.HISTORY_PARTITIONS.clear()
+    writer = app.BulkWriter(store=postgres, metrics=app.HarvestMetrics())
+    checkouts = app.get_db_pool().stats()['checkouts']
+    writer.add_channel({
+        'channelName': 'Channel', 'channelid': 'UC1', 'subscribers': 1, 'views': 2,
+        'totalVideos': 0, 'playlistId': 'UU1', 'channel_description': ''
+    })
+    assert writer.flush()
+    assert app.get_db_pool().stats()['checkouts'] == checkouts
+    assert app.history_month(datetime.now()) in app.HISTORY_PARTITIONS
+    writer.close()
@@ -0,0 +1,105 @@
+import json
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+
+# Serves FakeYouTube, except that the keys in `rejections` fail every request
+# with the given status and reason
+class KeyedYouTube:
+    def __init__(self, app, dataset, rejections):
+        self.app = app
+        self.dataset = dataset
+        self.rejections = rejections
+        self.calls = []
+
+    def build(self, api_key):
+        return KeyClient(self, api_key)
+
+
+class KeyClient:
+    def __init__(self, service, api_key):
+        self.service = service
+        self.api_key = api_key
+        self.api = service.app.FakeYouTube(service.dataset)
+
+    def __getattr__(self, resource_name):
+        return lambda: KeyResource(self, getattr(self.api, resource_name)())
+
+
+class KeyResource:
+    def __init__(self, client, resource):
+        self.client = client
+        self.resource = resource
+
+    def list(self, **kwargs):
+        return KeyRequest(self.client, self.resource.list(**kwargs))
+
+
+class KeyRequest:
+    def __init__(self, client, request):
+        self.client = client
+        self.request = request
+
+    def execute(self):
+        service = self.client.service
+        service.calls.append(self.client.api_key)
+        if self.client.api_key in service.rejections:
+            status, reason = service.rejections[self.client.api_key]
+            content = json.dumps({'error': {'errors': [{'reason': reason}]}}).encode()
+            raise HttpError(httplib2.Response({'status': status}), content)
+        return self.request.execute()
+
+
+def make_pool(app, clock, service, api_keys=('key-a', 'key-b')):
+    return app.ApiKeyPool(list(api_keys), requests_per_second=1024, daily_quota=100,
+                          build_client=service.build, clock=clock, sleep=clock.sleep,
+                          shared_quota=False)
+
+
+def channel_request(client, dataset):
+    return client.channels().list(part='statistics', id=next(iter(dataset.channels)))
+
+
+def test_quota_error_fails_over_to_the_next_key(app, clock):
+    dataset = app.SyntheticDataset(channels=1, videos=1)
+    service = KeyedYouTube(app, dataset, {'key-a': (403, 'quotaExceeded')})
+    pool = make_pool(app, clock, service)
+    client = pool.client()
+
+    assert channel_request(client, dataset).execute()['items']
+    assert service.calls == ['key-a', 'key-b']
+    assert pool.failovers == 1
+    assert pool.limiters['key-a'].remaining() == 0
+
+    # The exhausted key is not tried again
+    channel_request(client, dataset).execute()
+    assert service.calls == ['key-a', 'key-b', 'key-b']
+
+
+def test_throttled_key_cools_down_while_others_serve(app, clock):
+    dataset = app.SyntheticDataset(channels=1, videos=1)
+    service = KeyedYouTube(app, dataset, {'key-a': (429, 'rateLimitExceeded')})
+    pool = make_pool(app, clock, service)
+
+    assert channel_request(pool.client(), dataset).execute()['items']
+    assert service.calls == ['key-a', 'key-b']
+    stats = {key['key']: key for key in pool.stats()['keys']}
+    assert stats[app.mask_api_key('key-a')]['cooling_down_seconds'] == app.API_KEY_BACKOFF_SECONDS
+    # Throttling costs no quota beyond the request that was sent
+    assert stats[app.mask_api_key('key-a')]['quota_remaining'] == 99
+
+
+def test_pool_raises_once_every_key_is_exhausted(app, clock):
+    dataset = app.SyntheticDataset(channels=1, videos=1)
+    service = KeyedYouTube(app, dataset, {
+        'key-a': (403, 'quotaExceeded'),
+        'key-b': (403, 'dailyLimitExceeded')
+    })
+    pool = make_pool(app, clock, service)
+
+    with pytest.raises(app.QuotaExceededError):
+        channel_request(pool.client(), dataset).execute()
+    assert service.calls == ['key-a', 'key-b']
+    assert pool.failovers == 2
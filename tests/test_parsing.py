@@ -0,0 +1,11 @@
+import pandas as pd
+
+
+def test_durations_to_seconds(app):
+    durations = pd.Series(['PT1H2M3S', 'P1DT1S', 'P1W', 'PT45.5S', 'PT0S', None, 'not a duration'])
+    assert app.durations_to_seconds(durations).tolist() == [3723, 86401, 604800, 45, 0, 0, 0]
+
+
+def test_durations_to_seconds_keeps_the_index(app):
+    durations = pd.Series(['PT1M', 'PT2M'], index=[7, 9])
+    assert app.durations_to_seconds(durations).to_dict() == {7: 60, 9: 120}
@@ -0,0 +1,35 @@
+import pytest
+
+
+def test_token_bucket_allows_a_burst_then_paces(app, clock):
+    bucket = app.TokenBucket(2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_token_bucket_refills_up_to_capacity(app, clock):
+    bucket = app.TokenBucket(4, capacity=5, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.acquire()
+    clock.advance(60)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.25)]
+
+
+def test_quota_limiter_stops_at_the_daily_quota_and_resets_next_day(app, clock):
+    limiter = app.QuotaRateLimiter(1000, 150, clock=clock, sleep=clock.sleep)
+    limiter.acquire(100, 'search.list')
+    with pytest.raises(app.QuotaExceededError):
+        limiter.acquire(100, 'search.list')
+    assert limiter.remaining() == 50
+    assert limiter.calls == {'search.list': 1}
+
+    clock.advance(86400)
+    assert limiter.remaining() == 150
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+def task(kind, value, cost, entity_id='x'):
+    return {'kind': kind, 'ids': [entity_id], 'value': value, 'cost': cost}
+
+
+# Planning
+
+def test_plan_refreshes_takes_the_best_value_per_unit_first(app):
+    tasks = [
+        task('video_stats', 10, 1, 'cheap'),
+        task('uploads', 300, 10, 'dear'),
+        task('video_stats', 50, 1, 'hot')
+    ]
+    plan = app.plan_refreshes(tasks, 100)
+    assert [t['ids'][0] for t in plan] == ['hot', 'dear', 'cheap']
+
+
+def test_plan_refreshes_skips_tasks_that_no_longer_fit(app):
+    tasks = [
+        task('uploads', 1000, 8, 'big'),
+        task('uploads', 400, 4, 'too-big'),
+        task('video_stats', 20, 1, 'small')
+    ]
+    plan = app.plan_refreshes(tasks, 10)
+    assert [t['ids'][0] for t in plan] == ['big', 'small']
+    assert app.plan_refreshes(tasks, 0.5) == []
+
+
+def test_refresh_tasks_skips_recent_refreshes_and_batches_videos(app):
+    channels = [
+        {'channel_id': 'UCfresh', 'uploads_checked_at': NOW - timedelta(minutes=5),
+         'stats_checked_at': NOW - timedelta(minutes=5), 'recent_uploads': 9, 'views_per_hour': 100},
+        {'channel_id': 'UCstale', 'uploads_checked_at': NOW - timedelta(hours=24),
+         'stats_checked_at': None, 'recent_uploads': 0, 'views_per_hour': None}
+    ]
+    videos = [
+        {'video_id': f"v{i}", 'checked_at': NOW - timedelta(hours=2), 'views_per_hour': i}
+        for i in range(app.VIDEO_BATCH_SIZE + 10)
+    ]
+    tasks = app.refresh_tasks(channels, videos, NOW)
+
+    uploads = [t for t in tasks if t['kind'] == 'uploads']
+    assert [t['ids'] for t in uploads] == [['UCstale']]
+    assert uploads[0]['cost'] == 2
+    assert uploads[0]['value'] == pytest.approx(24)
+
+    # Never refreshed counts as the maximum age
+    channel_stats = [t for t in tasks if t['kind'] == 'channel_stats']
+    assert channel_stats[0]['ids'] == ['UCstale']
+    assert channel_stats[0]['value'] == pytest.approx(app.REFRESH_MAX_AGE_HOURS)
+
+    video_stats = [t for t in tasks if t['kind'] == 'video_stats']
+    assert [len(t['ids']) for t in video_stats] == [app.VIDEO_BATCH_SIZE, 10]
+    assert video_stats[0]['ids'][0] == f"v{app.VIDEO_BATCH_SIZE + 9}"
+    assert all(t['cost'] == 1 for t in video_stats)
+
+
+# Scheduler rounds with a simulated clock
+
+@pytest.fixture
+def scheduler_class(app):
+    class Scheduler(app.RefreshScheduler):
+        def __init__(self, channels, videos, **kwargs):
+            super().__init__(**kwargs)
+            self.channels = channels
+            self.videos = videos
+            self.refreshed = []
+
+        def load_candidates(self, now):
+            return self.channels, self.videos
+
+        def mark_refreshed(self, kind, entity_ids, now):
+            rows, key = (self.videos, 'video_id') if kind == 'video_stats' else (self.channels, 'channel_id')
+            column = {'uploads': 'uploads_checked_at', 'channel_stats': 'stats_checked_at',
+                      'video_stats': 'checked_at'}[kind]
+            for row in rows:
+                if row[key] in entity_ids:
+                    row[column] = now
+            return True
+
+        def refresh_statistics(self, client, task):
+            self.refreshed.append(task)
+            return True
+
+    return Scheduler
+
+
+def test_scheduler_spends_its_daily_budget_and_resets_next_day(app, scheduler_class):
+    now = [NOW]
+    submitted = []
+    videos = [
+        {'video_id': f"v{i}", 'checked_at': None, 'views_per_hour': 10}
+        for i in range(app.VIDEO_BATCH_SIZE * 5)
+    ]
+    channels = [{'channel_id': 'UC1', 'uploads_checked_at': None, 'stats_checked_at': NOW,
+                 'recent_uploads': 3, 'views_per_hour': 0}]
+    scheduler = scheduler_class(
+        channels, videos, daily_quota=3, clock=lambda: now[0], client_factory=object,
+        submit_job=lambda channel_ids, options: submitted.append((channel_ids, options)) or 1,
+        store=object()
+    )
+
+    first = scheduler.tick()
+    assert [t['kind'] for t in first] == ['video_stats'] * 3
+    assert scheduler.remaining_budget() == 0
+    assert scheduler.tick() == []
+
+    # A new day brings a fresh budget. The uploads check (cost 8) does not
+    # fit, and the never-refreshed videos go before the day-old ones.
+    now[0] += timedelta(days=1)
+    second = scheduler.tick()
+    assert [t['kind'] for t in second] == ['video_stats'] * 3
+    assert submitted == []
+    first_ids = {video_id for t in first for video_id in t['ids']}
+    assert not first_ids & {video_id for t in second[:2] for video_id in t['ids']}
+    assert set(second[2]['ids']) <= first_ids
@@ -0,0 +1,34 @@
+import pytest
+
+
+def test_circuit_breaker_opens_after_threshold_and_probes_once(app, clock):
+    breaker = app.CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.wait_time() == 0
+
+    breaker.record_failure()
+    assert breaker.trips == 1
+    assert breaker.wait_time() == pytest.approx(10)
+
+    clock.advance(10)
+    assert breaker.wait_time() == 0
+    # Everyone else waits while the probe is out
+    assert breaker.wait_time() == 1
+
+
+def test_circuit_breaker_failed_probe_reopens_and_success_closes(app, clock):
+    breaker = app.CircuitBreaker(failure_threshold=1, reset_seconds=5, clock=clock)
+    breaker.record_failure()
+    clock.advance(5)
+    assert breaker.wait_time() == 0
+
+    breaker.record_failure()
+    assert breaker.trips == 2
+    assert breaker.wait_time() == pytest.approx(5)
+
+    clock.advance(5)
+    assert breaker.wait_time() == 0
+    breaker.record_success()
+    assert breaker.wait_time() == 0
+    assert breaker.failures == 0
@@ -0,0 +1,49 @@
+from test_duckdb_store import CountingYouTube, duckdb_store, harvest  # noqa: F401 (fixture)
+
+
+def search_all(store, kind, text):
+    pages = []
+    after = None
+    while True:
+        page, has_next = store.search(kind, text, after)
+        pages.append(page)
+        if not has_next:
+            return pages
+        key = 'video_id' if kind == 'videos' else 'comment_id'
+        # As the dashboard does: plain Python values, not numpy scalars
+        after = (float(page['rank'].iloc[-1]), page[key].iloc[-1])
+
+
+def check_paging(app, store):
+    pages = search_all(store, 'comments', 'synthetic')
+    assert [len(page) for page in pages] == [app.SEARCH_PAGE_SIZE, app.SEARCH_PAGE_SIZE, 10]
+    comment_ids = [comment_id for page in pages for comment_id in page['comment_id']]
+    assert len(set(comment_ids)) == 50
+
+
+def test_duckdb_search_pages_through_every_hit(app, duckdb_store):
+    dataset = app.SyntheticDataset(channels=1, videos=5, comments=10)
+    harvest(app, duckdb_store, CountingYouTube(app, dataset), max_comments=None)
+    check_paging(app, duckdb_store)
+
+
+def test_duckdb_search_ranks_titles_above_descriptions(app, duckdb_store):
+    dataset = app.SyntheticDataset(channels=1, videos=5, comments=1)
+    video_id = list(dataset.videos)[3]
+    dataset.videos[video_id]['snippet']['title'] = "Lorem in the title"
+    harvest(app, duckdb_store, CountingYouTube(app, dataset))
+
+    page, has_next = duckdb_store.search('videos', 'lorem')
+    assert len(page) == 5 and not has_next
+    assert page['video_id'].iloc[0] == video_id
+    assert page['rank'].iloc[0] > page['rank'].iloc[1]
+
+    # Every term has to match
+    page, _ = duckdb_store.search('videos', 'lorem title')
+    assert page['video_id'].tolist() == [video_id]
+
+
+def test_postgres_search_pages_through_every_hit(app, postgres):
+    dataset = app.SyntheticDataset(channels=1, videos=5, comments=10)
+    harvest(app, postgres, CountingYouTube(app, dataset), max_comments=None)
+    check_paging(app, postgres)
@@ -0,0 +1,83 @@
+import pytest
+
+
+class Cursor:
+    def __init__(self, rowcount=1):
+        self.rowcount = rowcount
+
+    def execute(self, query, params=None):
+        pass
+
+
+def test_checkpoint_save_fails_once_another_worker_claimed_the_job(app):
+    checkpoint = app.HarvestCheckpoint(1, claim_token='old')
+    with pytest.raises(app.LeaseLostError):
+        checkpoint.save(Cursor(rowcount=0))
+    assert checkpoint.lost
+
+
+# Stands in for api_quota_usage with a fixed number of units left today
+class Ledger:
+    def __init__(self, units):
+        self.units = units
+
+    def reserve(self, day, units, daily_quota):
+        granted = min(units, self.units)
+        self.units -= granted
+        return granted
+
+    def exhaust(self, day, daily_quota):
+        self.units = 0
+
+
+def test_quota_limiter_spends_units_granted_by_the_shared_ledger(app, clock):
+    limiter = app.QuotaRateLimiter(1000, 100, clock=clock, sleep=clock.sleep, ledger=Ledger(3))
+    for _ in range(3):
+        limiter.acquire()
+    with pytest.raises(app.QuotaExceededError):
+        limiter.acquire()
+    # Another process spent the rest, so the key looks exhausted here too
+    assert limiter.remaining() == 0
+
+
+def test_without_a_batch_size_every_channel_is_one_unit(app):
+    options = {'incremental': False}
+    units, split_channels = app.plan_harvest_units(['UC1', 'UC2'], options)
+    assert units == [(['UC1'], options, {}), (['UC2'], options, {})]
+    assert split_channels == []
+
+
+def test_large_channels_are_split_into_video_batches(app):
+    dataset = app.SyntheticDataset(channels=2, videos=25)
+    large, small = dataset.channels
+    dataset.channels[small]['video_ids'] = dataset.channels[small]['video_ids'][:5]
+    units, split_channels = app.plan_harvest_units(
+        [large, small, 'UCmissing'], {}, videos_per_unit=10, client=app.FakeYouTube(dataset)
+    )
+
+    assert split_channels == [large]
+    batches = [unit for unit in units if unit[0] == [large]]
+    assert [len(checkpoint[large]['video_ids']) for _, _, checkpoint in batches] == [10, 10, 5]
+    assert all(options == {'video_batch': True} for _, options, _ in batches)
+    listed = [video_id for _, _, checkpoint in batches for video_id in checkpoint[large]['video_ids']]
+    assert listed == dataset.channels[large]['video_ids']
+
+    # A small channel skips listing its playlist again; a missing one is left
+    # to a unit, which reports it as failed
+    assert ([small], {}, app.shard_checkpoint(small, dataset.channels[small]['video_ids'])) in units
+    assert (['UCmissing'], {}, {}) in units
+
+
+def test_incremental_plans_list_only_new_videos(app, tmp_path):
+    pytest.importorskip('duckdb')
+    store = app.DuckDBStore(str(tmp_path / 'warehouse.duckdb'))
+    assert store.create_tables()
+    dataset = app.SyntheticDataset(channels=1, videos=25)
+    channel_id = next(iter(dataset.channels))
+    video_ids = dataset.channels[channel_id]['video_ids']
+    watermark = dataset.videos[video_ids[12]]['snippet']['publishedAt']
+    store.store_sync_state(channel_id, watermark, False)
+
+    units, _ = app.plan_harvest_units([channel_id], {'incremental': True}, videos_per_unit=100,
+                                      client=app.FakeYouTube(dataset), store=store)
+    assert units[0][2][channel_id]['video_ids'] == video_ids[:12]
@@ -0,0 +1,43 @@
+def add_channels(app, store, count):
+    with app.BulkWriter(store=store, refresh_summaries=False, metrics=app.HarvestMetrics()) as writer:
+        for i in range(count):
+            writer.add_channel({
+                'channelName': f"Channel {i}",
+                'channelid': f"UC{i:03d}",
+                'subscribers': i,
+                'views': i,
+                'totalVideos': 0,
+                'playlistId': f"UU{i:03d}",
+                'channel_description': 'x' * 500
+            })
+
+
+def test_browser_pages_by_key(app, postgres):
+    add_channels(app, postgres, 250)
+    pages = []
+    after_key = None
+    while True:
+        page, has_next = app.fetch_table_page('channels', ['channel_id', 'channel_name'],
+                                              after_key, page_size=100)
+        pages.append(page)
+        if not has_next:
+            break
+        after_key = page['channel_id'].iloc[-1]
+
+    assert [len(page) for page in pages] == [100, 100, 50]
+    keys = [key for page in pages for key in page['channel_id']]
+    assert keys == sorted(f"UC{i:03d}" for i in range(250))
+
+
+def test_browser_previews_large_text_and_filters(app, postgres):
+    add_channels(app, postgres, 20)
+    page, has_next = app.fetch_table_page('channels', ['channel_id', 'description'],
+                                          filter_column='channel_name', filter_value='Channel 1')
+    # Channel 1 and Channel 10 to 19
+    assert len(page) == 11 and not has_next
+    assert page['description'].str.len().max() == app.BROWSER_TEXT_PREVIEW
+    assert len(app.fetch_full_text('channels', 'description', 'UC001')) == 500
+
+    page, _ = app.fetch_table_page('channels', ['channel_id'], filter_column='channel_id',
+                                   filter_value='UC001', match='equals')
+    assert page['channel_id'].tolist() == ['UC001']